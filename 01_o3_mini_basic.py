@@ -1,6 +1,14 @@
 import pygame
 import math
-import random
+import sys
+import argparse
+from profiling import FrameProfiler, add_profile_arguments
+from seeding import SpawnStreams, add_seed_argument
+from headless import add_headless_arguments, init_pygame
+from trajectory import TrajectoryWriter, add_trajectory_arguments
+from stream_options import add_stream_arguments, stream_from_args
+from soak import Population, add_soak_arguments
+from transform import Affine
 
 # 基本設定
 WIDTH = 800
@@ -8,24 +16,28 @@ HEIGHT = 600
 SQUARE_SIZE = 300
 BALL_RADIUS = 10
 ROTATION_SPEED = 0.5  # 度/秒
+BALL_SPEED = 5  # 各軸の速度の最大値（ピクセル/フレーム）
 
 # 色の定義
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
 
+# ボール生成用の乱数（--seed で固定できる）
+spawn_rng = SpawnStreams()
+
 class Ball:
     def __init__(self):
         # ボールの初期位置をランダムに設定
-        self.x = random.randint(BALL_RADIUS, SQUARE_SIZE - BALL_RADIUS)
-        self.y = random.randint(BALL_RADIUS, SQUARE_SIZE - BALL_RADIUS)
+        self.x = spawn_rng.position.randint(BALL_RADIUS, SQUARE_SIZE - BALL_RADIUS)
+        self.y = spawn_rng.position.randint(BALL_RADIUS, SQUARE_SIZE - BALL_RADIUS)
         # ランダムな速度を設定
-        self.dx = random.uniform(-5, 5)
-        self.dy = random.uniform(-5, 5)
+        self.dx = spawn_rng.velocity.uniform(-BALL_SPEED, BALL_SPEED)
+        self.dy = spawn_rng.velocity.uniform(-BALL_SPEED, BALL_SPEED)
         # ランダムな色を設定
         self.color = (
-            random.randint(50, 255),
-            random.randint(50, 255),
-            random.randint(50, 255)
+            spawn_rng.color.randint(50, 255),
+            spawn_rng.color.randint(50, 255),
+            spawn_rng.color.randint(50, 255)
         )
 
     def update(self):
@@ -39,8 +51,41 @@ class Ball:
         if self.y <= BALL_RADIUS or self.y >= SQUARE_SIZE - BALL_RADIUS:
             self.dy *= -1
 
-def main():
-    pygame.init()
+def draw_scene(screen, balls, angle):
+    """正方形とボールを描画（display.flipは呼び出し側で行う）"""
+    # 画面のクリア
+    screen.fill(BLACK)
+
+    # 回転の変換（正方形の中心を軸に回し、画面の中心へ移す）
+    half = SQUARE_SIZE / 2
+    transform = Affine.rotation(math.radians(angle), (WIDTH // 2, HEIGHT // 2), (half, half))
+
+    # 正方形の頂点を計算して描画
+    points = transform.points([(0, 0), (SQUARE_SIZE, 0), (SQUARE_SIZE, SQUARE_SIZE), (0, SQUARE_SIZE)])
+    pygame.draw.polygon(screen, WHITE, points, 2)
+
+    # ボールの描画（座標はまとめて回転させる）
+    positions = transform.to_screen([(ball.x, ball.y) for ball in balls]).tolist()
+    for ball, position in zip(balls, positions):
+        pygame.draw.circle(screen, ball.color, position, BALL_RADIUS)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="O3 Mini - Rotating Bouncing Balls")
+    add_profile_arguments(parser)
+    add_seed_argument(parser)
+    add_headless_arguments(parser)
+    add_trajectory_arguments(parser)
+    add_stream_arguments(parser)
+    add_soak_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    profiler = FrameProfiler.from_args(args)
+    spawn_rng.reseed(args.seed)
+
+    init_pygame(args.headless)
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
     pygame.display.set_caption("O3 Mini - Rotating Bouncing Balls")
     clock = pygame.time.Clock()
@@ -48,9 +93,15 @@ def main():
     balls = []
     last_spawn_time = 0
     angle = 0
+    frame_count = 0
+    trajectory = TrajectoryWriter.from_args(args, "01", sys.modules[__name__], balls=balls)
+    stream = stream_from_args(args, "01", sys.modules[__name__], balls=balls)
+    soak = Population.from_args(args, trajectory, stream)
 
     running = True
     while running:
+        if profiler:
+            profiler.tick(frame_count)
         current_time = pygame.time.get_ticks()
         
         for event in pygame.event.get():
@@ -59,7 +110,9 @@ def main():
 
         # 5秒ごとに新しいボールを追加
         if current_time - last_spawn_time > 5000:
-            balls.append(Ball())
+            if soak:
+                soak.make_room(balls)
+            balls.append(soak.recycle(Ball) if soak else Ball())
             last_spawn_time = current_time
 
         # 正方形の回転
@@ -67,42 +120,35 @@ def main():
         if angle >= 360:
             angle = 0
 
-        # 画面のクリア
-        screen.fill(BLACK)
-
-        # 回転行列の計算
-        rad = math.radians(angle)
-        cos_val = math.cos(rad)
-        sin_val = math.sin(rad)
-
-        # 正方形の中心座標
-        center_x = WIDTH // 2
-        center_y = HEIGHT // 2
-
-        # 正方形の頂点を計算
-        points = []
-        for x, y in [(-1, -1), (1, -1), (1, 1), (-1, 1)]:
-            rotated_x = x * SQUARE_SIZE/2 * cos_val - y * SQUARE_SIZE/2 * sin_val
-            rotated_y = x * SQUARE_SIZE/2 * sin_val + y * SQUARE_SIZE/2 * cos_val
-            points.append((center_x + rotated_x, center_y + rotated_y))
-
-        # 正方形を描画
-        pygame.draw.polygon(screen, WHITE, points, 2)
-
-        # ボールの更新と描画
+        # ボールの更新
         for ball in balls:
             ball.update()
-            # ボールの座標を回転させて描画
-            rotated_x = (ball.x - SQUARE_SIZE/2) * cos_val - (ball.y - SQUARE_SIZE/2) * sin_val
-            rotated_y = (ball.x - SQUARE_SIZE/2) * sin_val + (ball.y - SQUARE_SIZE/2) * cos_val
-            screen_x = center_x + rotated_x
-            screen_y = center_y + rotated_y
-            pygame.draw.circle(screen, ball.color, (int(screen_x), int(screen_y)), BALL_RADIUS)
+
+        if trajectory:
+            # 物理は1フレームごとに一定量進むので、時刻は進めたフレーム数から求める（60fps 相当）
+            trajectory.record(frame_count, (frame_count + 1) / 60, angle=angle)
+
+        draw_scene(screen, balls, angle)
 
         pygame.display.flip()
+        if stream:
+            stream.publish(frame_count, screen, angle=angle)
+        frame_count += 1
+        if args.max_frames and frame_count >= args.max_frames:
+            running = False
         clock.tick(60)
-
+        if soak:
+            soak.tick(balls, clock.get_time() / 1000)
+
+    if profiler:
+        profiler.close()
+    if trajectory:
+        trajectory.close()
+    if stream:
+        stream.close()
+    if soak:
+        soak.close()
     pygame.quit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(parse_args())
\ No newline at end of file
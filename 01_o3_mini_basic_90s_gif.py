@@ -1,7 +1,12 @@
 import pygame
 import math
-import random
-from PIL import Image
+import argparse
+from profiling import FrameProfiler, add_profile_arguments
+from seeding import SpawnStreams, add_seed_argument
+from headless import add_headless_arguments, init_pygame
+from recording import add_recording_arguments, create_recorder
+from governor import FULL_DETAIL, FrameGovernor, add_governor_arguments
+from transform import Affine
 
 # 基本設定
 WIDTH = 800
@@ -17,19 +22,22 @@ FRAME_SKIP = 2  # フレームスキップ（メモリ使用量削減用）
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
 
+# ボール生成用の乱数（--seed で固定できる）
+spawn_rng = SpawnStreams()
+
 class Ball:
     def __init__(self):
         # ボールの初期位置をランダムに設定
-        self.x = random.randint(BALL_RADIUS, SQUARE_SIZE - BALL_RADIUS)
-        self.y = random.randint(BALL_RADIUS, SQUARE_SIZE - BALL_RADIUS)
+        self.x = spawn_rng.position.randint(BALL_RADIUS, SQUARE_SIZE - BALL_RADIUS)
+        self.y = spawn_rng.position.randint(BALL_RADIUS, SQUARE_SIZE - BALL_RADIUS)
         # ランダムな速度を設定
-        self.dx = random.uniform(-5, 5)
-        self.dy = random.uniform(-5, 5)
+        self.dx = spawn_rng.velocity.uniform(-5, 5)
+        self.dy = spawn_rng.velocity.uniform(-5, 5)
         # ランダムな色を設定
         self.color = (
-            random.randint(50, 255),
-            random.randint(50, 255),
-            random.randint(50, 255)
+            spawn_rng.color.randint(50, 255),
+            spawn_rng.color.randint(50, 255),
+            spawn_rng.color.randint(50, 255)
         )
 
     def update(self):
@@ -43,13 +51,22 @@ class Ball:
         if self.y <= BALL_RADIUS or self.y >= SQUARE_SIZE - BALL_RADIUS:
             self.dy *= -1
 
-def surface_to_pil_image(surface):
-    """PyGame surfaceをPIL Imageに変換"""
-    image_string = pygame.image.tostring(surface, 'RGB')
-    return Image.frombytes('RGB', surface.get_size(), image_string)
-
-def main():
-    pygame.init()
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="O3 Mini - Rotating Bouncing Balls (90s GIF)")
+    add_profile_arguments(parser)
+    add_seed_argument(parser)
+    add_headless_arguments(parser, frame_limit=False)
+    add_recording_arguments(parser, 'o3_mini_rotating_balls_90s.gif', RECORD_DURATION)
+    add_governor_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    profiler = FrameProfiler.from_args(args)
+    spawn_rng.reseed(args.seed)
+
+    init_pygame(args.headless, font=True)
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
     pygame.display.set_caption("O3 Mini - Rotating Bouncing Balls (90s GIF)")
     clock = pygame.time.Clock()
@@ -57,16 +74,21 @@ def main():
     balls = []
     last_spawn_time = 0
     angle = 0
-    frames = []
-    total_frames = RECORD_DURATION * FPS
+    total_frames = int(args.duration * FPS)
+    recorder = create_recorder(args, FPS, FRAME_SKIP, total_frames)
+    governor = FrameGovernor.from_args(args, FPS)
     frame_count = 0
-    save_frame_count = 0
 
-    print(f"記録を開始します（{RECORD_DURATION}秒）...")
+    print(f"記録を開始します（{args.duration:g}秒）...")
 
     running = True
     while running and frame_count < total_frames:
-        current_time = pygame.time.get_ticks()
+        if profiler:
+            profiler.tick(frame_count)
+        if governor:
+            governor.begin()
+        # 全速力で記録する場合はフレーム数から経過時間を求める
+        current_time = frame_count * 1000 // FPS if args.unpaced else pygame.time.get_ticks()
         
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
@@ -82,70 +104,56 @@ def main():
         if angle >= 360:
             angle = 0
 
-        # 画面のクリア
-        screen.fill(BLACK)
+        # ボールの更新（描画を間引くフレームでも進める）
+        for ball in balls:
+            ball.update()
 
-        # 回転行列の計算
-        rad = math.radians(angle)
-        cos_val = math.cos(rad)
-        sin_val = math.sin(rad)
+        detail = governor.detail(frame_count) if governor else FULL_DETAIL
+        if detail.render:
+            # 画面のクリア
+            screen.fill(BLACK)
 
-        # 正方形の中心座標
-        center_x = WIDTH // 2
-        center_y = HEIGHT // 2
+            # 回転の変換（正方形の中心を軸に回し、画面の中心へ移す）
+            half = SQUARE_SIZE / 2
+            transform = Affine.rotation(math.radians(angle), (WIDTH // 2, HEIGHT // 2), (half, half))
 
-        # 正方形の頂点を計算
-        points = []
-        for x, y in [(-1, -1), (1, -1), (1, 1), (-1, 1)]:
-            rotated_x = x * SQUARE_SIZE/2 * cos_val - y * SQUARE_SIZE/2 * sin_val
-            rotated_y = x * SQUARE_SIZE/2 * sin_val + y * SQUARE_SIZE/2 * cos_val
-            points.append((center_x + rotated_x, center_y + rotated_y))
+            # 正方形の頂点を計算して描画
+            points = transform.points([(0, 0), (SQUARE_SIZE, 0), (SQUARE_SIZE, SQUARE_SIZE), (0, SQUARE_SIZE)])
+            pygame.draw.polygon(screen, WHITE, points, detail.outline(2))
 
-        # 正方形を描画
-        pygame.draw.polygon(screen, WHITE, points, 2)
+            # ボールの描画（座標はまとめて回転させる）
+            positions = transform.to_screen([(ball.x, ball.y) for ball in balls]).tolist()
+            for ball, position in zip(balls, positions):
+                pygame.draw.circle(screen, ball.color, position, BALL_RADIUS)
 
-        # ボールの更新と描画
-        for ball in balls:
-            ball.update()
-            # ボールの座標を回転させて描画
-            rotated_x = (ball.x - SQUARE_SIZE/2) * cos_val - (ball.y - SQUARE_SIZE/2) * sin_val
-            rotated_y = (ball.x - SQUARE_SIZE/2) * sin_val + (ball.y - SQUARE_SIZE/2) * cos_val
-            screen_x = center_x + rotated_x
-            screen_y = center_y + rotated_y
-            pygame.draw.circle(screen, ball.color, (int(screen_x), int(screen_y)), BALL_RADIUS)
-
-        # 残り時間を表示
-        font = pygame.font.Font(None, 36)
-        remaining_time = RECORD_DURATION - frame_count / FPS
-        time_text = f"残り: {remaining_time:.1f}秒"
-        text_surface = font.render(time_text, True, WHITE)
-        screen.blit(text_surface, (10, 10))
-
-        pygame.display.flip()
-        
-        # フレームを間引いてGIF用に保存
-        if frame_count % FRAME_SKIP == 0:
-            frames.append(surface_to_pil_image(screen))
-            save_frame_count += 1
-            if save_frame_count % 15 == 0:
-                print(f"記録中... {(frame_count / total_frames * 100):.1f}% 完了")
+            # 残り時間を表示
+            if detail.hud:
+                font = pygame.font.Font(None, 36)
+                remaining_time = args.duration - frame_count / FPS
+                time_text = f"残り: {remaining_time:.1f}秒"
+                text_surface = font.render(time_text, True, WHITE)
+                screen.blit(text_surface, (10, 10))
+
+            pygame.display.flip()
+
+            # フレームを間引いてGIF用に保存
+            recorder.capture(screen, frame_count, detail.capture_scale)
 
+        if governor:
+            governor.end(frame_count)
         frame_count += 1
-        clock.tick(FPS)
+        if not args.unpaced:
+            clock.tick(FPS)
 
     pygame.quit()
 
-    print("GIFを生成中...")
-    if frames:
-        frames[0].save(
-            'o3_mini_rotating_balls_90s.gif',
-            save_all=True,
-            append_images=frames[1:],
-            optimize=True,
-            duration=(1000 * FRAME_SKIP)//FPS,
-            loop=0
-        )
-        print("GIFを保存しました: o3_mini_rotating_balls_90s.gif")
+    recorder.save()
+
+    if governor:
+        governor.close()
+    if profiler:
+        profiler.close()
+    return recorder
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(parse_args())
\ No newline at end of file
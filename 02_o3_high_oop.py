@@ -1,9 +1,18 @@
 import pygame
 import math
-import random
+import sys
+import argparse
 import numpy as np
 from dataclasses import dataclass
 from typing import List, Tuple
+from profiling import FrameProfiler, add_profile_arguments
+from seeding import SpawnStreams, add_seed_argument
+from headless import add_headless_arguments, init_pygame
+from trajectory import TrajectoryWriter, add_trajectory_arguments
+from stream_options import add_stream_arguments, stream_from_args
+from soak import Population, add_soak_arguments
+from transform import Affine
+from checkpoint import CheckpointWriter, add_checkpoint_arguments, capture, load as load_checkpoint
 
 # 定数定義
 @dataclass
@@ -18,6 +27,9 @@ class Config:
     BALL_SPEED_MAX: float = 200.0
     SPAWN_INTERVAL: int = 5000  # ミリ秒
 
+# ボール生成用の乱数（--seed で固定できる）
+spawn_rng = SpawnStreams()
+
 # 色の定義
 class Colors:
     BLACK = (0, 0, 0)
@@ -26,9 +38,9 @@ class Colors:
     @staticmethod
     def random_bright_color() -> Tuple[int, int, int]:
         """明るいランダムな色を生成"""
-        hue = random.random()
-        saturation = random.uniform(0.5, 1.0)
-        value = random.uniform(0.8, 1.0)
+        hue = spawn_rng.color.random()
+        saturation = spawn_rng.color.uniform(0.5, 1.0)
+        value = spawn_rng.color.uniform(0.8, 1.0)
         
         # HSV から RGB への変換
         h = hue * 6
@@ -94,13 +106,13 @@ class Ball:
         # 正方形内のランダムな位置に配置
         margin = config.BALL_RADIUS * 2
         self.position = Vector2D(
-            random.uniform(margin, config.SQUARE_SIZE - margin),
-            random.uniform(margin, config.SQUARE_SIZE - margin)
+            spawn_rng.position.uniform(margin, config.SQUARE_SIZE - margin),
+            spawn_rng.position.uniform(margin, config.SQUARE_SIZE - margin)
         )
         
         # ランダムな方向と速度を設定
-        angle = random.uniform(0, 2 * math.pi)
-        speed = random.uniform(config.BALL_SPEED_MIN, config.BALL_SPEED_MAX)
+        angle = spawn_rng.velocity.uniform(0, 2 * math.pi)
+        speed = spawn_rng.velocity.uniform(config.BALL_SPEED_MIN, config.BALL_SPEED_MAX)
         self.velocity = Vector2D(
             math.cos(angle) * speed,
             math.sin(angle) * speed
@@ -108,6 +120,17 @@ class Ball:
         
         self.radius = config.BALL_RADIUS
         self.color = Colors.random_bright_color()
+
+    @classmethod
+    def restore(cls, config: Config, x: float, y: float, vx: float, vy: float,
+                color: Tuple[int, int, int]) -> 'Ball':
+        """保存した値からボールを復元（乱数は使わない）"""
+        ball = cls.__new__(cls)
+        ball.position = Vector2D(x, y)
+        ball.velocity = Vector2D(vx, vy)
+        ball.radius = config.BALL_RADIUS
+        ball.color = color
+        return ball
         
     def update(self, dt: float, config: Config):
         """ボールの位置を更新"""
@@ -143,33 +166,52 @@ class RotatingSquare:
         if self.angle >= 2 * math.pi:
             self.angle -= 2 * math.pi
             
+    def transform(self) -> Affine:
+        """ローカル座標（正方形の角が原点）からスクリーン座標への変換"""
+        half_size = self.size / 2
+        return Affine.rotation(self.angle, (self.center.x, self.center.y), (half_size, half_size))
+
     def get_corners(self) -> List[Tuple[float, float]]:
         """回転後の正方形の頂点座標を取得"""
-        half_size = self.size / 2
-        corners = []
-        for x, y in [(-1, -1), (1, -1), (1, 1), (-1, 1)]:
-            point = Vector2D(x * half_size, y * half_size).rotate(self.angle)
-            corners.append((
-                self.center.x + point.x,
-                self.center.y + point.y
-            ))
-        return corners
+        return self.transform().points([(0, 0), (self.size, 0), (self.size, self.size), (0, self.size)])
     
     def world_to_screen(self, position: Vector2D) -> Tuple[float, float]:
         """ローカル座標をスクリーン座標に変換"""
-        rotated = Vector2D(
-            position.x - self.size/2,
-            position.y - self.size/2
-        ).rotate(self.angle)
-        return (
-            self.center.x + rotated.x,
-            self.center.y + rotated.y
+        return self.transform().point(position.x, position.y)
+
+def draw_scene(surface: pygame.Surface, square: RotatingSquare, balls: List[Ball]):
+    """正方形とボールをサーフェスに描画"""
+    surface.fill(Colors.BLACK)
+    
+    # 正方形の描画
+    pygame.draw.polygon(
+        surface,
+        Colors.WHITE,
+        square.get_corners(),
+        2
+    )
+    
+    # ボールの描画（座標はまとめて変換する）
+    positions = square.transform().to_screen([(ball.position.x, ball.position.y) for ball in balls])
+    for ball, screen_pos in zip(balls, positions.tolist()):
+        pygame.draw.circle(
+            surface,
+            ball.color,
+            screen_pos,
+            ball.radius
         )
 
 class Game:
     """ゲームクラス"""
-    def __init__(self):
-        pygame.init()
+    def __init__(self, args=None):
+        if args is None:
+            args = parse_args([])
+        self.profiler = FrameProfiler.from_args(args)
+        self.max_frames = args.max_frames
+        self.fixed_dt = args.fixed_dt
+        spawn_rng.reseed(args.seed)
+
+        init_pygame(args.headless)
         self.config = Config()
         self.screen = pygame.display.set_mode((self.config.WIDTH, self.config.HEIGHT))
         pygame.display.set_caption("O3 High - Rotating Bouncing Balls")
@@ -178,7 +220,35 @@ class Game:
         self.balls: List[Ball] = []
         self.square = RotatingSquare(self.config)
         self.last_spawn_time = 0
+        self.time_ms = 0.0  # 経過時間（ミリ秒、dt の積算）
+        self.frame_count = 0
+        if args.restore:
+            self.restore(load_checkpoint(args.restore, "02"))
+        self.checkpoints = CheckpointWriter.from_args(args)
+        self.trajectory = TrajectoryWriter.from_args(args, "02", sys.modules[__name__],
+                                                     balls=self.balls, config=self.config,
+                                                     square=self.square)
+        self.stream = stream_from_args(args, "02", sys.modules[__name__],
+                                       balls=self.balls, config=self.config,
+                                       square=self.square)
+        self.soak = Population.from_args(args, self.trajectory, self.stream)
         
+    def restore(self, snapshot):
+        """チェックポイントの時点から再開（ボール・タイマー・角度・乱数・フレーム数）"""
+        self.balls[:] = [Ball.restore(self.config, *row)
+                         for row in snapshot.rows("position.x", "position.y", "velocity.x", "velocity.y")]
+        self.square.angle = snapshot.angle
+        self.last_spawn_time = snapshot.values["last_spawn_time"]
+        self.time_ms = snapshot.values["time_ms"]
+        self.frame_count = snapshot.frame
+        spawn_rng.setstate(snapshot.rng)
+
+    def snapshot(self):
+        """現在の状態をチェックポイントとして取り出す"""
+        return capture("02", self.balls, ("position.x", "position.y", "velocity.x", "velocity.y"),
+                       self.frame_count, self.square.angle, spawn_rng,
+                       last_spawn_time=self.last_spawn_time, time_ms=self.time_ms)
+
     def handle_events(self) -> bool:
         """イベント処理"""
         for event in pygame.event.get():
@@ -188,11 +258,15 @@ class Game:
     
     def update(self, dt: float):
         """ゲーム状態の更新"""
-        current_time = pygame.time.get_ticks()
+        # 時計ではなく dt の積算で測る（--fixed-dt で再開後も同じ時刻に生成するため）
+        self.time_ms += dt * 1000
+        current_time = self.time_ms
         
         # 新しいボールの生成
         if current_time - self.last_spawn_time > self.config.SPAWN_INTERVAL:
-            self.balls.append(Ball(self.config))
+            if self.soak:
+                self.soak.make_room(self.balls)
+            self.balls.append(self.soak.recycle(Ball, self.config) if self.soak else Ball(self.config))
             self.last_spawn_time = current_time
         
         # ボールの更新
@@ -201,43 +275,61 @@ class Game:
         
         # 正方形の回転
         self.square.update(dt, self.config.ROTATION_SPEED)
+        if self.soak:
+            self.soak.tick(self.balls, dt)
     
     def render(self):
         """描画処理"""
-        self.screen.fill(Colors.BLACK)
-        
-        # 正方形の描画
-        pygame.draw.polygon(
-            self.screen,
-            Colors.WHITE,
-            self.square.get_corners(),
-            2
-        )
-        
-        # ボールの描画
-        for ball in self.balls:
-            screen_pos = self.square.world_to_screen(ball.position)
-            pygame.draw.circle(
-                self.screen,
-                ball.color,
-                (int(screen_pos[0]), int(screen_pos[1])),
-                ball.radius
-            )
-        
+        draw_scene(self.screen, self.square, self.balls)
         pygame.display.flip()
     
     def run(self):
         """メインループ"""
         running = True
         while running:
+            if self.profiler:
+                self.profiler.tick(self.frame_count)
             dt = self.clock.tick(self.config.FPS) / 1000.0
+            if self.fixed_dt:
+                dt = self.fixed_dt
             
             running = self.handle_events()
             self.update(dt)
+            if self.trajectory:
+                # 時計ではなくシミュレーション上の時刻（dt の積算、チェックポイントで引き継ぐ）
+                self.trajectory.record(self.frame_count, self.time_ms / 1000)
             self.render()
+            if self.stream:
+                self.stream.publish(self.frame_count, self.screen)
+            self.frame_count += 1
+            if self.max_frames and self.frame_count >= self.max_frames:
+                running = False
+            if self.checkpoints and (self.checkpoints.due(self.frame_count) or not running):
+                self.checkpoints.submit(self.snapshot())
         
+        if self.profiler:
+            self.profiler.close()
+        if self.checkpoints:
+            self.checkpoints.close()
+        if self.trajectory:
+            self.trajectory.close()
+        if self.stream:
+            self.stream.close()
+        if self.soak:
+            self.soak.close()
         pygame.quit()
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="O3 High - Rotating Bouncing Balls")
+    add_profile_arguments(parser)
+    add_seed_argument(parser)
+    add_headless_arguments(parser)
+    add_trajectory_arguments(parser)
+    add_stream_arguments(parser)
+    add_soak_arguments(parser)
+    add_checkpoint_arguments(parser)
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    game = Game()
+    game = Game(parse_args())
     game.run()
\ No newline at end of file
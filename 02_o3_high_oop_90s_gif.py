@@ -1,10 +1,15 @@
 import pygame
 import math
-import random
+import argparse
 import numpy as np
 from dataclasses import dataclass
 from typing import List, Tuple
-from PIL import Image
+from profiling import FrameProfiler, add_profile_arguments
+from seeding import SpawnStreams, add_seed_argument
+from headless import add_headless_arguments, init_pygame
+from recording import add_recording_arguments, create_recorder
+from governor import FULL_DETAIL, Detail, FrameGovernor, add_governor_arguments
+from transform import Affine
 
 # 定数定義
 @dataclass
@@ -21,6 +26,9 @@ class Config:
     RECORD_DURATION: int = 90  # GIF記録時間（秒）
     FRAME_SKIP: int = 2  # フレームスキップ（メモリ使用量削減用）
 
+# ボール生成用の乱数（--seed で固定できる）
+spawn_rng = SpawnStreams()
+
 # 色の定義
 class Colors:
     BLACK = (0, 0, 0)
@@ -29,9 +37,9 @@ class Colors:
     @staticmethod
     def random_bright_color() -> Tuple[int, int, int]:
         """明るいランダムな色を生成"""
-        hue = random.random()
-        saturation = random.uniform(0.5, 1.0)
-        value = random.uniform(0.8, 1.0)
+        hue = spawn_rng.color.random()
+        saturation = spawn_rng.color.uniform(0.5, 1.0)
+        value = spawn_rng.color.uniform(0.8, 1.0)
         
         h = hue * 6
         f = h - int(h)
@@ -95,12 +103,12 @@ class Ball:
     def __init__(self, config: Config):
         margin = config.BALL_RADIUS * 2
         self.position = Vector2D(
-            random.uniform(margin, config.SQUARE_SIZE - margin),
-            random.uniform(margin, config.SQUARE_SIZE - margin)
+            spawn_rng.position.uniform(margin, config.SQUARE_SIZE - margin),
+            spawn_rng.position.uniform(margin, config.SQUARE_SIZE - margin)
         )
         
-        angle = random.uniform(0, 2 * math.pi)
-        speed = random.uniform(config.BALL_SPEED_MIN, config.BALL_SPEED_MAX)
+        angle = spawn_rng.velocity.uniform(0, 2 * math.pi)
+        speed = spawn_rng.velocity.uniform(config.BALL_SPEED_MIN, config.BALL_SPEED_MAX)
         self.velocity = Vector2D(
             math.cos(angle) * speed,
             math.sin(angle) * speed
@@ -128,16 +136,17 @@ class Ball:
             self.position.y = config.SQUARE_SIZE - margin
             self.velocity.y = -abs(self.velocity.y)
 
-def surface_to_pil_image(surface):
-    """PyGame surfaceをPIL Imageに変換"""
-    image_string = pygame.image.tostring(surface, 'RGB')
-    return Image.frombytes('RGB', surface.get_size(), image_string)
-
 class Game:
     """ゲームクラス"""
-    def __init__(self):
-        pygame.init()
-        self.config = Config()
+    def __init__(self, args=None):
+        if args is None:
+            args = parse_args([])
+        self.profiler = FrameProfiler.from_args(args)
+        spawn_rng.reseed(args.seed)
+        self.unpaced = args.unpaced
+
+        init_pygame(args.headless, font=True)
+        self.config = Config(RECORD_DURATION=args.duration)
         self.screen = pygame.display.set_mode((self.config.WIDTH, self.config.HEIGHT))
         pygame.display.set_caption("O3 High - Rotating Bouncing Balls (90s GIF)")
         
@@ -145,10 +154,11 @@ class Game:
         self.balls: List[Ball] = []
         self.last_spawn_time = 0
         self.angle = 0
-        self.frames = []
-        self.total_frames = self.config.RECORD_DURATION * self.config.FPS
+        self.total_frames = int(self.config.RECORD_DURATION * self.config.FPS)
+        self.recorder = create_recorder(args, self.config.FPS,
+                                        self.config.FRAME_SKIP, self.total_frames)
+        self.governor = FrameGovernor.from_args(args, self.config.FPS)
         self.frame_count = 0
-        self.save_frame_count = 0
         
     def handle_events(self) -> bool:
         """イベント処理"""
@@ -159,7 +169,11 @@ class Game:
     
     def update(self, dt: float):
         """ゲーム状態の更新"""
-        current_time = pygame.time.get_ticks()
+        if self.unpaced:
+            # 全速力で記録する場合はフレーム数から経過時間を求める
+            current_time = self.frame_count * 1000 // self.config.FPS
+        else:
+            current_time = pygame.time.get_ticks()
         
         if current_time - self.last_spawn_time > self.config.SPAWN_INTERVAL:
             self.balls.append(Ball(self.config))
@@ -170,77 +184,82 @@ class Game:
         
         self.angle += math.radians(self.config.ROTATION_SPEED)
     
-    def render(self):
-        """描画処理"""
+    def render(self, detail: Detail = FULL_DETAIL):
+        """描画処理（detail でガバナーが省く部分を指定する）"""
         self.screen.fill(Colors.BLACK)
         
+        # ローカル座標（正方形の角が原点）からスクリーン座標への変換
+        size = self.config.SQUARE_SIZE
+        half_size = size / 2
+        transform = Affine.rotation(self.angle, (self.config.WIDTH / 2, self.config.HEIGHT / 2),
+                                    (half_size, half_size))
+
         # 正方形の描画
-        center = Vector2D(self.config.WIDTH / 2, self.config.HEIGHT / 2)
-        half_size = self.config.SQUARE_SIZE / 2
-        corners = [
-            Vector2D(-half_size, -half_size),
-            Vector2D(half_size, -half_size),
-            Vector2D(half_size, half_size),
-            Vector2D(-half_size, half_size)
-        ]
-        
-        rotated_corners = [(center.x + c.rotate(self.angle).x, 
-                           center.y + c.rotate(self.angle).y) for c in corners]
+        corners = transform.points([(0, 0), (size, 0), (size, size), (0, size)])
+        pygame.draw.polygon(self.screen, Colors.WHITE, corners, detail.outline(2))
         
-        pygame.draw.polygon(self.screen, Colors.WHITE, rotated_corners, 2)
-        
-        # ボールの描画
-        for ball in self.balls:
-            pos = Vector2D(ball.position.x - half_size, ball.position.y - half_size)
-            rotated_pos = pos.rotate(self.angle)
-            screen_pos = (int(center.x + rotated_pos.x), 
-                         int(center.y + rotated_pos.y))
+        # ボールの描画（座標はまとめて変換する）
+        positions = transform.to_screen([(ball.position.x, ball.position.y) for ball in self.balls])
+        for ball, screen_pos in zip(self.balls, positions.tolist()):
             pygame.draw.circle(self.screen, ball.color, screen_pos, ball.radius)
 
         # 残り時間を表示
-        font = pygame.font.Font(None, 36)
-        remaining_time = self.config.RECORD_DURATION - self.frame_count / self.config.FPS
-        time_text = f"残り: {remaining_time:.1f}秒"
-        text_surface = font.render(time_text, True, Colors.WHITE)
-        self.screen.blit(text_surface, (10, 10))
+        if detail.hud:
+            font = pygame.font.Font(None, 36)
+            remaining_time = self.config.RECORD_DURATION - self.frame_count / self.config.FPS
+            time_text = f"残り: {remaining_time:.1f}秒"
+            text_surface = font.render(time_text, True, Colors.WHITE)
+            self.screen.blit(text_surface, (10, 10))
         
         pygame.display.flip()
     
     def run(self):
         """メインループ"""
-        print(f"記録を開始します（{self.config.RECORD_DURATION}秒）...")
+        print(f"記録を開始します（{self.config.RECORD_DURATION:g}秒）...")
         
         running = True
         while running and self.frame_count < self.total_frames:
-            dt = self.clock.tick(self.config.FPS) / 1000.0
+            if self.profiler:
+                self.profiler.tick(self.frame_count)
+            if self.unpaced:
+                dt = 1.0 / self.config.FPS
+            else:
+                dt = self.clock.tick(self.config.FPS) / 1000.0
+            if self.governor:
+                self.governor.begin()
             
             running = self.handle_events()
             self.update(dt)
-            self.render()
-            
-            # フレームを間引いてGIF用に保存
-            if self.frame_count % self.config.FRAME_SKIP == 0:
-                self.frames.append(surface_to_pil_image(self.screen))
-                self.save_frame_count += 1
-                if self.save_frame_count % 15 == 0:
-                    print(f"記録中... {(self.frame_count / self.total_frames * 100):.1f}% 完了")
+            detail = self.governor.detail(self.frame_count) if self.governor else FULL_DETAIL
+            if detail.render:
+                self.render(detail)
+                
+                # フレームを間引いてGIF用に保存
+                self.recorder.capture(self.screen, self.frame_count, detail.capture_scale)
             
+            if self.governor:
+                self.governor.end(self.frame_count)
             self.frame_count += 1
         
         pygame.quit()
         
-        print("GIFを生成中...")
-        if self.frames:
-            self.frames[0].save(
-                'o3_high_rotating_balls_90s.gif',
-                save_all=True,
-                append_images=self.frames[1:],
-                optimize=True,
-                duration=(1000 * self.config.FRAME_SKIP)//self.config.FPS,
-                loop=0
-            )
-            print("GIFを保存しました: o3_high_rotating_balls_90s.gif")
+        self.recorder.save()
+
+        if self.governor:
+            self.governor.close()
+        if self.profiler:
+            self.profiler.close()
+        return self.recorder
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="O3 High - Rotating Bouncing Balls (90s GIF)")
+    add_profile_arguments(parser)
+    add_seed_argument(parser)
+    add_headless_arguments(parser, frame_limit=False)
+    add_recording_arguments(parser, 'o3_high_rotating_balls_90s.gif', Config.RECORD_DURATION)
+    add_governor_arguments(parser)
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
-    game = Game()
+    game = Game(parse_args())
     game.run()
\ No newline at end of file
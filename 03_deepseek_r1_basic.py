@@ -1,14 +1,17 @@
 import pygame
-import random
 import math
-
-# Initialize Pygame
-pygame.init()
+import sys
+import argparse
+from profiling import FrameProfiler, add_profile_arguments
+from seeding import SpawnStreams, add_seed_argument
+from headless import add_headless_arguments, init_pygame
+from trajectory import TrajectoryWriter, add_trajectory_arguments
+from stream_options import add_stream_arguments, stream_from_args
+from soak import Population, add_soak_arguments
+from transform import Affine
 
 # Screen dimensions
 WIDTH, HEIGHT = 600, 600
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Rotating Square with Bouncing Balls")
 
 # Colors
 WHITE = (255, 255, 255)
@@ -22,20 +25,20 @@ square_rotation_speed = 0.5  # Degrees per frame
 
 # Ball properties
 ball_radius = 20
+ball_speed = 3  # Max speed per axis (pixels per frame)
 balls = []
 
+# Random streams for spawning balls (fixed with --seed)
+spawn_rng = SpawnStreams()
+
 # Clock
 clock = pygame.time.Clock()
-last_ball_time = pygame.time.get_ticks()
+last_ball_time = 0
 
-def rotate_point(cx, cy, x, y, angle):
-    """Rotate a point around a center point (cx, cy) by a given angle."""
-    angle_rad = math.radians(angle)
-    cos_a = math.cos(angle_rad)
-    sin_a = math.sin(angle_rad)
-    x_new = cx + (x - cx) * cos_a - (y - cy) * sin_a
-    y_new = cy + (x - cx) * sin_a + (y - cy) * cos_a
-    return x_new, y_new
+def square_transform():
+    """Transform that rotates screen points around the square's center by square_angle."""
+    center = square_rect.center
+    return Affine.rotation(math.radians(square_angle), center, center)
 
 def get_rotated_square_corners():
     """Get the corners of the rotated square."""
@@ -47,18 +50,21 @@ def get_rotated_square_corners():
         (cx + half_size, cy + half_size),
         (cx - half_size, cy + half_size)
     ]
-    return [rotate_point(cx, cy, x, y, square_angle) for x, y in corners]
+    return square_transform().points(corners)
 
 def is_point_in_rotated_square(x, y):
     """Check if a point is inside the rotated square."""
-    cx, cy = square_rect.center
-    x_rot, y_rot = rotate_point(cx, cy, x, y, -square_angle)
+    x_rot, y_rot = square_transform().inverse().point(x, y)
     return square_rect.collidepoint(x_rot, y_rot)
 
-def handle_collisions(ball):
-    """Handle collisions with the walls of the rotated square."""
-    cx, cy = square_rect.center
-    x_rot, y_rot = rotate_point(cx, cy, ball['x'], ball['y'], -square_angle)
+def handle_collisions(ball, to_square=None):
+    """Handle collisions with the walls of the rotated square.
+
+    to_square is the inverse of square_transform(); pass it to avoid rebuilding it per ball.
+    """
+    if to_square is None:
+        to_square = square_transform().inverse()
+    x_rot, y_rot = to_square.point(ball['x'], ball['y'])
 
     if x_rot - ball_radius < square_rect.left:
         ball['dx'] = abs(ball['dx'])
@@ -69,53 +75,122 @@ def handle_collisions(ball):
     elif y_rot + ball_radius > square_rect.bottom:
         ball['dy'] = -abs(ball['dy'])
 
-def add_ball():
-    """Add a new ball with a random color and velocity."""
-    color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
-    x = random.randint(square_rect.left + ball_radius, square_rect.right - ball_radius)
-    y = random.randint(square_rect.top + ball_radius, square_rect.bottom - ball_radius)
-    dx = random.uniform(-3, 3)
-    dy = random.uniform(-3, 3)
-    balls.append({'x': x, 'y': y, 'dx': dx, 'dy': dy, 'color': color})
-
-# Main loop
-running = True
-while running:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-
-    # Add a new ball every 5 seconds
-    current_time = pygame.time.get_ticks()
-    if current_time - last_ball_time > 5000:
-        add_ball()
-        last_ball_time = current_time
-
-    # Update ball positions
+def add_ball(ball=None):
+    """Add a new ball with a random color and velocity (reusing a retired ball dict if given)."""
+    color = (spawn_rng.color.randint(0, 255), spawn_rng.color.randint(0, 255),
+             spawn_rng.color.randint(0, 255))
+    x = spawn_rng.position.randint(square_rect.left + ball_radius, square_rect.right - ball_radius)
+    y = spawn_rng.position.randint(square_rect.top + ball_radius, square_rect.bottom - ball_radius)
+    dx = spawn_rng.velocity.uniform(-ball_speed, ball_speed)
+    dy = spawn_rng.velocity.uniform(-ball_speed, ball_speed)
+    if ball is None:
+        ball = {}
+    ball['x'], ball['y'], ball['dx'], ball['dy'], ball['color'] = x, y, dx, dy, color
+    balls.append(ball)
+
+def update_balls():
+    """Move every ball and bounce it off the walls of the rotated square."""
+    to_square = square_transform().inverse()  # same for every ball this frame
     for ball in balls:
         ball['x'] += ball['dx']
         ball['y'] += ball['dy']
-        handle_collisions(ball)
-
-    # Rotate the square
-    square_angle = (square_angle + square_rotation_speed) % 360
+        handle_collisions(ball, to_square)
 
+def draw_scene(surface):
+    """Draw the rotated square and the balls onto a surface."""
     # Clear the screen
-    screen.fill(WHITE)
+    surface.fill(WHITE)
 
     # Draw the rotated square
     corners = get_rotated_square_corners()
-    pygame.draw.polygon(screen, BLACK, corners, 2)
+    pygame.draw.polygon(surface, BLACK, corners, 2)
 
     # Draw the balls
     for ball in balls:
-        pygame.draw.circle(screen, ball['color'], (int(ball['x']), int(ball['y'])), ball_radius)
+        pygame.draw.circle(surface, ball['color'], (int(ball['x']), int(ball['y'])), ball_radius)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Rotating Square with Bouncing Balls")
+    add_profile_arguments(parser)
+    add_seed_argument(parser)
+    add_headless_arguments(parser)
+    add_trajectory_arguments(parser)
+    add_stream_arguments(parser)
+    add_soak_arguments(parser)
+    return parser.parse_args(argv)
+
+# Main loop
+def main(args=None):
+    global square_angle, last_ball_time
+    if args is None:
+        args = parse_args([])
+    profiler = FrameProfiler.from_args(args)
+    spawn_rng.reseed(args.seed)
+
+    # Initialize Pygame
+    init_pygame(args.headless)
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Rotating Square with Bouncing Balls")
+    last_ball_time = pygame.time.get_ticks()
+    frame_count = 0
+    trajectory = TrajectoryWriter.from_args(args, "03", sys.modules[__name__], balls=balls)
+    stream = stream_from_args(args, "03", sys.modules[__name__], balls=balls)
+    soak = Population.from_args(args, trajectory, stream)
+
+    running = True
+    while running:
+        if profiler:
+            profiler.tick(frame_count)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+
+        # Add a new ball every 5 seconds
+        current_time = pygame.time.get_ticks()
+        if current_time - last_ball_time > 5000:
+            if soak:
+                soak.make_room(balls)
+            add_ball(soak.take() if soak else None)
+            last_ball_time = current_time
+
+        # Update ball positions
+        update_balls()
+
+        # Rotate the square
+        square_angle = (square_angle + square_rotation_speed) % 360
+
+        if trajectory:
+            # 物理は1フレームごとに一定量進むので、時刻は進めたフレーム数から求める（60fps 相当）
+            trajectory.record(frame_count, (frame_count + 1) / 60)
+
+        draw_scene(screen)
+
+        # Update the display
+        pygame.display.flip()
+
+        # Publish the frame to stream viewers
+        if stream:
+            stream.publish(frame_count, screen)
+
+        # Cap the frame rate
+        clock.tick(60)
+        if soak:
+            soak.tick(balls, clock.get_time() / 1000)
+        frame_count += 1
+        if args.max_frames and frame_count >= args.max_frames:
+            running = False
 
-    # Update the display
-    pygame.display.flip()
+    if profiler:
+        profiler.close()
+    if trajectory:
+        trajectory.close()
+    if stream:
+        stream.close()
+    if soak:
+        soak.close()
 
-    # Cap the frame rate
-    clock.tick(60)
+    # Quit Pygame
+    pygame.quit()
 
-# Quit Pygame
-pygame.quit()
\ No newline at end of file
+if __name__ == '__main__':
+    main(parse_args())
@@ -1,15 +1,15 @@
 import pygame
-import random
 import math
-from PIL import Image
-
-# Initialize Pygame
-pygame.init()
+import argparse
+from profiling import FrameProfiler, add_profile_arguments
+from seeding import SpawnStreams, add_seed_argument
+from headless import add_headless_arguments, init_pygame
+from recording import add_recording_arguments, create_recorder
+from governor import FULL_DETAIL, FrameGovernor, add_governor_arguments
+from transform import Affine
 
 # Screen dimensions
 WIDTH, HEIGHT = 600, 600
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("DeepSeek R1 - Rotating Square with Bouncing Balls (90s GIF)")
 
 # Colors
 WHITE = (255, 255, 255)
@@ -24,19 +24,18 @@ square_rotation_speed = 0.5  # Degrees per frame
 ball_radius = 20
 balls = []
 
+# Random streams for spawning balls (fixed with --seed)
+spawn_rng = SpawnStreams()
+
 # Recording properties
 RECORD_DURATION = 90  # seconds
 FPS = 30
 FRAME_SKIP = 2  # Frame skip for memory optimization
 
-def rotate_point(cx, cy, x, y, angle):
-    """Rotate a point around a center point (cx, cy) by a given angle."""
-    angle_rad = math.radians(angle)
-    cos_a = math.cos(angle_rad)
-    sin_a = math.sin(angle_rad)
-    x_new = cx + (x - cx) * cos_a - (y - cy) * sin_a
-    y_new = cy + (x - cx) * sin_a + (y - cy) * cos_a
-    return x_new, y_new
+def square_transform(angle):
+    """Transform that rotates screen points around the square's center by angle (degrees)."""
+    center = square_rect.center
+    return Affine.rotation(math.radians(angle), center, center)
 
 def get_rotated_square_corners(angle):
     """Get the corners of the rotated square."""
@@ -48,18 +47,19 @@ def get_rotated_square_corners(angle):
         (cx + half_size, cy + half_size),
         (cx - half_size, cy + half_size)
     ]
-    return [rotate_point(cx, cy, x, y, angle) for x, y in corners]
+    return square_transform(angle).points(corners)
 
 def is_point_in_rotated_square(x, y, angle):
     """Check if a point is inside the rotated square."""
-    cx, cy = square_rect.center
-    x_rot, y_rot = rotate_point(cx, cy, x, y, -angle)
+    x_rot, y_rot = square_transform(angle).inverse().point(x, y)
     return square_rect.collidepoint(x_rot, y_rot)
 
-def handle_collisions(ball, angle):
-    """Handle collisions with the walls of the rotated square."""
-    cx, cy = square_rect.center
-    x_rot, y_rot = rotate_point(cx, cy, ball['x'], ball['y'], -angle)
+def handle_collisions(ball, to_square):
+    """Handle collisions with the walls of the rotated square.
+
+    to_square is the inverse of square_transform(angle), built once per frame.
+    """
+    x_rot, y_rot = to_square.point(ball['x'], ball['y'])
 
     if x_rot - ball_radius < square_rect.left:
         ball['dx'] = abs(ball['dx'])
@@ -72,33 +72,55 @@ def handle_collisions(ball, angle):
 
 def add_ball():
     """Add a new ball with a random color and velocity."""
-    color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
-    x = random.randint(square_rect.left + ball_radius, square_rect.right - ball_radius)
-    y = random.randint(square_rect.top + ball_radius, square_rect.bottom - ball_radius)
-    dx = random.uniform(-3, 3)
-    dy = random.uniform(-3, 3)
+    color = (spawn_rng.color.randint(0, 255), spawn_rng.color.randint(0, 255),
+             spawn_rng.color.randint(0, 255))
+    x = spawn_rng.position.randint(square_rect.left + ball_radius, square_rect.right - ball_radius)
+    y = spawn_rng.position.randint(square_rect.top + ball_radius, square_rect.bottom - ball_radius)
+    dx = spawn_rng.velocity.uniform(-3, 3)
+    dy = spawn_rng.velocity.uniform(-3, 3)
     balls.append({'x': x, 'y': y, 'dx': dx, 'dy': dy, 'color': color})
 
-def surface_to_pil_image(surface):
-    """Convert Pygame surface to PIL Image"""
-    image_string = pygame.image.tostring(surface, 'RGB')
-    return Image.frombytes('RGB', surface.get_size(), image_string)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="DeepSeek R1 - Rotating Square with Bouncing Balls (90s GIF)")
+    add_profile_arguments(parser)
+    add_seed_argument(parser)
+    add_headless_arguments(parser, frame_limit=False)
+    add_recording_arguments(parser, 'deepseek_r1_rotating_balls_90s.gif', RECORD_DURATION)
+    add_governor_arguments(parser)
+    return parser.parse_args(argv)
 
 # Main loop
-def main():
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    profiler = FrameProfiler.from_args(args)
+    spawn_rng.reseed(args.seed)
+
+    # Initialize Pygame
+    init_pygame(args.headless, font=True)
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("DeepSeek R1 - Rotating Square with Bouncing Balls (90s GIF)")
+
     clock = pygame.time.Clock()
     last_ball_time = 0
     angle = 0  # Initialize angle here
-    frames = []
-    total_frames = RECORD_DURATION * FPS
+    total_frames = int(args.duration * FPS)
+    recorder = create_recorder(args, FPS, FRAME_SKIP, total_frames)
+    governor = FrameGovernor.from_args(args, FPS)
     frame_count = 0
-    save_frame_count = 0
 
-    print(f"記録を開始します（{RECORD_DURATION}秒）...")
+    print(f"記録を開始します（{args.duration:g}秒）...")
 
     running = True
     while running and frame_count < total_frames:
-        dt = clock.tick(FPS) / 1000.0  # Delta time in seconds
+        if profiler:
+            profiler.tick(frame_count)
+        if args.unpaced:
+            dt = 1.0 / FPS
+        else:
+            dt = clock.tick(FPS) / 1000.0  # Delta time in seconds
+        if governor:
+            governor.begin()
 
         # Handle events
         for event in pygame.event.get():
@@ -106,62 +128,61 @@ def main():
                 running = False
 
         # Add a new ball every 5 seconds
-        current_time = pygame.time.get_ticks()
+        # Derive the time from the frame count when recording unpaced
+        current_time = frame_count * 1000 // FPS if args.unpaced else pygame.time.get_ticks()
         if current_time - last_ball_time > 5000:
             add_ball()
             last_ball_time = current_time
 
         # Update ball positions
+        to_square = square_transform(angle).inverse()  # same for every ball this frame
         for ball in balls:
             ball['x'] += ball['dx']
             ball['y'] += ball['dy']
-            handle_collisions(ball, angle)
+            handle_collisions(ball, to_square)
 
         # Rotate the square
         angle = (angle + square_rotation_speed) % 360
 
-        # Clear the screen
-        screen.fill(WHITE)
+        detail = governor.detail(frame_count) if governor else FULL_DETAIL
+        if detail.render:
+            # Clear the screen
+            screen.fill(WHITE)
 
-        # Draw the rotated square
-        corners = get_rotated_square_corners(angle)
-        pygame.draw.polygon(screen, BLACK, corners, 2)
+            # Draw the rotated square
+            corners = get_rotated_square_corners(angle)
+            pygame.draw.polygon(screen, BLACK, corners, detail.outline(2))
 
-        # Draw the balls
-        for ball in balls:
-            pygame.draw.circle(screen, ball['color'], (int(ball['x']), int(ball['y'])), ball_radius)
+            # Draw the balls
+            for ball in balls:
+                pygame.draw.circle(screen, ball['color'], (int(ball['x']), int(ball['y'])), ball_radius)
 
-        # Draw remaining time
-        font = pygame.font.Font(None, 36)
-        remaining_time = RECORD_DURATION - frame_count / FPS
-        time_text = f"残り: {remaining_time:.1f}秒"
-        text_surface = font.render(time_text, True, BLACK)
-        screen.blit(text_surface, (10, 10))
+            # Draw remaining time
+            if detail.hud:
+                font = pygame.font.Font(None, 36)
+                remaining_time = args.duration - frame_count / FPS
+                time_text = f"残り: {remaining_time:.1f}秒"
+                text_surface = font.render(time_text, True, BLACK)
+                screen.blit(text_surface, (10, 10))
 
-        pygame.display.flip()
+            pygame.display.flip()
 
-        # Save frame for GIF
-        if frame_count % FRAME_SKIP == 0:
-            frames.append(surface_to_pil_image(screen))
-            save_frame_count += 1
-            if save_frame_count % 15 == 0:
-                print(f"記録中... {(frame_count / total_frames * 100):.1f}% 完了")
+            # Save frame for GIF
+            recorder.capture(screen, frame_count, detail.capture_scale)
 
+        if governor:
+            governor.end(frame_count)
         frame_count += 1
 
     pygame.quit()
 
-    print("GIFを生成中...")
-    if frames:
-        frames[0].save(
-            'deepseek_r1_rotating_balls_90s.gif',
-            save_all=True,
-            append_images=frames[1:],
-            optimize=True,
-            duration=(1000 * FRAME_SKIP)//FPS,
-            loop=0
-        )
-        print("GIFを保存しました: deepseek_r1_rotating_balls_90s.gif")
+    recorder.save()
+
+    if governor:
+        governor.close()
+    if profiler:
+        profiler.close()
+    return recorder
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main(parse_args())
\ No newline at end of file
@@ -1,6 +1,21 @@
 import pygame
 import math
-import random
+import sys
+import argparse
+from profiling import FrameProfiler, add_profile_arguments
+from seeding import SpawnStreams, add_seed_argument
+from headless import add_headless_arguments, init_pygame
+from trajectory import TrajectoryWriter, add_trajectory_arguments
+from stream_options import add_stream_arguments, stream_from_args
+from soak import Population, add_soak_arguments
+from spawning import Spawner, add_spawning_arguments
+from pipeline import PhysicsPipeline, add_pipeline_arguments
+from transform import Affine
+from governor import FULL_DETAIL, FrameGovernor, add_governor_arguments
+from hgrid import HierarchicalGrid, add_broadphase_arguments, all_pairs
+from spatial_query import Picker, add_query_arguments
+from tile_raster import TileRasterizer, add_tile_arguments
+from checkpoint import CheckpointWriter, add_checkpoint_arguments, capture, load as load_checkpoint
 
 # ---------------------------
 # グローバル定数・設定
@@ -9,91 +24,211 @@ WIDTH, HEIGHT = 800, 600
 SQUARE_SIZE = 400         # コンテナ（正方形）の一辺の長さ
 SQUARE_HALF = SQUARE_SIZE / 2
 BALL_RADIUS = 10          # ボールの半径（ローカル座標系）
+BALL_RADIUS_RANGE = None  # (最小, 最大)。指定するとボールごとに半径を選ぶ（--radius-range）
+BROADPHASE = "hgrid"      # 衝突しうる組の探し方（--broadphase）
 BALL_SPEED = 200          # ボールの初速（ピクセル/秒、ローカル座標系）
 ROTATION_SPEED = math.radians(10)  # 正方形は1秒間に10°回転
 
 # 正方形は画面中央に描画する
 SQUARE_CENTER = (WIDTH // 2, HEIGHT // 2)
 
+# ボール生成用の乱数（--seed で固定できる）
+spawn_rng = SpawnStreams()
+
 # ---------------------------
 # ボールクラス（ローカル座標系）
 # ---------------------------
 class Ball:
-    def __init__(self, x, y, vx, vy, color):
+    def __init__(self, x, y, vx, vy, color, radius=None, mass=None):
         """
         x, y: 正方形内での初期位置（原点は正方形の中心）
         vx, vy: 速度（ローカル座標系での単位：ピクセル/秒）
         color: (R, G, B) のタプル
+        radius: 半径（省略時は BALL_RADIUS）
+        mass: 質量（省略時は半径の2乗＝面積に比例）
         """
         self.x = x
         self.y = y
         self.vx = vx
         self.vy = vy
         self.color = color
+        self.radius = BALL_RADIUS if radius is None else radius
+        self.mass = self.radius ** 2 if mass is None else mass
 
     def update(self, dt):
         # ローカル座標系において位置を更新
         self.x += self.vx * dt
         self.y += self.vy * dt
 
-        # 正方形の壁との衝突判定（ローカル座標系の境界は ±(SQUARE_HALF - BALL_RADIUS)）
-        if self.x > SQUARE_HALF - BALL_RADIUS:
-            self.x = SQUARE_HALF - BALL_RADIUS
+        # 正方形の壁との衝突判定（ローカル座標系の境界は ±(SQUARE_HALF - 半径)）
+        limit = SQUARE_HALF - self.radius
+        if self.x > limit:
+            self.x = limit
             self.vx = -self.vx
-        elif self.x < -SQUARE_HALF + BALL_RADIUS:
-            self.x = -SQUARE_HALF + BALL_RADIUS
+        elif self.x < -limit:
+            self.x = -limit
             self.vx = -self.vx
 
-        if self.y > SQUARE_HALF - BALL_RADIUS:
-            self.y = SQUARE_HALF - BALL_RADIUS
+        if self.y > limit:
+            self.y = limit
             self.vy = -self.vy
-        elif self.y < -SQUARE_HALF + BALL_RADIUS:
-            self.y = -SQUARE_HALF + BALL_RADIUS
+        elif self.y < -limit:
+            self.y = -limit
             self.vy = -self.vy
 
 # ---------------------------
-# 球同士の衝突処理（等質な完全弾性衝突の近似）
+# 球同士の衝突処理（質量で重み付けした完全弾性衝突の近似）
 # ---------------------------
+def candidate_pairs(balls):
+    """重なりうる組 (i, j) を i, j の順に返す（階層格子かすべての組）"""
+    if BROADPHASE == "all-pairs":
+        return all_pairs(len(balls))
+    return HierarchicalGrid.build([(b.x, b.y) for b in balls], [b.radius for b in balls]).pairs()
+
 def resolve_ball_collisions(balls):
-    n = len(balls)
-    for i in range(n):
-        for j in range(i + 1, n):
-            b1 = balls[i]
-            b2 = balls[j]
-            dx = b1.x - b2.x
-            dy = b1.y - b2.y
-            dist = math.hypot(dx, dy)
-            if dist < 2 * BALL_RADIUS:
-                # dist==0 となる場合（極めて稀）には、任意の単位ベクトルを使う
-                if dist == 0:
-                    nx, ny = 1, 0
-                else:
-                    nx = dx / dist
-                    ny = dy / dist
-
-                # 重なり量の補正：各ボールを半分ずつ押し戻す
-                overlap = 2 * BALL_RADIUS - dist
-                correction = overlap / 2
-                b1.x += nx * correction
-                b1.y += ny * correction
-                b2.x -= nx * correction
-                b2.y -= ny * correction
-
-                # 衝突応答（速度の交換：ボール同士が近づいている場合のみ）
-                # 相対速度の正規方向成分を計算
-                v_rel = (b1.vx - b2.vx) * nx + (b1.vy - b2.vy) * ny
-                if v_rel < 0:  # すでに離れている場合は何もしない
-                    impulse = -v_rel  # 衝突による速度補正量（等質の場合）
-                    b1.vx += impulse * nx
-                    b1.vy += impulse * ny
-                    b2.vx -= impulse * nx
-                    b2.vy -= impulse * ny
+    for i, j in candidate_pairs(balls):
+        b1 = balls[i]
+        b2 = balls[j]
+        dx = b1.x - b2.x
+        dy = b1.y - b2.y
+        dist = math.hypot(dx, dy)
+        reach = b1.radius + b2.radius
+        if dist < reach:
+            # dist==0 となる場合（極めて稀）には、任意の単位ベクトルを使う
+            if dist == 0:
+                nx, ny = 1, 0
+            else:
+                nx = dx / dist
+                ny = dy / dist
+
+            # b1 が受け持つ割合（相手の質量の比。等質なら 0.5）
+            share = b2.mass / (b1.mass + b2.mass)
+
+            # 重なり量の補正：軽いボールほど大きく押し戻す
+            overlap = reach - dist
+            correction1 = overlap * share
+            correction2 = overlap * (1 - share)
+            b1.x += nx * correction1
+            b1.y += ny * correction1
+            b2.x -= nx * correction2
+            b2.y -= ny * correction2
+
+            # 衝突応答（ボール同士が近づいている場合のみ）
+            # 相対速度の正規方向成分を計算
+            v_rel = (b1.vx - b2.vx) * nx + (b1.vy - b2.vy) * ny
+            if v_rel < 0:  # すでに離れている場合は何もしない
+                impulse = -v_rel  # 等質なら速度の交換（b1 は impulse, b2 は -impulse）
+                impulse1 = 2 * share * impulse
+                impulse2 = 2 * (1 - share) * impulse
+                b1.vx += impulse1 * nx
+                b1.vy += impulse1 * ny
+                b2.vx -= impulse2 * nx
+                b2.vy -= impulse2 * ny
+
+# ---------------------------
+# ボールの生成
+# ---------------------------
+def spawn_ball(position=None, ball=None):
+    """ランダムな位置・方向・色の新しいボールを生成
+
+    position を渡すとその位置に置く。ball を渡すと新しく作らずに、
+    そのオブジェクトを初期化し直して使う（ソークモードのプールから）。
+    """
+    radius = BALL_RADIUS
+    if BALL_RADIUS_RANGE:
+        # 小さな粒子と大きなボールが混ざるよう、半径は対数で一様に選ぶ
+        low, high = BALL_RADIUS_RANGE
+        radius = math.exp(spawn_rng.position.uniform(math.log(low), math.log(high)))
+    if position is None:
+        # 壁から十分離れたランダムなローカル座標上の位置
+        x = spawn_rng.position.uniform(-SQUARE_HALF + radius, SQUARE_HALF - radius)
+        y = spawn_rng.position.uniform(-SQUARE_HALF + radius, SQUARE_HALF - radius)
+    else:
+        x, y = position
+
+    # ランダムな方向へ初速度を与える
+    theta = spawn_rng.velocity.uniform(0, 2 * math.pi)
+    vx = BALL_SPEED * math.cos(theta)
+    vy = BALL_SPEED * math.sin(theta)
+
+    # 鮮やかなランダムな色を生成
+    color = (spawn_rng.color.randint(50, 255), spawn_rng.color.randint(50, 255),
+             spawn_rng.color.randint(50, 255))
+    if ball is None:
+        return Ball(x, y, vx, vy, color, radius)
+    ball.__init__(x, y, vx, vy, color, radius)
+    return ball
+
+def max_ball_radius():
+    """生成するボールの半径の最大値（重ならない配置の間隔に使う）"""
+    return BALL_RADIUS_RANGE[1] if BALL_RADIUS_RANGE else BALL_RADIUS
+
+# ---------------------------
+# 描画
+# ---------------------------
+def draw_scene(screen, balls, angle, outline=3, raster=None):
+    """正方形コンテナとボールを描画（display.flipは呼び出し側で行う）"""
+    draw_frame(screen, [(ball.x, ball.y) for ball in balls], [ball.color for ball in balls], angle, outline,
+               [ball.radius for ball in balls], raster)
+
+def draw_frame(screen, positions, colors, angle, outline=3, radii=None, raster=None):
+    """位置と色（と半径）の配列からボールを描画（--pipeline ではバッファの配列を渡す）"""
+    # ローカル座標 → スクリーン座標の変換（フレームごとに1度だけ作る）
+    transform = Affine.rotation(angle, SQUARE_CENTER)
+    if radii is None:
+        radii = [BALL_RADIUS] * len(colors)
+    if raster:
+        # --tiled-render: タイルに分けてスレッドプールで塗り、画面へ転送する
+        raster.draw(screen, transform, SQUARE_HALF, positions, colors, radii, outline)
+        return
+
+    screen.fill((30, 30, 30))  # 暗い背景で画面をクリア
+
+    # 回転後の正方形の各頂点（ローカル座標系での頂点は固定）
+    local_corners = [
+        (-SQUARE_HALF, -SQUARE_HALF),
+        ( SQUARE_HALF, -SQUARE_HALF),
+        ( SQUARE_HALF,  SQUARE_HALF),
+        (-SQUARE_HALF,  SQUARE_HALF)
+    ]
+
+    # 正方形コンテナを描画（アウトラインのみ）
+    pygame.draw.polygon(screen, (200, 200, 200), transform.points(local_corners), outline)
+
+    # 各ボールの描画（位置はまとめてスクリーン座標へ変換）
+    for position, color, radius in zip(transform.to_screen(positions).tolist(), colors, radii):
+        pygame.draw.circle(screen, color, position, radius)
 
 # ---------------------------
 # メインループ
 # ---------------------------
-def main():
-    pygame.init()
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="O3 Improved - 回転する正方形内の弾むボール（球同士の衝突付き）")
+    add_profile_arguments(parser)
+    add_seed_argument(parser)
+    add_headless_arguments(parser)
+    add_trajectory_arguments(parser)
+    add_stream_arguments(parser)
+    add_soak_arguments(parser)
+    add_spawning_arguments(parser)
+    add_checkpoint_arguments(parser)
+    add_pipeline_arguments(parser)
+    add_governor_arguments(parser)
+    add_broadphase_arguments(parser)
+    add_query_arguments(parser)
+    add_tile_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(args=None):
+    global BALL_RADIUS_RANGE, BROADPHASE
+    if args is None:
+        args = parse_args([])
+    profiler = FrameProfiler.from_args(args)
+    spawn_rng.reseed(args.seed)
+    BALL_RADIUS_RANGE = tuple(args.radius_range) if args.radius_range else None
+    BROADPHASE = args.broadphase
+
+    init_pygame(args.headless)
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
     pygame.display.set_caption("O3 Improved - 回転する正方形内の弾むボール（球同士の衝突付き）")
     clock = pygame.time.Clock()
@@ -101,16 +236,34 @@ def main():
     balls = []            # ローカル座標系でのボールリスト
     ball_spawn_timer = 0  # 5秒ごとに新しいボールを生成するためのタイマー
     angle = 0             # 正方形の現在の回転角（ラジアン）
+    sim_time = 0.0        # シミュレーション上の経過時間（秒、dt の積算）
+    frame_count = 0
+    if args.restore:
+        # チェックポイントの時点から再開（ボール・タイマー・角度・乱数・フレーム数）
+        snapshot = load_checkpoint(args.restore, "04")
+        if "radius" in snapshot.columns:
+            balls = [Ball(x, y, vx, vy, color, radius, mass)
+                     for x, y, vx, vy, radius, mass, color in snapshot.rows("x", "y", "vx", "vy", "radius", "mass")]
+        else:
+            balls = [Ball(x, y, vx, vy, color) for x, y, vx, vy, color in snapshot.rows("x", "y", "vx", "vy")]
+        ball_spawn_timer = snapshot.values["ball_spawn_timer"]
+        # 経過時間を持たない古いチェックポイントは 60fps で進んだものとみなす
+        sim_time = snapshot.values.get("sim_time", snapshot.frame / 60)
+        angle = snapshot.angle
+        frame_count = snapshot.frame
+        spawn_rng.setstate(snapshot.rng)
+    checkpoints = CheckpointWriter.from_args(args)
+    spawner = Spawner.from_args(args, sys.modules[__name__])
+    if spawner and args.initial_balls and not args.restore:
+        spawner.spawn(balls, args.initial_balls)
+    trajectory = TrajectoryWriter.from_args(args, "04", sys.modules[__name__], balls=balls)
+    stream = stream_from_args(args, "04", sys.modules[__name__], balls=balls)
+    soak = Population.from_args(args, trajectory, stream)
 
-    running = True
-    while running:
-        dt = clock.tick(60) / 1000.0  # フレーム間の経過時間（秒単位）
-
-        # --- イベント処理 ---
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-
+    def step(dt):
+        """物理を1フレーム進める（--pipeline ではワーカースレッドで実行）"""
+        nonlocal angle, ball_spawn_timer, sim_time
+        sim_time += dt
         # --- 正方形（コンテナ）の回転更新 ---
         angle += ROTATION_SPEED * dt
 
@@ -125,51 +278,103 @@ def main():
         ball_spawn_timer += dt
         if ball_spawn_timer >= 5:
             ball_spawn_timer = 0
+            if soak:
+                soak.make_room(balls, spawner.burst if spawner else 1)
+            if spawner:
+                spawner.spawn(balls, take=soak.take if soak else None)
+            else:
+                balls.append(spawn_ball(ball=soak.take() if soak else None))
+        if soak:
+            soak.tick(balls, dt)
 
-            # 壁から十分離れたランダムなローカル座標上の位置
-            x = random.uniform(-SQUARE_HALF + BALL_RADIUS, SQUARE_HALF - BALL_RADIUS)
-            y = random.uniform(-SQUARE_HALF + BALL_RADIUS, SQUARE_HALF - BALL_RADIUS)
-
-            # ランダムな方向へ初速度を与える
-            theta = random.uniform(0, 2 * math.pi)
-            vx = BALL_SPEED * math.cos(theta)
-            vy = BALL_SPEED * math.sin(theta)
-
-            # 鮮やかなランダムな色を生成
-            color = (random.randint(50, 255), random.randint(50, 255), random.randint(50, 255))
-            balls.append(Ball(x, y, vx, vy, color))
-
-        # --- 描画 ---
-        screen.fill((30, 30, 30))  # 暗い背景で画面をクリア
-
-        # 回転後の正方形の各頂点（ローカル座標系での頂点は固定）
-        local_corners = [
-            (-SQUARE_HALF, -SQUARE_HALF),
-            ( SQUARE_HALF, -SQUARE_HALF),
-            ( SQUARE_HALF,  SQUARE_HALF),
-            (-SQUARE_HALF,  SQUARE_HALF)
-        ]
-        cos_a = math.cos(angle)
-        sin_a = math.sin(angle)
-        world_corners = []
-        for lx, ly in local_corners:
-            # ローカル座標から回転を加えてスクリーン座標へ変換
-            wx = SQUARE_CENTER[0] + lx * cos_a - ly * sin_a
-            wy = SQUARE_CENTER[1] + lx * sin_a + ly * cos_a
-            world_corners.append((wx, wy))
-
-        # 正方形コンテナを描画（アウトラインのみ）
-        pygame.draw.polygon(screen, (200, 200, 200), world_corners, 3)
-
-        # 各ボールの描画（ローカル座標→スクリーン座標へ変換）
-        for ball in balls:
-            wx = SQUARE_CENTER[0] + ball.x * cos_a - ball.y * sin_a
-            wy = SQUARE_CENTER[1] + ball.x * sin_a + ball.y * cos_a
-            pygame.draw.circle(screen, ball.color, (int(wx), int(wy)), BALL_RADIUS)
+    def publish(buffer):
+        """描画する状態をパイプラインのバッファに書く"""
+        buffer.load(angle, [(ball.x, ball.y) for ball in balls], [ball.color for ball in balls],
+                    [ball.radius for ball in balls])
+
+    pipeline = PhysicsPipeline.from_args(args, step, publish)
+    governor = FrameGovernor.from_args(args, 60)
+    picker = Picker.from_args(args, max_ball_radius(), SQUARE_CENTER)
+    raster = TileRasterizer.from_args(args, (WIDTH, HEIGHT))
+
+    running = True
+    while running:
+        if profiler:
+            profiler.tick(frame_count)
+        dt = clock.tick(60) / 1000.0  # フレーム間の経過時間（秒単位）
+        if args.fixed_dt:
+            dt = args.fixed_dt
+        if governor:
+            governor.begin()
+
+        # --- イベント処理 ---
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif picker and event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                picker.click(event.pos)  # 表示中のフレーム（前回の track）の位置で調べる
+        if args.max_frames and frame_count + 1 >= args.max_frames:
+            running = False
+
+        # --- 物理（パイプラインではワーカーが進めておいた結果を受け取る） ---
+        if pipeline:
+            view = pipeline.swap(dt)
+        else:
+            step(dt)
+
+        # ここから submit() まではワーカーが止まっているので、ボールのリストを読める
+        # --- 軌跡の記録 ---
+        if trajectory:
+            trajectory.record(frame_count, sim_time, angle=angle)
+
+        # --- 位置の索引（--pick）の差分更新 ---
+        if picker:
+            picker.track(balls, angle)
+
+        # --- チェックポイント（書き出しはバックグラウンドで行う） ---
+        if checkpoints and (checkpoints.due(frame_count + 1) or not running):
+            checkpoints.submit(capture("04", balls, ("x", "y", "vx", "vy", "radius", "mass"), frame_count + 1, angle,
+                                       spawn_rng, ball_spawn_timer=ball_spawn_timer, sim_time=sim_time))
+
+        if pipeline and running:
+            pipeline.submit(dt)  # 次のフレームの物理を描画と並行して進める
+
+        # --- 描画（ガバナーが間引くフレームでは描かない） ---
+        detail = governor.detail(frame_count) if governor else FULL_DETAIL
+        if detail.render:
+            if pipeline:
+                draw_frame(screen, *view.balls(), view.angle, detail.outline(3), view.radii(), raster)
+            else:
+                draw_scene(screen, balls, angle, detail.outline(3), raster)
+            if picker:
+                picker.draw(screen)
 
-        pygame.display.flip()
+            pygame.display.flip()
+            if stream:
+                if pipeline and stream.source:
+                    pipeline.wait()  # state モードはボールのリストを読むため、物理を待つ
+                stream.publish(frame_count, screen, angle=angle)
+        if governor:
+            governor.end(frame_count)
+        frame_count += 1
 
+    if pipeline:
+        pipeline.close()
+    if governor:
+        governor.close()
+    if profiler:
+        profiler.close()
+    if checkpoints:
+        checkpoints.close()
+    if trajectory:
+        trajectory.close()
+    if stream:
+        stream.close()
+    if soak:
+        soak.close()
+    if raster:
+        raster.close()
     pygame.quit()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main(parse_args())
\ No newline at end of file
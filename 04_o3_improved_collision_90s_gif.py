@@ -1,8 +1,13 @@
 import pygame
 import math
-import random
-from PIL import Image
-import io
+import argparse
+from profiling import FrameProfiler, add_profile_arguments
+from seeding import SpawnStreams, add_seed_argument
+from headless import add_headless_arguments, init_pygame
+from recording import add_recording_arguments, create_recorder
+from governor import FULL_DETAIL, FrameGovernor, add_governor_arguments
+from tile_raster import TileRasterizer, add_tile_arguments
+from transform import Affine
 
 # ---------------------------
 # グローバル定数・設定
@@ -14,6 +19,9 @@ BALL_RADIUS = 10
 BALL_SPEED = 200
 ROTATION_SPEED = math.radians(10)
 SQUARE_CENTER = (WIDTH // 2, HEIGHT // 2)
+
+# ボール生成用の乱数（--seed で固定できる）
+spawn_rng = SpawnStreams()
 RECORD_DURATION = 90  # GIF記録時間（秒）
 FPS = 30  # GIFのフレームレート
 
@@ -83,13 +91,23 @@ def resolve_ball_collisions(balls):
                     b2.vx -= impulse * nx
                     b2.vy -= impulse * ny
 
-def surface_to_pil_image(surface):
-    """PyGame surfaceをPIL Imageに変換"""
-    image_string = pygame.image.tostring(surface, 'RGB')
-    return Image.frombytes('RGB', surface.get_size(), image_string)
-
-def main():
-    pygame.init()
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="O3 Improved - 回転する正方形内の弾むボール（90秒GIF記録）")
+    add_profile_arguments(parser)
+    add_seed_argument(parser)
+    add_headless_arguments(parser, frame_limit=False)
+    add_recording_arguments(parser, 'rotating_balls_90s.gif', RECORD_DURATION)
+    add_governor_arguments(parser)
+    add_tile_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    profiler = FrameProfiler.from_args(args)
+    spawn_rng.reseed(args.seed)
+
+    init_pygame(args.headless, font=True)
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
     pygame.display.set_caption("O3 Improved - 回転する正方形内の弾むボール（90秒GIF記録）")
     clock = pygame.time.Clock()
@@ -97,15 +115,20 @@ def main():
     balls = []
     ball_spawn_timer = 0
     angle = 0
-    frames = []  # GIFフレームを保存するリスト
-    total_frames = RECORD_DURATION * FPS
+    total_frames = int(args.duration * FPS)
+    recorder = create_recorder(args, FPS, FRAME_SKIP, total_frames)
+    governor = FrameGovernor.from_args(args, FPS)
+    raster = TileRasterizer.from_args(args, (WIDTH, HEIGHT))
     frame_count = 0
-    save_frame_count = 0
 
-    print(f"記録を開始します（{RECORD_DURATION}秒）...")
+    print(f"記録を開始します（{args.duration:g}秒）...")
 
     running = True
     while running and frame_count < total_frames:
+        if profiler:
+            profiler.tick(frame_count)
+        if governor:
+            governor.begin()
         dt = 1.0 / FPS  # 固定デルタタイム
 
         for event in pygame.event.get():
@@ -122,69 +145,70 @@ def main():
         ball_spawn_timer += dt
         if ball_spawn_timer >= 5:
             ball_spawn_timer = 0
-            x = random.uniform(-SQUARE_HALF + BALL_RADIUS, SQUARE_HALF - BALL_RADIUS)
-            y = random.uniform(-SQUARE_HALF + BALL_RADIUS, SQUARE_HALF - BALL_RADIUS)
-            theta = random.uniform(0, 2 * math.pi)
+            x = spawn_rng.position.uniform(-SQUARE_HALF + BALL_RADIUS, SQUARE_HALF - BALL_RADIUS)
+            y = spawn_rng.position.uniform(-SQUARE_HALF + BALL_RADIUS, SQUARE_HALF - BALL_RADIUS)
+            theta = spawn_rng.velocity.uniform(0, 2 * math.pi)
             vx = BALL_SPEED * math.cos(theta)
             vy = BALL_SPEED * math.sin(theta)
-            color = (random.randint(50, 255), random.randint(50, 255), random.randint(50, 255))
+            color = (spawn_rng.color.randint(50, 255), spawn_rng.color.randint(50, 255),
+                     spawn_rng.color.randint(50, 255))
             balls.append(Ball(x, y, vx, vy, color))
 
-        screen.fill((30, 30, 30))
-
-        local_corners = [
-            (-SQUARE_HALF, -SQUARE_HALF),
-            ( SQUARE_HALF, -SQUARE_HALF),
-            ( SQUARE_HALF,  SQUARE_HALF),
-            (-SQUARE_HALF,  SQUARE_HALF)
-        ]
-        cos_a = math.cos(angle)
-        sin_a = math.sin(angle)
-        world_corners = []
-        for lx, ly in local_corners:
-            wx = SQUARE_CENTER[0] + lx * cos_a - ly * sin_a
-            wy = SQUARE_CENTER[1] + lx * sin_a + ly * cos_a
-            world_corners.append((wx, wy))
-
-        pygame.draw.polygon(screen, (200, 200, 200), world_corners, 3)
-
-        for ball in balls:
-            wx = SQUARE_CENTER[0] + ball.x * cos_a - ball.y * sin_a
-            wy = SQUARE_CENTER[1] + ball.x * sin_a + ball.y * cos_a
-            pygame.draw.circle(screen, ball.color, (int(wx), int(wy)), BALL_RADIUS)
-
-        # 残り時間を表示
-        font = pygame.font.Font(None, 36)
-        remaining_time = RECORD_DURATION - frame_count / FPS
-        time_text = f"残り: {remaining_time:.1f}秒"
-        text_surface = font.render(time_text, True, (255, 255, 255))
-        screen.blit(text_surface, (10, 10))
-
-        pygame.display.flip()
-        
-        # フレームを間引いてGIF用に保存
-        if frame_count % FRAME_SKIP == 0:
-            frames.append(surface_to_pil_image(screen))
-            save_frame_count += 1
-            if save_frame_count % 15 == 0:  # 15フレームごとに進捗を表示
-                print(f"記録中... {(frame_count / total_frames * 100):.1f}% 完了")
-
+        detail = governor.detail(frame_count) if governor else FULL_DETAIL
+        if detail.render:
+            # ローカル座標 → スクリーン座標の変換（フレームごとに1度だけ作る）
+            transform = Affine.rotation(angle, SQUARE_CENTER)
+            if raster:
+                # --tiled-render: 正方形とボールをタイルに分けて並行に塗る
+                raster.draw(screen, transform, SQUARE_HALF,
+                            [(ball.x, ball.y) for ball in balls], [ball.color for ball in balls],
+                            [BALL_RADIUS] * len(balls), detail.outline(3))
+            else:
+                screen.fill((30, 30, 30))
+
+                local_corners = [
+                    (-SQUARE_HALF, -SQUARE_HALF),
+                    ( SQUARE_HALF, -SQUARE_HALF),
+                    ( SQUARE_HALF,  SQUARE_HALF),
+                    (-SQUARE_HALF,  SQUARE_HALF)
+                ]
+                pygame.draw.polygon(screen, (200, 200, 200), transform.points(local_corners), detail.outline(3))
+
+                # 位置はまとめてスクリーン座標へ変換
+                positions = transform.to_screen([(ball.x, ball.y) for ball in balls]).tolist()
+                for ball, position in zip(balls, positions):
+                    pygame.draw.circle(screen, ball.color, position, BALL_RADIUS)
+
+            # 残り時間を表示
+            if detail.hud:
+                font = pygame.font.Font(None, 36)
+                remaining_time = args.duration - frame_count / FPS
+                time_text = f"残り: {remaining_time:.1f}秒"
+                text_surface = font.render(time_text, True, (255, 255, 255))
+                screen.blit(text_surface, (10, 10))
+
+            pygame.display.flip()
+
+            # フレームを間引いてGIF用に保存
+            recorder.capture(screen, frame_count, detail.capture_scale)
+
+        if governor:
+            governor.end(frame_count)
         frame_count += 1
-        clock.tick(FPS)
+        if not args.unpaced:
+            clock.tick(FPS)
 
     pygame.quit()
 
-    print("GIFを生成中...")
-    if frames:
-        frames[0].save(
-            'rotating_balls_90s.gif',
-            save_all=True,
-            append_images=frames[1:],
-            optimize=True,
-            duration=(1000 * FRAME_SKIP)//FPS,  # フレームスキップを考慮した時間
-            loop=0
-        )
-        print("GIFを保存しました: rotating_balls_90s.gif")
+    recorder.save()
+
+    if governor:
+        governor.close()
+    if raster:
+        raster.close()
+    if profiler:
+        profiler.close()
+    return recorder
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main(parse_args())
\ No newline at end of file
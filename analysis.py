@@ -0,0 +1,391 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from implementations import SIMULATIONS, load_simulation
+from replay import frame_range
+from trajectory import TrajectoryReader
+
+# ---------------------------
+# 軌跡ログの列指向の集計
+# ---------------------------
+# 軌跡ログを「1行 = 1フレームの1ボール」のDataFrameとして読み込み、
+# 速度分布・運動エネルギーの変化・壁／ボールとの衝突頻度・
+# ローカル座標系での滞在ヒートマップをベクトル演算で求める。
+# 再シミュレーションせずに、記録済みの実行から数える。
+#
+# analyze() はログをチャンク（chunk_frames フレーム）ごとに2回読む。1回目で
+# 速さと位置の範囲を求め、2回目でヒストグラム・ヒートマップ・フレームごとの
+# エネルギー・衝突の回数を足し込むので、メモリに載るのは1チャンク分だけで
+# 済む。ボールごとの速度変化はチャンクの境目をまたぐため、前のチャンクの
+# 最後の1フレームを重ねて調べる。分位点は細かいヒストグラムからの近似になる。
+#
+# 半径と質量はログに記録されていればボールごとの値（04）を使い、なければ
+# シーンの半径と質量1とする。速度は各実装の単位のまま（01/03はpx/frame）。
+
+COLUMNS = ["frame", "time", "angle", "id", "x", "y", "vx", "vy", "radius", "mass"]
+DEFAULT_CHUNK_FRAMES = 1000
+QUANTILES = [0.0, 0.05, 0.5, 0.95, 1.0]
+QUANTILE_BINS = 4096  # 分位点を近似するヒストグラムのビン数
+
+
+def _per_ball(records, name, default):
+    """ボールごとの値（radii / masses）をつなげる（記録されていないフレームは default）"""
+    return np.concatenate([np.full(len(r.ids), default, dtype=np.float64) if getattr(r, name) is None
+                           else getattr(r, name) for r in records])
+
+
+def iter_chunks(reader, frames, chunk_frames=DEFAULT_CHUNK_FRAMES, radius=np.nan):
+    """指定したフレームを chunk_frames ごとのDataFrameとして順に読み込む
+
+    半径が記録されていないログでは radius 列を引数の radius、mass 列を1にする。
+    """
+    for begin in range(0, len(frames), chunk_frames):
+        records = [reader[i] for i in frames[begin:begin + chunk_frames]]
+        counts = np.array([len(r.ids) for r in records])
+        if counts.sum() == 0:
+            continue
+        positions = np.concatenate([r.positions for r in records])
+        velocities = np.concatenate([r.velocities for r in records])
+        yield pd.DataFrame({
+            "frame": np.repeat([r.frame for r in records], counts).astype(np.int64),
+            "time": np.repeat([r.time for r in records], counts),
+            "angle": np.repeat([r.angle for r in records], counts),
+            "id": np.concatenate([r.ids for r in records]).astype(np.int32),
+            "x": positions[:, 0], "y": positions[:, 1],
+            "vx": velocities[:, 0], "vy": velocities[:, 1],
+            "radius": _per_ball(records, "radii", radius),
+            "mass": _per_ball(records, "masses", 1.0),
+        })
+
+
+def load_dataframe(reader, frames, chunk_frames=DEFAULT_CHUNK_FRAMES, radius=np.nan):
+    """指定したフレームを1つのDataFrameに読み込む"""
+    chunks = list(iter_chunks(reader, frames, chunk_frames, radius))
+    if not chunks:
+        return pd.DataFrame({name: pd.Series(dtype=float) for name in COLUMNS})
+    return pd.concat(chunks, ignore_index=True)
+
+
+def to_wide(df, column):
+    """フレーム × ボールIDの2次元配列（存在しないボールはNaN）"""
+    return df.pivot(index="frame", columns="id", values=column)
+
+
+def speeds(df):
+    return np.hypot(df["vx"].to_numpy(), df["vy"].to_numpy())
+
+
+def speed_distribution(df, bins=30):
+    """速さのヒストグラムと分位点"""
+    speed = speeds(df)
+    counts, edges = np.histogram(speed, bins=bins)
+    histogram = pd.DataFrame({"low": edges[:-1], "high": edges[1:], "count": counts})
+    quantiles = pd.Series(speed).quantile(QUANTILES) if len(speed) else pd.Series(dtype=float)
+    return histogram, quantiles
+
+
+def histogram_quantiles(counts, edges, quantiles=QUANTILES):
+    """ヒストグラムから分位点を求める（pandas と同じく順位 q·(n-1) の前後の値を補間する）
+
+    k 番目に小さい値は、そのビンの中で一様に並んでいるとみなして推定する。
+    誤差はビン幅まで。
+    """
+    cumulative = np.cumsum(counts)
+
+    def ranked(k):
+        i = int(np.searchsorted(cumulative, k, side="right"))
+        inside = (k - (cumulative[i] - counts[i]) + 0.5) / counts[i]
+        return edges[i] + inside * (edges[i + 1] - edges[i])
+
+    values = []
+    for q in quantiles:
+        position = q * (cumulative[-1] - 1)
+        k = int(position)
+        upper = min(k + 1, cumulative[-1] - 1)
+        values.append(ranked(k) + (position - k) * (ranked(upper) - ranked(k)))
+    return pd.Series(values, index=quantiles)
+
+
+def frame_energy(df):
+    """フレームごとの時刻・ボール数・質量と運動エネルギーの合計"""
+    energy = df.assign(ke=0.5 * df["mass"] * (df["vx"] ** 2 + df["vy"] ** 2))
+    return energy.groupby("frame").agg(time=("time", "first"), balls=("id", "size"),
+                                       mass_total=("mass", "sum"), ke_total=("ke", "sum"))
+
+
+def kinetic_energy(df):
+    """フレームごとの運動エネルギー（合計・1ボールあたり・単位質量あたり）と最初のフレームからの相対変化"""
+    return energy_drift(frame_energy(df))
+
+
+def energy_drift(per_frame):
+    """frame_energy() の表に1ボールあたりの値と最初のフレームからの相対変化を加える"""
+    per_frame["ke_per_ball"] = per_frame["ke_total"] / per_frame["balls"]
+    per_frame["ke_per_mass"] = per_frame["ke_total"] / per_frame["mass_total"]
+    # ボールが増えると合計は跳ね、質量が違えば1ボールあたりの値も跳ねるため、
+    # ドリフトは単位質量あたりの値で見る（質量がすべて同じなら1ボールあたりと同じ）
+    first = per_frame["ke_per_mass"].iloc[0] if len(per_frame) else np.nan
+    per_frame["drift"] = per_frame["ke_per_mass"] / first - 1 if first else np.nan
+    return per_frame
+
+
+def detect_events(df, half_size, radius, turn_threshold=0.1):
+    """速度が急に変わった瞬間を壁との衝突／ボール同士の衝突に分類
+
+    前のフレームからの速度変化が速さの turn_threshold 倍を超えたものを衝突とみなし、
+    そのとき壁からの距離が移動量（+1px）以内なら壁、そうでなければボールとする。
+    壁までの距離はボールごとの半径（radius 列）で測る。列の値がなければ radius を使う。
+    """
+    df = df.sort_values(["id", "frame"], kind="stable")
+    same = df["id"].to_numpy()[1:] == df["id"].to_numpy()[:-1]
+    x, y = df["x"].to_numpy(), df["y"].to_numpy()
+    vx, vy = df["vx"].to_numpy(), df["vy"].to_numpy()
+
+    dv = np.hypot(vx[1:] - vx[:-1], vy[1:] - vy[:-1])
+    speed = np.maximum(np.hypot(vx[:-1], vy[:-1]), 1e-9)
+    moved = np.hypot(x[1:] - x[:-1], y[1:] - y[:-1])
+    if "radius" in df:
+        radius = df["radius"].fillna(radius).to_numpy()[1:]
+    wall_distance = (half_size - radius) - np.maximum(np.abs(x[1:]), np.abs(y[1:]))
+
+    changed = same & (dv > turn_threshold * speed)
+    near_wall = wall_distance <= moved + 1.0
+    events = pd.DataFrame({
+        "frame": df["frame"].to_numpy()[1:],
+        "time": df["time"].to_numpy()[1:],
+        "id": df["id"].to_numpy()[1:],
+        "kind": np.where(near_wall, "wall", "ball"),
+    })[changed]
+    return events.reset_index(drop=True)
+
+
+def event_rates(events, duration):
+    """1秒ごとの衝突回数と全体の平均頻度（ボール同士は1回の衝突で2ボール分数えるので半分にする）"""
+    if events.empty:
+        per_second = pd.DataFrame(columns=["wall", "ball"], dtype=float)
+    else:
+        per_second = (events.assign(second=np.floor(events["time"]).astype(int))
+                      .groupby(["second", "kind"]).size().unstack(fill_value=0)
+                      .reindex(columns=["wall", "ball"], fill_value=0).astype(float))
+        per_second["ball"] /= 2
+    return per_second, hit_rates(per_second, duration)
+
+
+def hit_rates(per_second, duration):
+    """1秒ごとの衝突回数の表から、全体の平均頻度（回/秒）を求める"""
+    totals = per_second.sum()
+    return {kind: float(totals.get(kind, 0.0)) / duration if duration > 0 else float("nan")
+            for kind in ("wall", "ball")}
+
+
+def occupancy_counts(df, extent, bins=40):
+    """ローカル座標系での滞在回数（行がy・列がx）"""
+    counts, x_edges, y_edges = np.histogram2d(df["x"].to_numpy(), df["y"].to_numpy(), bins=bins,
+                                              range=[[-extent, extent], [-extent, extent]])
+    return counts.T, x_edges, y_edges
+
+
+def occupancy(df, extent, bins=40):
+    """ローカル座標系での滞在頻度（合計1に正規化、行がy・列がx）"""
+    counts, x_edges, y_edges = occupancy_counts(df, extent, bins)
+    total = counts.sum()
+    return (counts / total if total else counts), x_edges, y_edges
+
+
+def save_heatmap(heatmap, path):
+    """ヒートマップを画像（.png など）または .npy として保存"""
+    if path.lower().endswith(".npy"):
+        np.save(path, heatmap)
+        return
+    from PIL import Image
+
+    scaled = heatmap / heatmap.max() if heatmap.max() > 0 else heatmap
+    image = Image.fromarray(np.uint8(np.sqrt(scaled) * 255), mode="L")
+    image.resize((image.width * 8, image.height * 8), Image.NEAREST).save(path)
+
+
+def export_table(reader, frames, path, chunk_frames=DEFAULT_CHUNK_FRAMES, radius=np.nan):
+    """チャンクごとに Parquet / Feather（pyarrowがある場合）または CSV に書き出し、出力先を返す"""
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+        import pyarrow.parquet as pq
+    except ImportError:
+        pa = None
+    if ext in (".parquet", ".feather") and pa is None:
+        path = os.path.splitext(path)[0] + ".csv"
+        print(f"pyarrow がないため CSV で書き出します: {path}")
+        ext = ".csv"
+
+    if ext == ".parquet":
+        writer = None
+        for chunk in iter_chunks(reader, frames, chunk_frames, radius):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+        if writer:
+            writer.close()
+    elif ext == ".feather":
+        # Feather はまとめて書く形式なので、全体を読み込んでから書き出す
+        feather.write_feather(load_dataframe(reader, frames, chunk_frames, radius), path)
+    else:
+        header = True
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            for chunk in iter_chunks(reader, frames, chunk_frames, radius):
+                chunk.to_csv(f, index=False, header=header)
+                header = False
+    return path
+
+
+def analyze(reader, frames, bins=30, heatmap_bins=40, turn_threshold=0.1, chunk_frames=DEFAULT_CHUNK_FRAMES):
+    """集計結果の辞書（表はDataFrameのまま）。ログはチャンクごとに2回読む"""
+    sim = load_simulation(reader.key)
+    scene = sim.scene()
+    half = scene.square_size / 2
+
+    # 1回目: 行数・ボール・時刻・速さと位置の範囲
+    rows, ids = 0, np.empty(0, dtype=np.int32)
+    first_time, last_time = np.inf, -np.inf
+    low, high, extent = np.inf, -np.inf, half
+    for chunk in iter_chunks(reader, frames, chunk_frames, scene.ball_radius):
+        speed = speeds(chunk)
+        rows += len(chunk)
+        ids = np.union1d(ids, chunk["id"].to_numpy())
+        first_time, last_time = min(first_time, chunk["time"].min()), max(last_time, chunk["time"].max())
+        low, high = min(low, speed.min()), max(high, speed.max())
+        extent = max(extent, float(np.abs(chunk[["x", "y"]].to_numpy()).max()))
+    duration = float(last_time - first_time) if rows else 0.0
+    # np.histogram と同じく、すべて同じ値なら ±0.5 の範囲にする
+    span = (low, high) if high > low else (low - 0.5, high + 0.5)
+
+    # 2回目: ヒストグラム・ヒートマップ・エネルギー・衝突を足し込む
+    counts = np.zeros(bins, dtype=np.int64)
+    fine = np.zeros(QUANTILE_BINS, dtype=np.int64)
+    heatmap = np.zeros((heatmap_bins, heatmap_bins))
+    energy, per_second, previous = [], None, None
+    for chunk in iter_chunks(reader, frames, chunk_frames, scene.ball_radius):
+        speed = speeds(chunk)
+        counts += np.histogram(speed, bins, range=span)[0]
+        fine += np.histogram(speed, QUANTILE_BINS, range=span)[0]
+        heatmap += occupancy_counts(chunk, extent, heatmap_bins)[0]
+        energy.append(frame_energy(chunk))
+        # 前のチャンクの最後のフレームを重ねる（そのフレームの衝突は前のチャンクで数えた）
+        window = chunk if previous is None else pd.concat([previous, chunk], ignore_index=True)
+        seconds, _ = event_rates(detect_events(window, half, scene.ball_radius, turn_threshold), 0)
+        per_second = seconds if per_second is None else per_second.add(seconds, fill_value=0)
+        previous = chunk[chunk["frame"] == chunk["frame"].iloc[-1]]
+
+    if rows:
+        edges = np.linspace(*span, bins + 1)
+        histogram = pd.DataFrame({"low": edges[:-1], "high": edges[1:], "count": counts})
+        quantiles = histogram_quantiles(fine, np.linspace(*span, QUANTILE_BINS + 1))
+        quantiles[0.0], quantiles[1.0] = low, high  # 最小と最大は正確な値
+        energy = energy_drift(pd.concat(energy))
+        per_second = per_second.sort_index()
+        heatmap /= heatmap.sum()
+    else:
+        histogram, quantiles = speed_distribution(load_dataframe(reader, []), bins)
+        energy = kinetic_energy(load_dataframe(reader, []))
+        per_second, _ = event_rates(pd.DataFrame(), 0)
+    return {
+        "implementation": reader.key,
+        "velocity_unit": sim.velocity_unit,
+        "frames": len(frames),
+        "rows": rows,
+        "balls": len(ids),
+        "duration": duration,
+        "speed_histogram": histogram,
+        "speed_quantiles": quantiles,
+        "kinetic_energy": energy,
+        "events_per_second": per_second,
+        "rates": hit_rates(per_second, duration),
+        "heatmap": heatmap,
+        "heatmap_extent": extent,
+    }
+
+
+def summary(result):
+    """JSONに書き出せる要約"""
+    energy = result["kinetic_energy"]
+    return {
+        "implementation": result["implementation"],
+        "velocity_unit": result["velocity_unit"],
+        "frames": result["frames"],
+        "rows": result["rows"],
+        "balls": result["balls"],
+        "duration_s": result["duration"],
+        "speed_quantiles": {str(q): float(v) for q, v in result["speed_quantiles"].items()},
+        "ke_drift_final": float(energy["drift"].iloc[-1]) if len(energy) else None,
+        "ke_drift_max_abs": float(energy["drift"].abs().max()) if len(energy) else None,
+        "wall_hits_per_s": result["rates"]["wall"],
+        "ball_hits_per_s": result["rates"]["ball"],
+        "heatmap_extent": result["heatmap_extent"],
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="軌跡ログの統計（速度分布・エネルギー・衝突頻度・滞在分布）")
+    parser.add_argument("trajectory", help="軌跡ログのパス（--trajectory の出力）")
+    parser.add_argument("--start", type=int, default=0, help="最初のフレーム（負の値は末尾から）")
+    parser.add_argument("--end", type=int, default=None, help="最後のフレーム（含まない）")
+    parser.add_argument("--every", type=int, default=1,
+                        help="Nフレームごとに1フレーム使う（衝突の検出は1のときが最も正確）")
+    parser.add_argument("--bins", type=int, default=30, help="速さのヒストグラムのビン数")
+    parser.add_argument("--heatmap-bins", type=int, default=40, help="ヒートマップの分割数")
+    parser.add_argument("--turn-threshold", type=float, default=0.1,
+                        help="衝突とみなす速度変化（速さに対する比）")
+    parser.add_argument("--heatmap", metavar="PATH", help="ヒートマップの出力先（.png / .npy）")
+    parser.add_argument("--export", metavar="PATH",
+                        help="列データの出力先（.parquet / .feather / .csv）")
+    parser.add_argument("--report", metavar="PATH", help="要約のJSONの出力先")
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    reader = TrajectoryReader(args.trajectory)
+    try:
+        if reader.key not in SIMULATIONS:
+            print(f"未知の実装の軌跡ログです: {reader.key}")
+            return 2
+        frames = frame_range(reader, args.start, args.end, max(args.every, 1))
+        result = analyze(reader, frames, args.bins, args.heatmap_bins, args.turn_threshold)
+        if args.export:
+            path = export_table(reader, frames, args.export,
+                                radius=load_simulation(reader.key).scene().ball_radius)
+            print(f"列データを書き出しました: {path}")
+    finally:
+        reader.close()
+
+    report = summary(result)
+    unit = report["velocity_unit"]
+    print(f"実装 {report['implementation']}: {report['frames']}フレーム, ボール {report['balls']}個, "
+          f"{report['duration_s']:.1f}秒")
+    q = result["speed_quantiles"]
+    if len(q):
+        print(f"  速さ（{unit}）: 中央値 {q[0.5]:.2f}, 5% {q[0.05]:.2f}, 95% {q[0.95]:.2f}, 最大 {q[1.0]:.2f}")
+    if report["ke_drift_final"] is not None:
+        print(f"  運動エネルギー（単位質量あたり）の変化: 最終 {report['ke_drift_final']:+.2%}, "
+              f"最大 {report['ke_drift_max_abs']:.2%}")
+    print(f"  衝突頻度: 壁 {report['wall_hits_per_s']:.2f}回/秒, ボール同士 {report['ball_hits_per_s']:.2f}回/秒")
+
+    if args.heatmap:
+        save_heatmap(result["heatmap"], args.heatmap)
+        print(f"ヒートマップを保存しました: {args.heatmap}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"要約を保存しました: {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
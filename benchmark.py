@@ -0,0 +1,215 @@
+import argparse
+import json
+import math
+import platform
+import statistics
+import sys
+import time
+
+import pygame
+
+from implementations import SIMULATIONS, load_simulation
+
+# ---------------------------
+# 実装横断ベンチマーク
+# ---------------------------
+# 同じシードで各実装にN個のボールを生成し、1フレームあたりの
+# update（移動・壁）/ collision（ボール同士）/ render（描画）時間を個別に計測する。
+
+DEFAULT_COUNTS = [10, 100, 1000, 10000]
+STAGES = ("update", "collide", "render")
+DT = 1.0 / 60  # 04のメインループ（60FPS）と同じ固定デルタタイム
+
+
+def run_case(key, count, frames, warmup, seed, max_seconds):
+    """1つの実装・ボール数について計測し、結果の辞書を返す"""
+    sim = load_simulation(key, seed)
+    for _ in range(count):
+        sim.spawn()
+    surface = pygame.Surface(sim.size)
+
+    timings = {stage: [] for stage in STAGES}
+    started = time.perf_counter()
+    for frame in range(warmup + frames):
+        t0 = time.perf_counter()
+        sim.update(DT)
+        t1 = time.perf_counter()
+        sim.collide()
+        t2 = time.perf_counter()
+        sim.draw(surface)
+        t3 = time.perf_counter()
+
+        if frame >= warmup:
+            timings["update"].append(t1 - t0)
+            timings["collide"].append(t2 - t1)
+            timings["render"].append(t3 - t2)
+        # 時間予算を超えたら打ち切る（計測済みフレームが1つ以上あれば）
+        if frame >= warmup and time.perf_counter() - started > max_seconds:
+            break
+
+    result = {"implementation": key, "balls": count, "frames": len(timings["update"])}
+    for stage, values in timings.items():
+        result[f"{stage}_ms"] = statistics.median(values) * 1000
+        result[f"{stage}_mean_ms"] = statistics.fmean(values) * 1000
+    result["total_ms"] = sum(result[f"{stage}_ms"] for stage in STAGES)
+    return result
+
+
+def scaling_exponent(n1, t1, n2, t2):
+    """2点間の両対数の傾き（1なら線形、2なら二乗）"""
+    if t1 <= 0 or t2 <= 0:
+        return None
+    return math.log(t2 / t1) / math.log(n2 / n1)
+
+
+def run_benchmark(keys, counts, frames, warmup, seed, max_seconds, max_case_seconds):
+    results = []
+    for key in keys:
+        previous = None
+        for count in counts:
+            if previous is not None:
+                # 直前の結果から1フレームの時間を予測し、長すぎる場合はスキップ
+                exponent = previous.get("exponent") or 2.0
+                predicted = previous["total_ms"] / 1000 * (count / previous["balls"]) ** max(exponent, 1.0)
+                if predicted > max_case_seconds:
+                    print(f"  {key} N={count}: スキップ（予測 {predicted:.1f} 秒/フレーム）")
+                    results.append({"implementation": key, "balls": count, "skipped": True,
+                                    "predicted_ms": predicted * 1000})
+                    break
+            print(f"  {key} N={count} を計測中...")
+            result = run_case(key, count, frames, warmup, seed, max_seconds)
+            if previous is not None:
+                result["exponent"] = scaling_exponent(previous["balls"], previous["total_ms"],
+                                                      count, result["total_ms"])
+            results.append(result)
+            previous = result
+    return results
+
+
+def format_table(results, counts):
+    """実装×ボール数のスケーリング表（ms/フレームと傾き）"""
+    by_key = {}
+    for result in results:
+        by_key.setdefault(result["implementation"], {})[result["balls"]] = result
+
+    header = "impl  stage   " + "".join(f"{f'N={n}':>14}" for n in counts)
+    lines = [header, "-" * len(header)]
+    for key, row in by_key.items():
+        for stage in STAGES + ("total",):
+            cells = []
+            for n in counts:
+                result = row.get(n)
+                if result is None:
+                    cells.append(f"{'-':>14}")
+                elif result.get("skipped"):
+                    cells.append(f"{'skip':>14}")
+                else:
+                    cells.append(f"{result[f'{stage}_ms']:>11.3f}ms")
+            lines.append(f"{key:<6}{stage:<8}" + "".join(cells))
+        slopes = []
+        for n in counts:
+            exponent = row.get(n, {}).get("exponent")
+            if exponent is None:
+                slopes.append(f"{'':>14}")
+            else:
+                mark = " (二乗的)" if exponent > 1.6 else ""
+                slopes.append(f"{f'x{exponent:.2f}{mark}':>14}")
+        lines.append(f"{key:<6}{'slope':<8}" + "".join(slopes))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def compare_to_baseline(results, baseline, tolerance, min_ms):
+    """ベースラインより遅くなったステージを列挙"""
+    reference = {(r["implementation"], r["balls"]): r
+                 for r in baseline["results"] if not r.get("skipped")}
+    regressions = []
+    for result in results:
+        base = reference.get((result["implementation"], result["balls"]))
+        if base is None or result.get("skipped"):
+            continue
+        for stage in STAGES:
+            now, before = result[f"{stage}_ms"], base[f"{stage}_ms"]
+            if now > before * (1 + tolerance) and now - before > min_ms:
+                regressions.append({"implementation": result["implementation"],
+                                    "balls": result["balls"], "stage": stage,
+                                    "baseline_ms": before, "current_ms": now,
+                                    "ratio": now / before if before > 0 else math.inf})
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="4つの実装のスケーリングベンチマーク")
+    parser.add_argument("--implementations", nargs="+", default=list(SIMULATIONS),
+                        choices=list(SIMULATIONS), help="計測する実装")
+    parser.add_argument("--counts", nargs="+", type=int, default=DEFAULT_COUNTS,
+                        help="ボール数")
+    parser.add_argument("--frames", type=int, default=30, help="計測フレーム数")
+    parser.add_argument("--warmup", type=int, default=2, help="計測前に捨てるフレーム数")
+    parser.add_argument("--seed", type=int, default=12345, help="乱数シード")
+    parser.add_argument("--max-seconds", type=float, default=10.0,
+                        help="1ケースあたりの計測時間の上限（秒）")
+    parser.add_argument("--max-case-seconds", type=float, default=30.0,
+                        help="予測される1フレームの時間がこれを超えるケースはスキップ")
+    parser.add_argument("--output", default="benchmark_report.json", help="JSONレポートの出力先")
+    parser.add_argument("--save-baseline", metavar="PATH", help="結果をベースラインとして保存")
+    parser.add_argument("--baseline", metavar="PATH", help="比較するベースライン")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="回帰とみなす悪化率（0.25 = 25%%）")
+    parser.add_argument("--min-ms", type=float, default=0.05,
+                        help="回帰とみなす最小の差（ms）")
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    counts = sorted(args.counts)
+
+    print("ベンチマークを開始します...")
+    results = run_benchmark(args.implementations, counts, args.frames, args.warmup,
+                            args.seed, args.max_seconds, args.max_case_seconds)
+    report = {
+        "meta": {
+            "seed": args.seed,
+            "frames": args.frames,
+            "warmup": args.warmup,
+            "python": sys.version.split()[0],
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+    print()
+    print(format_table(results, counts))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"レポートを保存しました: {args.output}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"ベースラインを保存しました: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance, args.min_ms)
+        report["regressions"] = regressions
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        if regressions:
+            print(f"回帰を検出しました（{len(regressions)}件）:")
+            for r in regressions:
+                print(f"  {r['implementation']} N={r['balls']} {r['stage']}: "
+                      f"{r['baseline_ms']:.3f}ms -> {r['current_ms']:.3f}ms (x{r['ratio']:.2f})")
+            return 1
+        print("回帰はありません")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
@@ -0,0 +1,208 @@
+import argparse
+import json
+import math
+import os
+import queue
+import struct
+import sys
+import threading
+from dataclasses import dataclass, field
+from typing import Dict
+
+import numpy as np
+
+from seeding import SpawnStreams
+
+# ---------------------------
+# チェックポイント（状態の保存と復元）
+# ---------------------------
+# ボール・タイマー・回転角・乱数の状態・フレーム数をまとめてバイナリに
+# 保存し、そこから実行を再開できるようにする。ボールの値は各スクリプトの
+# 元の表現（04ならローカル座標、02なら正方形の角が原点の座標）のまま
+# float64 で持つので、--fixed-dt で実行すれば再開後もビット単位で同じ結果になる。
+#
+# ファイル構成（すべてリトルエンディアン）:
+#   ヘッダ（48バイト）
+#   メタデータ      JSON（列名・タイマーやカウンタの値・乱数の版）
+#   乱数の状態      ストリームごとに 625 × u32 + gauss_next(f64、なければNaN)
+#   ボールの値      列ごとに float64 × count
+#   色              count × RGB(u8)
+#
+# 定期的な保存では、状態の取り出し（コピー）だけをメインループで行い、
+# 書き出しはバックグラウンドのスレッドに任せる。
+
+MAGIC = b"CHKPNT\x00\x00"
+VERSION = 1
+HEADER = struct.Struct("<8sHH8sQdII4x")  # magic, version, flags, key, frame, angle, count, metadata
+RNG_WORDS = 625
+RNG = struct.Struct(f"<{RNG_WORDS}Id")
+
+
+def add_checkpoint_arguments(parser):
+    """--checkpoint / --restore 関連の引数を追加"""
+    group = parser.add_argument_group("checkpoint")
+    group.add_argument("--checkpoint", metavar="PATH",
+                       help="チェックポイントの保存先（{frame} を含めるとフレームごとに別ファイル）")
+    group.add_argument("--checkpoint-every", type=int, default=600, metavar="N",
+                       help="Nフレームごとに保存する（0で終了時のみ）")
+    group.add_argument("--restore", metavar="PATH", help="チェックポイントから再開する")
+    group.add_argument("--fixed-dt", type=float, default=None, metavar="SECONDS",
+                       help="時計を使わず毎フレームこの時間だけ進める（再開後の結果を再現するため）")
+    return parser
+
+
+@dataclass
+class Checkpoint:
+    """ある時点の完全な状態"""
+    key: str
+    frame: int
+    angle: float
+    columns: Dict[str, np.ndarray]    # ボールの値（列名 → float64 の配列）
+    colors: np.ndarray                # (N, 3) uint8
+    rng: dict                         # SpawnStreams.getstate() の値
+    values: dict = field(default_factory=dict)  # タイマーやカウンタ
+
+    def __len__(self):
+        return len(self.colors)
+
+    def rows(self, *names):
+        """ボールごとに (列の値..., 色) を Python の float / tuple で返す"""
+        columns = [self.columns[name].tolist() for name in names]
+        colors = [tuple(color) for color in self.colors.tolist()]
+        return list(zip(*columns, colors))
+
+    def to_bytes(self):
+        names = list(self.columns)
+        metadata = json.dumps({"columns": names, "values": self.values,
+                               "rng_versions": [self.rng[name][0] for name in SpawnStreams.NAMES]},
+                              ensure_ascii=False).encode("utf-8")
+        parts = [HEADER.pack(MAGIC, VERSION, 0, self.key.encode("ascii"), self.frame, self.angle,
+                             len(self), len(metadata)), metadata]
+        for name in SpawnStreams.NAMES:
+            _, words, gauss = self.rng[name]
+            parts.append(RNG.pack(*words, float("nan") if gauss is None else gauss))
+        parts.extend(np.ascontiguousarray(self.columns[name], dtype="<f8").tobytes() for name in names)
+        parts.append(np.ascontiguousarray(self.colors, dtype=np.uint8).tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, _, key, frame, angle, count, length = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("チェックポイントのファイルではありません（または未対応の版です）")
+        offset = HEADER.size
+        metadata = json.loads(bytes(data[offset:offset + length]).decode("utf-8"))
+        offset += length
+        rng = {}
+        for name, rng_version in zip(SpawnStreams.NAMES, metadata["rng_versions"]):
+            *words, gauss = RNG.unpack_from(data, offset)
+            rng[name] = (rng_version, tuple(words), None if math.isnan(gauss) else gauss)
+            offset += RNG.size
+        columns = {}
+        for name in metadata["columns"]:
+            columns[name] = np.frombuffer(data, "<f8", count, offset).astype(np.float64)
+            offset += count * 8
+        colors = np.frombuffer(data, np.uint8, count * 3, offset).reshape(count, 3).copy()
+        return cls(key.rstrip(b"\x00").decode("ascii"), frame, angle, columns, colors, rng,
+                   metadata["values"])
+
+
+def _attribute(obj, path):
+    for name in path.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+
+def capture(key, balls, fields, frame, angle, rng, **values):
+    """スクリプトの状態をコピーしてチェックポイントを作る（fields は "position.x" のような属性名）"""
+    columns = {name: np.array([_attribute(ball, name) for ball in balls], dtype=np.float64)
+               for name in fields}
+    colors = np.array([ball.color for ball in balls], dtype=np.uint8).reshape(-1, 3)
+    return Checkpoint(key, frame, angle, columns, colors, rng.getstate(), values)
+
+
+def save(checkpoint, path):
+    """一時ファイルに書いてから置き換える（書き込み中に読まれても壊れたファイルを見せない）"""
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(checkpoint.to_bytes())
+    os.replace(temporary, path)
+
+
+def load(path, key=None):
+    with open(path, "rb") as f:
+        checkpoint = Checkpoint.from_bytes(f.read())
+    if key is not None and checkpoint.key != key:
+        raise ValueError(f"{path} は {checkpoint.key} のチェックポイントです（{key} では再開できません）")
+    return checkpoint
+
+
+class CheckpointWriter:
+    """チェックポイントをバックグラウンドのスレッドで書き出す"""
+
+    def __init__(self, path, every=0):
+        self.path = path
+        self.every = every
+        self.saved = []
+        self.error = None
+        # 書き出しが追いつかないときは、メインループを待たせて保存を取りこぼさない
+        self.queue = queue.Queue(maxsize=2)
+        self.thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def from_args(cls, args):
+        """--checkpoint が指定されていなければ None"""
+        if not getattr(args, "checkpoint", None):
+            return None
+        return cls(args.checkpoint, args.checkpoint_every)
+
+    def due(self, frame):
+        return bool(self.every) and frame % self.every == 0
+
+    def submit(self, checkpoint):
+        if self.error:
+            raise self.error
+        self.queue.put(checkpoint)
+
+    def _run(self):
+        while True:
+            checkpoint = self.queue.get()
+            if checkpoint is None:
+                return
+            path = self.path.format(frame=checkpoint.frame)
+            try:
+                save(checkpoint, path)
+                self.saved.append(path)
+            except OSError as error:
+                self.error = error
+
+    def close(self, final=None):
+        """final を保存してからスレッドを終了"""
+        if final is not None:
+            self.submit(final)
+        self.queue.put(None)
+        self.thread.join()
+        if self.error:
+            raise self.error
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="チェックポイントの内容を表示")
+    parser.add_argument("checkpoint", help="チェックポイントのパス")
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    checkpoint = load(args.checkpoint)
+    print(f"{checkpoint.key}: フレーム {checkpoint.frame}, 角度 {checkpoint.angle:.6f} rad, "
+          f"ボール {len(checkpoint)}個, {os.path.getsize(args.checkpoint)} バイト")
+    for name, value in checkpoint.values.items():
+        print(f"  {name} = {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
@@ -0,0 +1,322 @@
+import argparse
+import json
+import math
+import sys
+import time
+
+import numpy as np
+
+from implementations import SimState, load_module, load_simulation, require_uniform
+
+# ---------------------------
+# アンサンブル実行（多数のコンテナを1つの配列でまとめて計算）
+# ---------------------------
+# 04_o3_improved_collision.py と同じシーン（ローカル座標系の物理）を
+# K個のコンテナ × 最大N個のボールの配列 (K, N, 2) で持ち、壁と球同士の
+# 衝突を全コンテナまとめてベクトル演算で処理する。ボール数が異なる
+# コンテナは alive マスクで表す。
+#
+# 球同士の衝突は、ペアを1つずつ順に処理する04と違い、同じステップの
+# 開始時点の位置・速度から全ペアの補正を求めて足し合わせる（ヤコビ法）。
+# 1つのボールが同時に1組としか重なっていなければ結果は04と一致する。
+
+MODULE = "04"
+PAIR_BLOCK_ELEMENTS = 1 << 21  # 距離判定で一度に扱う (K, N, N) の要素数の上限
+
+
+class Ensemble:
+    """K個のコンテナ × 最大N個のボール"""
+
+    def __init__(self, positions, velocities, colors, alive, rotation_speeds=None, module=None):
+        self.module = module or load_module(MODULE)
+        self.positions = np.asarray(positions, dtype=np.float64)    # (K, N, 2)
+        self.velocities = np.asarray(velocities, dtype=np.float64)  # (K, N, 2)
+        self.colors = np.asarray(colors, dtype=np.uint8)            # (K, N, 3)
+        self.alive = np.asarray(alive, dtype=bool)                   # (K, N)
+        k = len(self.positions)
+        speeds = self.module.ROTATION_SPEED if rotation_speeds is None else rotation_speeds
+        self.rotation_speeds = np.broadcast_to(np.asarray(speeds, dtype=np.float64), (k,)).copy()
+        self.angles = np.zeros(k)
+        self.pending = np.zeros((k, 0), dtype=bool)  # 生成待ちのボール（spawn_interval 用）
+        self.spawn_interval = None
+        self.spawn_timer = 0.0
+
+    @classmethod
+    def from_seeds(cls, seeds, counts, rotation_speeds=None, capacity=None, spawn_interval=None):
+        """コンテナごとのシードで04の spawn_ball() と同じ順にボールを生成
+
+        spawn_interval を指定すると、最初は counts 個だけを置き、残りの枠
+        （capacity まで）は04と同じく一定間隔で1つずつ追加する。
+        """
+        module = load_module(MODULE)
+        counts = np.broadcast_to(np.asarray(counts, dtype=int), (len(seeds),))
+        capacity = int(max(counts.max(initial=0), capacity or 0))
+        shape = (len(seeds), capacity)
+        positions, velocities = np.zeros(shape + (2,)), np.zeros(shape + (2,))
+        colors = np.zeros(shape + (3,), dtype=np.uint8)
+        for k, seed in enumerate(seeds):
+            module.spawn_rng.reseed(seed)
+            for i in range(capacity if spawn_interval else counts[k]):
+                ball = module.spawn_ball()
+                positions[k, i] = (ball.x, ball.y)
+                velocities[k, i] = (ball.vx, ball.vy)
+                colors[k, i] = ball.color
+        alive = np.arange(capacity)[None, :] < counts[:, None]
+        ensemble = cls(positions, velocities, colors, alive, rotation_speeds, module)
+        if spawn_interval:
+            ensemble.spawn_interval = spawn_interval
+            ensemble.pending = ~alive
+        return ensemble
+
+    @classmethod
+    def from_states(cls, states, capacity=None):
+        """SimStateのリストから生成（足りない枠は alive=False で埋める）
+
+        半径は04の BALL_RADIUS、質量は等しいものとして計算するので、
+        ボールごとに半径や質量が違う状態なら ValueError。
+        """
+        module = load_module(MODULE)
+        for state in states:
+            require_uniform(state, module.BALL_RADIUS)
+        capacity = max([len(s) for s in states] + [capacity or 0])
+        shape = (len(states), capacity)
+        positions, velocities = np.zeros(shape + (2,)), np.zeros(shape + (2,))
+        colors = np.zeros(shape + (3,), dtype=np.uint8)
+        alive = np.zeros(shape, dtype=bool)
+        for k, state in enumerate(states):
+            n = len(state)
+            positions[k, :n], velocities[k, :n] = state.positions, state.velocities
+            colors[k, :n], alive[k, :n] = state.colors, True
+        ensemble = cls(positions, velocities, colors, alive, module=module)
+        ensemble.angles = np.array([s.angle for s in states], dtype=np.float64)
+        return ensemble
+
+    def __len__(self):
+        return len(self.positions)
+
+    @property
+    def ball_count(self):
+        return int(self.alive.sum())
+
+    def update(self, dt):
+        """移動と壁との衝突（04の Ball.update と同じ処理を全ボールに）"""
+        self.angles += self.rotation_speeds * dt
+        self.positions += self.velocities * dt
+        limit = self.module.SQUARE_HALF - self.module.BALL_RADIUS
+        over = self.positions > limit
+        under = self.positions < -limit
+        self.positions = np.where(over, limit, np.where(under, -limit, self.positions))
+        self.velocities = np.where(over | under, -self.velocities, self.velocities)
+
+        if self.spawn_interval:
+            self.spawn_timer += dt
+            if self.spawn_timer >= self.spawn_interval:
+                self.spawn_timer = 0.0
+                # 各コンテナで生成待ちの最初の枠を有効にする
+                has_pending = self.pending.any(axis=1)
+                first = self.pending.argmax(axis=1)
+                rows = np.nonzero(has_pending)[0]
+                self.alive[rows, first[rows]] = True
+                self.pending[rows, first[rows]] = False
+
+    def collide(self):
+        """球同士の衝突を全コンテナまとめて処理（ヤコビ法）"""
+        k_count, n = self.alive.shape
+        if n < 2:
+            return
+        # 距離の判定だけを (K, N, N) で行い、重なったペアだけを詳しく計算する。
+        # 配列が大きくなりすぎないよう、コンテナをブロックに分ける
+        block = max(1, PAIR_BLOCK_ELEMENTS // (n * n))
+        pairs = [self._touching_pairs(start, min(start + block, k_count))
+                 for start in range(0, k_count, block)]
+        k = np.concatenate([p[0] for p in pairs])
+        if not len(k):
+            return
+        i = np.concatenate([p[1] for p in pairs])
+        j = np.concatenate([p[2] for p in pairs])
+
+        radius = self.module.BALL_RADIUS
+        dx = self.positions[k, i, 0] - self.positions[k, j, 0]
+        dy = self.positions[k, i, 1] - self.positions[k, j, 1]
+        dist = np.hypot(dx, dy)
+        # 距離0のときは04と同じく法線を (1, 0) にする
+        with np.errstate(invalid="ignore", divide="ignore"):
+            nx = np.where(dist > 0, dx / dist, 1.0)
+            ny = np.where(dist > 0, dy / dist, 0.0)
+
+        # 重なり補正：各ボールを半分ずつ押し戻す
+        correction = (2 * radius - dist) / 2
+        # 衝突応答：近づいているペアだけ法線方向の相対速度を交換
+        v_rel = ((self.velocities[k, i, 0] - self.velocities[k, j, 0]) * nx
+                 + (self.velocities[k, i, 1] - self.velocities[k, j, 1]) * ny)
+        impulse = np.where(v_rel < 0, -v_rel, 0.0)
+
+        # ペアごとの補正をボールごとに足し合わせる（i には +、j には -）
+        size = k_count * n
+        flat_i, flat_j = k * n + i, k * n + j
+
+        def accumulate(values):
+            delta = np.bincount(flat_i, values, size) - np.bincount(flat_j, values, size)
+            return delta.reshape(k_count, n)
+
+        self.positions[..., 0] += accumulate(nx * correction)
+        self.positions[..., 1] += accumulate(ny * correction)
+        self.velocities[..., 0] += accumulate(nx * impulse)
+        self.velocities[..., 1] += accumulate(ny * impulse)
+
+    def _touching_pairs(self, start, stop):
+        """コンテナ start〜stop-1 で重なっているペア (k, i, j)（i < j）"""
+        radius = self.module.BALL_RADIUS
+        x = self.positions[start:stop, :, 0]
+        y = self.positions[start:stop, :, 1]
+        dx = x[:, :, None] - x[:, None, :]
+        dy = y[:, :, None] - y[:, None, :]
+        # 平方根を取らずに候補を絞り、境界付近は04と同じ hypot で判定し直す
+        near = dx * dx + dy * dy < (2 * radius) ** 2 * (1 + 1e-9)
+        alive = self.alive[start:stop]
+        n = alive.shape[1]
+        near &= alive[:, :, None] & alive[:, None, :] & np.triu(np.ones((n, n), dtype=bool), 1)
+        k, i, j = np.nonzero(near)
+        exact = np.hypot(dx[k, i, j], dy[k, i, j]) < 2 * radius
+        return k[exact] + start, i[exact], j[exact]
+
+    def step(self, dt):
+        self.update(dt)
+        self.collide()
+
+    def state(self, k):
+        """k番目のコンテナをSimStateとして取り出す"""
+        mask = self.alive[k]
+        return SimState(float(self.angles[k]), np.nonzero(mask)[0].astype(np.int64),
+                        self.positions[k, mask].copy(), self.velocities[k, mask].copy(),
+                        self.colors[k, mask].copy())
+
+    def render(self, surface, columns=None, background=(30, 30, 30)):
+        """全コンテナをタイル状に並べて1枚のサーフェスに描画"""
+        import pygame
+
+        k = len(self)
+        columns = columns or math.ceil(math.sqrt(k))
+        rows = math.ceil(k / columns)
+        width, height = surface.get_size()
+        tile = min(width / columns, height / rows)
+        # 回転しても隣のタイルにはみ出さないよう、対角線がタイルに収まる大きさにする
+        scale = tile * 0.95 / (self.module.SQUARE_SIZE * math.sqrt(2))
+        radius = max(1, round(self.module.BALL_RADIUS * scale))
+        half = self.module.SQUARE_HALF
+
+        surface.fill(background)
+        corners = np.array([(-half, -half), (half, -half), (half, half), (-half, half)])
+        cos_a, sin_a = np.cos(self.angles), np.sin(self.angles)
+        for index in range(k):
+            cx = (index % columns + 0.5) * tile
+            cy = (index // columns + 0.5) * tile
+            c, s = cos_a[index], sin_a[index]
+            outline = [(cx + (x * c - y * s) * scale, cy + (x * s + y * c) * scale) for x, y in corners]
+            pygame.draw.polygon(surface, (200, 200, 200), outline, 1)
+            mask = self.alive[index]
+            local = self.positions[index, mask]
+            xs = cx + (local[:, 0] * c - local[:, 1] * s) * scale
+            ys = cy + (local[:, 0] * s + local[:, 1] * c) * scale
+            for x, y, color in zip(xs.astype(int), ys.astype(int), self.colors[index, mask]):
+                pygame.draw.circle(surface, color, (x, y), radius)
+
+
+class EnsembleEngine:
+    """oracle.py の候補エンジン用（コンテナ1つのアンサンブル）"""
+
+    def __init__(self):
+        self.ensemble = None
+        self.ids = np.zeros(0, dtype=np.int64)
+
+    def load_state(self, state):
+        self.ensemble = Ensemble.from_states([state])
+        self.ids = state.ids.copy()
+
+    def step(self, dt):
+        self.ensemble.step(dt)
+
+    def state(self):
+        state = self.ensemble.state(0)
+        state.ids = self.ids.copy()
+        return state
+
+
+def make_engine():
+    return EnsembleEngine()
+
+
+def measure(containers, balls, frames, dt, seed, rotation_speeds):
+    """K個のコンテナを frames ステップ進め、ボール・ステップ/秒と所要時間、アンサンブルを返す"""
+    speeds = np.resize(np.radians(rotation_speeds), containers)
+    ensemble = Ensemble.from_seeds([seed + k for k in range(containers)], balls, speeds)
+    ensemble.step(dt)  # 1回目は配列の確保などを含むので除く
+    started = time.perf_counter()
+    for _ in range(frames):
+        ensemble.step(dt)
+    elapsed = time.perf_counter() - started
+    return ensemble.ball_count * frames / elapsed, elapsed, ensemble
+
+
+def measure_scalar(balls, frames, dt, seed):
+    """比較用：04をそのまま1コンテナ分実行したときのボール・ステップ/秒"""
+    sim = load_simulation(MODULE, seed)
+    for _ in range(balls):
+        sim.spawn()
+    started = time.perf_counter()
+    for _ in range(frames):
+        sim.step(dt)
+    elapsed = time.perf_counter() - started
+    return balls * frames / elapsed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="04のシーンを多数のコンテナでまとめて実行")
+    parser.add_argument("--containers", nargs="+", type=int, default=[1, 10, 100, 1000],
+                        help="コンテナ数K（複数指定でスケーリングを計測）")
+    parser.add_argument("--balls", type=int, default=20, help="コンテナあたりのボール数N")
+    parser.add_argument("--frames", type=int, default=100, help="計測するステップ数")
+    parser.add_argument("--dt", type=float, default=1.0 / 60, help="1ステップの時間（秒）")
+    parser.add_argument("--seed", type=int, default=12345, help="最初のコンテナのシード（以降は+1ずつ）")
+    parser.add_argument("--rotation-speeds", nargs="+", type=float, default=[10.0],
+                        help="正方形の回転速度（度/秒、コンテナに順に割り当てる）")
+    parser.add_argument("--render", metavar="PATH",
+                        help="最後のKについて、計測後のフレームをタイル状に並べた画像として保存")
+    parser.add_argument("--render-size", type=int, nargs=2, default=[1200, 1200],
+                        metavar=("W", "H"), help="タイル画像の大きさ")
+    parser.add_argument("--output", metavar="PATH", help="JSONレポートの出力先")
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    scalar = measure_scalar(args.balls, args.frames, args.dt, args.seed)
+    print(f"04（1プロセス・1コンテナ）: {scalar:,.0f} ボール・ステップ/秒")
+
+    results = []
+    ensemble = None
+    for k in args.containers:
+        rate, elapsed, ensemble = measure(k, args.balls, args.frames, args.dt, args.seed,
+                                          args.rotation_speeds)
+        results.append({"containers": k, "balls": args.balls, "frames": args.frames,
+                        "ball_steps_per_s": rate, "seconds": elapsed, "speedup": rate / scalar})
+        print(f"K={k:>6}: {rate:>14,.0f} ボール・ステップ/秒（04の {rate / scalar:.1f}倍）")
+
+    if args.render and ensemble is not None:
+        import pygame
+
+        surface = pygame.Surface(tuple(args.render_size))
+        ensemble.render(surface)
+        pygame.image.save(surface, args.render)
+        print(f"タイル画像を保存しました: {args.render}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"scalar_ball_steps_per_s": scalar, "results": results}, f,
+                      indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
@@ -0,0 +1,161 @@
+import argparse
+import os
+import struct
+import sys
+
+import numpy as np
+
+from implementations import load_simulation
+from replay import frame_range, source_fps
+from trajectory import TrajectoryReader
+
+# ---------------------------
+# ブラウザ再生用のバイナリ書き出し
+# ---------------------------
+# 軌跡ログを playback.html（p5.js）で再生できるコンパクトなバイナリに変換する。
+# ブラウザ側では物理計算をせず、フレーム間を補間して描くだけにする。
+#
+# ファイル構成（すべてリトルエンディアン）:
+#   ヘッダ（64バイト）
+#   パレット            palette_size × RGB(u8)、4バイト境界まで詰め物
+#   オフセット表        (frame_count + 1) × u32（各フレームの先頭、最後はファイル末尾）
+#   フレーム            time(f32) angle(f32) count(u32)
+#                       ids(u16 × count) positions(u16 × count × 2)
+#                       radii(u16 × count、フラグのビット1のときだけ) colors(u8 or u16 × count)
+#                       4バイト境界まで詰め物
+#
+# 位置は正方形のローカル座標を [-extent, extent] の範囲で16ビットに量子化する。
+# 色はパレットの番号で持つ（257色以上ならu16、フラグのビット0）。
+# ボールごとの半径は、シーンの半径と違うボールがあるときだけ 1/RADIUS_SCALE px
+# 単位で持つ（フラグのビット1）。なければヘッダの半径ですべてのボールを描く。
+
+MAGIC = b"BBW1"
+VERSION = 1
+HEADER = struct.Struct("<4sHHHHffffffIHBx3s3s2x12x")
+FRAME = struct.Struct("<ffI")
+FLAG_WIDE_COLORS = 1
+FLAG_RADII = 2
+QUANT_MAX = 65535
+RADIUS_SCALE = 64
+
+
+def _pad4(data):
+    return data + b"\x00" * (-len(data) % 4)
+
+
+def position_extent(reader, frames, minimum):
+    """量子化の範囲（ローカル座標の絶対値の最大、正方形からはみ出すボールも含む）"""
+    extent = minimum
+    for i in frames:
+        positions = reader[i].positions
+        if len(positions):
+            extent = max(extent, float(np.abs(positions).max()))
+    return extent
+
+
+def quantize(positions, extent):
+    """ローカル座標を u16 に量子化"""
+    scaled = (positions.astype(np.float64) + extent) / (2 * extent) * QUANT_MAX
+    return np.clip(np.rint(scaled), 0, QUANT_MAX).astype("<u2")
+
+
+def quantize_radii(radii, radius):
+    """半径を 1/RADIUS_SCALE px 単位の u16 にする（記録されていないボールは radius）"""
+    radii = np.nan_to_num(np.asarray(radii, dtype=np.float64), nan=radius)
+    return np.clip(np.rint(radii * RADIUS_SCALE), 0, 0xFFFF).astype("<u2")
+
+
+def encode_frame(record, palette_index, extent, color_dtype, radius=None):
+    """1フレームを書き出す（radius を渡すとボールごとの半径も書き、記録のないボールはその値にする）"""
+    if len(record.ids) and int(record.ids.max()) > 0xFFFF:
+        raise ValueError("ボールIDが65535を超えるため書き出せません")
+    ids = record.ids.astype("<u2")
+    colors = np.array([palette_index[int(i)] for i in record.ids], dtype=color_dtype)
+    parts = [FRAME.pack(record.time, record.angle, len(ids)), ids.tobytes(),
+             quantize(record.positions, extent).tobytes()]
+    if radius is not None:
+        radii = np.full(len(ids), radius) if record.radii is None else record.radii
+        parts.append(quantize_radii(radii, radius).tobytes())
+    parts.append(colors.tobytes())
+    return _pad4(b"".join(parts))
+
+
+def export(reader, frames, output, fps):
+    """選んだフレームを書き出し、ファイルサイズを返す"""
+    scene = load_simulation(reader.key).scene()
+    # ボールごとの半径（04）は、シーンの半径と違うものがあるときだけ書く
+    radii = set(reader.radii.values())
+    per_ball = bool(radii - {scene.ball_radius})
+    largest = max(radii | {scene.ball_radius})
+    extent = position_extent(reader, frames, scene.square_size / 2) + largest
+
+    # パレットは初めて現れた順（書き込み中のログなら、ここまでに現れた色）
+    lookup = {color: i for i, color in enumerate(dict.fromkeys(reader.colors.values()))}
+    palette = list(lookup)
+    palette_index = {ball_id: lookup[color] for ball_id, color in reader.colors.items()}
+    wide = len(palette) > 256
+    color_dtype = "<u2" if wide else "u1"
+
+    flags = (FLAG_WIDE_COLORS if wide else 0) | (FLAG_RADII if per_ball else 0)
+    header = HEADER.pack(MAGIC, VERSION, flags,
+                         scene.size[0], scene.size[1], scene.center[0], scene.center[1],
+                         scene.square_size, scene.ball_radius, fps, extent, len(frames),
+                         len(palette), scene.outline_width,
+                         bytes(scene.background), bytes(scene.outline))
+    palette_bytes = _pad4(b"".join(bytes(color) for color in palette))
+
+    offset = len(header) + len(palette_bytes) + (len(frames) + 1) * 4
+    offsets, bodies = [], []
+    for i in frames:
+        body = encode_frame(reader[i], palette_index, extent, color_dtype,
+                            scene.ball_radius if per_ball else None)
+        offsets.append(offset)
+        bodies.append(body)
+        offset += len(body)
+    offsets.append(offset)
+
+    with open(output, "wb") as f:
+        f.write(header)
+        f.write(palette_bytes)
+        f.write(np.array(offsets, dtype="<u4").tobytes())
+        for body in bodies:
+            f.write(body)
+    return os.path.getsize(output)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="軌跡ログをブラウザ再生用のバイナリに書き出す")
+    parser.add_argument("trajectory", help="軌跡ログのパス（--trajectory の出力）")
+    parser.add_argument("--output", default="trajectory.bbw", help="出力先")
+    parser.add_argument("--start", type=int, default=0, help="最初のフレーム（負の値は末尾から）")
+    parser.add_argument("--end", type=int, default=None, help="最後のフレーム（含まない）")
+    parser.add_argument("--every", type=int, default=1, help="Nフレームごとに1フレーム書き出す")
+    parser.add_argument("--fps", type=float, default=None,
+                        help="元のフレームレート（省略時は記録時刻から推定）")
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    if args.every < 1:
+        print("--every は1以上を指定してください")
+        return 2
+    reader = TrajectoryReader(args.trajectory)
+    try:
+        frames = frame_range(reader, args.start, args.end, args.every)
+        if not frames:
+            print("書き出すフレームがありません")
+            return 1
+        fps = (args.fps or source_fps(reader, frames.start, frames.stop)) / args.every
+        size = export(reader, frames, args.output, fps)
+    finally:
+        reader.close()
+    print(f"{args.output} を書き出しました: {len(frames)}フレーム, {size / 1024:.1f} KiB "
+          f"（{size / len(frames):.0f} バイト/フレーム）")
+    print(f"再生: playback.html?src={args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
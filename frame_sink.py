@@ -0,0 +1,406 @@
+import argparse
+import queue
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+import pygame
+
+# ---------------------------
+# 生のフレームを外部のプログラムへ渡す（パイプ・共有メモリのリングバッファ）
+# ---------------------------
+# *_90s_gif.py からフレームを取り出す方法は、実行の終わりに書き出される GIF
+# だけだった。--sink を付けると、描画したフレームをその場で次のどちらかへ流す。
+#
+#   pipe  ヘッダ（FRAME_HEADER）と画素を続けて標準出力か名前付きパイプへ書く
+#   shm   共有メモリのリングバッファ（--sink-slots 枚）に書き、通し番号を付ける
+#
+# 画素は RGB（幅×高さ×3バイト）か、パレット（768バイト）＋インデックス
+# （幅×高さバイト）。遅い読み手への対応は --sink-policy で選ぶ。
+#
+#   block  読み手が追いつくまで待つ（--sink-timeout 秒を過ぎたらそのフレームを捨て、
+#          読み手が進むまでは待たずに捨てる）
+#   drop   待たずにフレームを捨てる（共有メモリでは古いスロットを上書きし、
+#          読み手は通し番号の飛びで取りこぼしを知る）
+#
+# パイプへの書き込みは別スレッドで行い、メインループとの間に --sink-slots 枚の
+# キューを置く。標準出力に流すときは、画素と混ざらないようにスクリプトの
+# 表示を標準エラー出力へ回す。
+#
+# 共有メモリのレイアウト:
+#   RING_HEADER  マジック, 版, 幅, 高さ, 形式, スロット数, スロットの大きさ,
+#                書いた通し番号, 読み終えた通し番号（block のとき読み手が更新）
+#   スロット     SLOT_HEADER（通し番号, フレーム番号）＋画素
+# 書き手はスロットの通し番号を0にしてから画素を書き、最後に番号を入れる。
+# 読み手は読む前と後で番号が変わっていないことを確かめる（seqlock）。
+# RingReader は画素を NumPy 配列としてコピーせずに参照する。
+
+FORMATS = ("rgb", "indexed")
+POLICIES = ("block", "drop")
+PALETTE_BYTES = 768
+
+FRAME_HEADER = struct.Struct("<4sQIHHB3xI")  # マジック, 通し番号, フレーム, 幅, 高さ, 形式, 画素のバイト数
+FRAME_MAGIC = b"BFRM"
+RING_HEADER = struct.Struct("<4sHHHB3xIIQQ")  # マジック, 版, 幅, 高さ, 形式, スロット数, スロットの大きさ, 書いた番号, 読んだ番号
+RING_MAGIC = b"BRNG"
+RING_VERSION = 1
+SLOT_HEADER = struct.Struct("<QI4x")  # 通し番号, フレーム番号
+WRITE_SEQ_OFFSET = RING_HEADER.size - 16
+READ_SEQ_OFFSET = RING_HEADER.size - 8
+
+
+def add_sink_arguments(parser):
+    """--sink などフレームの出力先の引数を追加"""
+    group = parser.add_argument_group("frame sink")
+    group.add_argument("--sink", choices=("pipe", "shm"),
+                       help="描画したフレームをその場でパイプか共有メモリへ流す")
+    group.add_argument("--sink-path", metavar="PATH",
+                       help="pipe: 書き込むファイルか名前付きパイプ（既定は - ＝標準出力）、"
+                            "shm: 共有メモリの名前（既定は ball_frames）")
+    group.add_argument("--sink-format", choices=FORMATS, default="rgb",
+                       help="画素の形式（rgb: 1画素3バイト、indexed: パレット＋1画素1バイト）")
+    group.add_argument("--sink-slots", type=int, default=8, metavar="N",
+                       help="キュー・リングバッファに置けるフレームの数")
+    group.add_argument("--sink-policy", choices=POLICIES, default="block",
+                       help="読み手が遅いとき: block は待つ、drop はフレームを捨てる")
+    group.add_argument("--sink-timeout", type=float, default=2.0, metavar="SECONDS",
+                       help="block で待つ上限（過ぎたらそのフレームを捨てる）")
+    return parser
+
+
+def frame_size(width, height, fmt):
+    """1フレームの画素のバイト数"""
+    if fmt == "indexed":
+        return PALETTE_BYTES + width * height
+    return width * height * 3
+
+
+def encode_surface(surface, fmt):
+    """Surface を送る形式のバイト列にする"""
+    if fmt == "indexed":
+        # Pillow は記録スクリプトの起動時間に効くため、indexed で流すときだけ読み込む
+        from PIL import Image
+        image = Image.frombytes("RGB", surface.get_size(), pygame.image.tobytes(surface, "RGB"))
+        image = image.quantize(256, method=Image.Quantize.FASTOCTREE)
+        palette = image.getpalette()[:PALETTE_BYTES]
+        return bytes(palette) + bytes(PALETTE_BYTES - len(palette)) + image.tobytes()
+    return pygame.image.tobytes(surface, "RGB")
+
+
+class FrameSink:
+    """フレームの出力先の共通部分（通し番号と、送った・捨てた数）"""
+
+    def __init__(self, fmt="rgb", slots=8, policy="block", timeout=2.0):
+        self.format = fmt
+        self.slots = max(slots, 1)
+        self.policy = policy
+        self.timeout = timeout
+        self.size = None
+        self.sequence = 0
+        self.sent = 0
+        self.dropped = 0
+        self.stalled = False  # block で待ちきれなかった（読み手が進むまで待たない）
+
+    @classmethod
+    def from_args(cls, args):
+        """--sink が指定されていなければ None"""
+        kind = getattr(args, "sink", None)
+        if not kind:
+            return None
+        options = (args.sink_format, args.sink_slots, args.sink_policy, args.sink_timeout)
+        if kind == "shm":
+            return RingSink(args.sink_path or "ball_frames", *options)
+        return PipeSink(args.sink_path or "-", *options)
+
+    def send(self, surface, frame):
+        """フレームを1枚流す（最初のフレームの大きさで出力先を用意する）"""
+        if self.size is None:
+            self.size = surface.get_size()
+            self.open(*self.size)
+        self.sequence += 1
+        if self.write(self.sequence, frame, encode_surface(surface, self.format)):
+            self.sent += 1
+        else:
+            self.dropped += 1
+
+    def open(self, width, height):
+        raise NotImplementedError
+
+    def write(self, sequence, frame, payload):
+        """送れたら True、捨てたら False"""
+        raise NotImplementedError
+
+    def _stall(self):
+        if not self.stalled:
+            print(f"フレーム出力: 読み手が {self.timeout:g}秒進まないので、進むまでフレームを捨てます",
+                  file=sys.stderr)
+        self.stalled = True
+        return False
+
+    def close(self):
+        print(f"フレーム出力: {self.sent}枚を送り、{self.dropped}枚を捨てました", file=sys.stderr)
+
+
+class PipeSink(FrameSink):
+    """ヘッダ付きのフレームを標準出力か名前付きパイプへ書く"""
+
+    def __init__(self, path="-", *options):
+        super().__init__(*options)
+        self.path = path
+        self.queue = queue.Queue(self.slots)
+        self.broken = False
+        if path == "-":
+            self.stream = sys.stdout.buffer
+            sys.stdout = sys.stderr  # 表示が画素に混ざらないように
+        else:
+            self.stream = None  # 名前付きパイプは読み手が開くまで待つので、最初のフレームで開く
+        self.thread = threading.Thread(target=self._run, name="frame-sink", daemon=True)
+
+    def open(self, width, height):
+        if self.stream is None:
+            self.stream = open(self.path, "wb")
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                self.stream.write(item)
+                self.stream.flush()
+            except (BrokenPipeError, ValueError):
+                self.broken = True
+                break
+
+    def write(self, sequence, frame, payload):
+        if self.broken:
+            return False
+        width, height = self.size
+        fmt = FORMATS.index(self.format)
+        item = FRAME_HEADER.pack(FRAME_MAGIC, sequence, frame, width, height, fmt, len(payload)) + payload
+        try:
+            if self.policy == "drop" or self.stalled:
+                self.queue.put_nowait(item)
+            else:
+                self.queue.put(item, timeout=self.timeout)
+        except queue.Full:
+            return False if self.policy == "drop" or self.stalled else self._stall()
+        self.stalled = False
+        return True
+
+    def close(self):
+        if self.size is not None:
+            if not self.broken:
+                self.queue.put(None)
+            self.thread.join()
+            if self.path != "-":
+                self.stream.close()
+        if self.broken:
+            print("フレーム出力: 読み手がパイプを閉じました", file=sys.stderr)
+        super().close()
+
+
+class RingSink(FrameSink):
+    """共有メモリのリングバッファにフレームを書く"""
+
+    def __init__(self, name="ball_frames", *options):
+        super().__init__(*options)
+        self.name = name
+        self.memory = None
+
+    def open(self, width, height):
+        self.slot_size = SLOT_HEADER.size + frame_size(width, height, self.format)
+        total = RING_HEADER.size + self.slots * self.slot_size
+        from multiprocessing import shared_memory
+        self.memory = shared_memory.SharedMemory(self.name, create=True, size=total)
+        RING_HEADER.pack_into(self.memory.buf, 0, RING_MAGIC, RING_VERSION, width, height,
+                              FORMATS.index(self.format), self.slots, self.slot_size, 0, 0)
+        print(f"フレーム出力: 共有メモリ {self.name}（{self.slots}スロット, {total / 2**20:.1f} MB）",
+              file=sys.stderr)
+
+    def _read_sequence(self):
+        return struct.unpack_from("<Q", self.memory.buf, READ_SEQ_OFFSET)[0]
+
+    def write(self, sequence, frame, payload):
+        buf = self.memory.buf
+        if self.policy == "block" and sequence - self._read_sequence() > self.slots:
+            if self.stalled:
+                return False
+            deadline = time.perf_counter() + self.timeout
+            while sequence - self._read_sequence() > self.slots:
+                if time.perf_counter() > deadline:
+                    return self._stall()
+                time.sleep(0.001)
+        self.stalled = False
+        offset = RING_HEADER.size + (sequence - 1) % self.slots * self.slot_size
+        SLOT_HEADER.pack_into(buf, offset, 0, frame)  # 書いている間は番号0
+        start = offset + SLOT_HEADER.size
+        buf[start:start + len(payload)] = payload
+        SLOT_HEADER.pack_into(buf, offset, sequence, frame)
+        struct.pack_into("<Q", buf, WRITE_SEQ_OFFSET, sequence)
+        return True
+
+    def close(self):
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+        super().close()
+
+
+# ---------------------------
+# 読み手
+# ---------------------------
+def read_frames(stream):
+    """パイプから (通し番号, フレーム番号, 画像の配列) を順に返す
+
+    RGB は (高さ, 幅, 3)、indexed は (パレット (256, 3), インデックス (高さ, 幅))。
+    最初のフレームより前の文字（pygame の起動メッセージなど）は読み飛ばす。
+    """
+    skipped = stream.read(len(FRAME_MAGIC))
+    while skipped[-len(FRAME_MAGIC):] != FRAME_MAGIC:
+        byte = stream.read(1)
+        if not byte:
+            return
+        skipped += byte
+    header = FRAME_MAGIC + stream.read(FRAME_HEADER.size - len(FRAME_MAGIC))
+    while True:
+        if len(header) < FRAME_HEADER.size:
+            return
+        magic, sequence, frame, width, height, fmt, length = FRAME_HEADER.unpack(header)
+        if magic != FRAME_MAGIC:
+            raise ValueError("フレームのヘッダが壊れています")
+        payload = stream.read(length)
+        if len(payload) < length:
+            return
+        yield sequence, frame, decode(payload, width, height, FORMATS[fmt])
+        header = stream.read(FRAME_HEADER.size)
+
+
+def decode(payload, width, height, fmt):
+    """画素のバイト列を NumPy 配列として見る（コピーしない）"""
+    data = np.frombuffer(payload, dtype=np.uint8)
+    if fmt == "indexed":
+        return data[:PALETTE_BYTES].reshape(256, 3), data[PALETTE_BYTES:].reshape(height, width)
+    return data.reshape(height, width, 3)
+
+
+class RingReader:
+    """共有メモリのリングバッファを別のプロセスから読む"""
+
+    def __init__(self, name="ball_frames"):
+        from multiprocessing import resource_tracker, shared_memory
+        self.memory = shared_memory.SharedMemory(name)
+        # 読み手が終わるときに共有メモリを消さないよう、後始末の登録を外す
+        resource_tracker.unregister(self.memory._name, "shared_memory")
+        magic, version, self.width, self.height, fmt, self.slots, self.slot_size, _, _ = \
+            RING_HEADER.unpack_from(self.memory.buf, 0)
+        if magic != RING_MAGIC or version != RING_VERSION:
+            raise ValueError(f"{name} はフレームのリングバッファではありません")
+        self.format = FORMATS[fmt]
+        # 後から開いたときは、まだ残っている最も古いフレームから読む
+        self.next_sequence = max(self.written() - self.slots + 1, 1)
+        self.missed = 0
+
+    def written(self):
+        """書き手が最後に書いた通し番号"""
+        return struct.unpack_from("<Q", self.memory.buf, WRITE_SEQ_OFFSET)[0]
+
+    def _slot(self, sequence):
+        offset = RING_HEADER.size + (sequence - 1) % self.slots * self.slot_size
+        start = offset + SLOT_HEADER.size
+        view = self.memory.buf[start:start + self.slot_size - SLOT_HEADER.size]
+        return offset, view
+
+    def valid(self, sequence):
+        """そのフレームがまだ上書きされていないか（使い終わった後に確かめる）"""
+        offset, _ = self._slot(sequence)
+        return SLOT_HEADER.unpack_from(self.memory.buf, offset)[0] == sequence
+
+    def read(self, timeout=1.0):
+        """次のフレームを (通し番号, フレーム番号, 配列) で返す（来なければ None）
+
+        配列は共有メモリそのものを指す。書き手に追い越されたフレームは飛ばし、
+        その数を missed に足す。使い終わったら done() を呼ぶと、書き手が block
+        なら追いつくまで待ってくれる（読み手が1つのときに限る）。
+        """
+        deadline = time.perf_counter() + timeout
+        while self.written() < self.next_sequence:
+            if time.perf_counter() > deadline:
+                return None
+            time.sleep(0.001)
+        latest = self.written()
+        if latest - self.next_sequence >= self.slots:
+            # 取りこぼした分を飛ばす（読んでいる間に上書きされないよう、リングの半分先へ）
+            skipped = latest - self.slots // 2 + 1
+            self.missed += skipped - self.next_sequence
+            self.next_sequence = skipped
+        sequence = self.next_sequence
+        offset, view = self._slot(sequence)
+        slot_sequence, frame = SLOT_HEADER.unpack_from(self.memory.buf, offset)
+        if slot_sequence != sequence:
+            # 書いている途中か上書きされた
+            self.missed += 1
+            self.next_sequence += 1
+            return self.read(max(deadline - time.perf_counter(), 0.0))
+        self.next_sequence += 1
+        return sequence, frame, decode(view, self.width, self.height, self.format)
+
+    def done(self, sequence):
+        """そのフレームまで読み終えたことを書き手に知らせる"""
+        struct.pack_into("<Q", self.memory.buf, READ_SEQ_OFFSET, sequence)
+
+    def close(self):
+        self.memory.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="--sink で流れてくるフレームを読み、速さと取りこぼしを表示する")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--pipe", metavar="PATH", help="読むファイルか名前付きパイプ（- で標準入力）")
+    source.add_argument("--shm", metavar="NAME", help="読む共有メモリの名前")
+    parser.add_argument("--delay", type=float, default=0.0, metavar="MS",
+                        help="1フレームごとに待つ時間（遅い読み手を試す）")
+    parser.add_argument("--timeout", type=float, default=5.0, metavar="SECONDS",
+                        help="フレームが来なくなってから終わるまでの時間（shm）")
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    started = time.perf_counter()
+    count, missed, overwritten, last = 0, 0, 0, None
+    if args.shm:
+        reader = RingReader(args.shm)
+        print(f"{args.shm}: {reader.width}x{reader.height}, {reader.format}, {reader.slots}スロット")
+        while (item := reader.read(args.timeout)) is not None:
+            sequence = item[0]
+            del item  # 配列が共有メモリを参照している間は close() できない
+            count += 1
+            time.sleep(args.delay / 1000)
+            if not reader.valid(sequence):
+                overwritten += 1  # 使っている間に上書きされた
+            reader.done(sequence)
+        missed += reader.missed
+        reader.close()
+    else:
+        stream = sys.stdin.buffer if args.pipe in (None, "-") else open(args.pipe, "rb")
+        for sequence, frame, _ in read_frames(stream):
+            count += 1
+            if last is not None:
+                missed += sequence - last - 1  # 書き手が捨てたフレーム
+            last = sequence
+            time.sleep(args.delay / 1000)
+    elapsed = time.perf_counter() - started
+    line = f"{count}フレームを受け取りました（{count / max(elapsed, 1e-9):.1f} フレーム/秒）、取りこぼし {missed}"
+    if args.shm:
+        line += f"、読んでいる間に上書き {overwritten}"
+    print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
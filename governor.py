@@ -0,0 +1,150 @@
+import json
+import time
+from collections import deque
+from dataclasses import dataclass
+
+# ---------------------------
+# フレーム予算による描画の間引き
+# ---------------------------
+# 遅いマシンでフレームが予算（既定は 1000 / FPS ミリ秒）を超え続けると、
+# 物理・描画・記録がそろって遅れていく。ガバナーは直近のフレームの処理時間
+# （clock.tick の待ちを除く）を見て、超えていれば次の順に描画を軽くする。
+#
+#   レベル 0  すべて描画する
+#   レベル 1  HUD（残り時間などの文字）を描かない、記録の頻度を半分にする
+#   レベル 2  枠線を1ピクセルにする
+#   レベル 3〜 描画そのものを間引く（2フレームに1回 … max_skip フレームに1回）
+#
+# （アンチエイリアスして描いているのは HUD の文字だけなので、レベル1で一緒に
+# なくなる。）物理は毎フレーム同じ dt で進め、イベントも毎フレーム処理するので、
+# 描画を間引いても入力への反応は max_skip フレーム以内に収まる。
+# 予算の recover 倍を下回る状態が RECOVER_WINDOWS 区間続けば1段ずつ戻す
+# （軽くした後のフレームは速いので、すぐ戻すと上げ下げを繰り返す）。段を変えたときは理由を
+# 表示し（--governor-log があれば JSON Lines でも書き出す）、終了時に
+# 各レベルで過ごしたフレーム数をまとめる。
+
+LEVEL_NAMES = ("すべて描画", "HUDを省略", "枠線を細くする")
+RECOVER_WINDOWS = 4
+
+
+def add_governor_arguments(parser):
+    """--frame-budget などガバナーの引数を追加"""
+    group = parser.add_argument_group("governor")
+    group.add_argument("--govern", action="store_true",
+                       help="フレームが予算を超えたら描画を段階的に軽くする")
+    group.add_argument("--frame-budget", type=float, default=None, metavar="MS",
+                       help="1フレームの予算（ミリ秒、既定は 1000 / FPS）")
+    group.add_argument("--max-skip", type=int, default=4, metavar="N",
+                       help="描画を間引くときの上限（Nフレームに1回は描画する）")
+    group.add_argument("--governor-log", metavar="PATH",
+                       help="レベルを変えた記録を書き出すファイル（JSON Lines）")
+    return parser
+
+
+@dataclass(frozen=True)
+class Detail:
+    """あるフレームで行う描画の内容"""
+    render: bool = True        # このフレームを描画するか
+    hud: bool = True           # HUD の文字を描くか
+    thin_outline: bool = False  # 枠線を1ピクセルにするか
+    capture_scale: int = 1     # 記録の間隔の倍率
+
+    def outline(self, width):
+        return 1 if self.thin_outline else width
+
+
+FULL_DETAIL = Detail()
+
+
+class FrameGovernor:
+    """直近のフレーム時間を予算と比べて、描画のレベルを上げ下げする"""
+
+    def __init__(self, budget_ms, window=30, max_skip=4, recover=0.7, log_path=None):
+        self.budget_ms = budget_ms
+        self.window = window
+        self.max_skip = max(max_skip, 1)
+        self.recover = recover
+        self.level = 0
+        self.calm = 0  # 予算に余裕のあるフレームが続いた数
+        self.max_level = len(LEVEL_NAMES) - 2 + self.max_skip
+        self.times = deque(maxlen=window)
+        self.frames_at_level = {}
+        self.changes = []
+        self.log = open(log_path, "a", encoding="utf-8") if log_path else None
+        self._started = None
+
+    @classmethod
+    def from_args(cls, args, fps):
+        """--govern が指定されていなければ None"""
+        if not getattr(args, "govern", False):
+            return None
+        budget = args.frame_budget or 1000 / fps
+        return cls(budget, max_skip=args.max_skip, log_path=args.governor_log)
+
+    def describe(self, level=None):
+        level = self.level if level is None else level
+        if level < len(LEVEL_NAMES):
+            return LEVEL_NAMES[level]
+        return f"描画を{self.render_every(level)}フレームに1回に間引く"
+
+    def render_every(self, level=None):
+        level = self.level if level is None else level
+        return max(1, level - len(LEVEL_NAMES) + 2)
+
+    # --- メインループから呼ぶ ---
+    def begin(self):
+        """フレームの処理の開始（clock.tick の待ちの後）"""
+        self._started = time.perf_counter()
+
+    def end(self, frame):
+        """フレームの処理の終わり（clock.tick の待ちの前）。必要ならレベルを変える"""
+        if self._started is None:
+            return
+        self.times.append((time.perf_counter() - self._started) * 1000)
+        self.frames_at_level[self.level] = self.frames_at_level.get(self.level, 0) + 1
+        if len(self.times) < self.window:
+            return
+        mean = sum(self.times) / len(self.times)
+        if mean > self.budget_ms and self.level < self.max_level:
+            self._change(frame, self.level + 1, mean)
+        elif mean < self.budget_ms * self.recover and self.level > 0:
+            self.calm += 1
+            if self.calm >= self.window * RECOVER_WINDOWS:
+                self._change(frame, self.level - 1, mean)
+        else:
+            self.calm = 0
+
+    def _change(self, frame, level, mean):
+        previous, self.level = self.level, level
+        # 新しいレベルでの時間だけで次の判断をする
+        self.times.clear()
+        self.calm = 0
+        entry = {"frame": frame, "mean_ms": round(mean, 2), "budget_ms": round(self.budget_ms, 2),
+                 "from": previous, "to": level, "action": self.describe(level)}
+        self.changes.append(entry)
+        sign = ">" if level > previous else "<"
+        print(f"[governor] フレーム {frame}: 平均 {mean:.1f} ms {sign} 予算 {self.budget_ms:.1f} ms "
+              f"→ レベル {level}（{entry['action']}）")
+        if self.log:
+            self.log.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.log.flush()
+
+    def detail(self, frame):
+        """このフレームで行う描画の内容"""
+        level = self.level
+        if level == 0:
+            return FULL_DETAIL
+        every = self.render_every(level)
+        return Detail(render=frame % every == 0, hud=False, thin_outline=level >= 2,
+                      capture_scale=2 * every)
+
+    def close(self):
+        """各レベルで過ごしたフレーム数を表示"""
+        total = sum(self.frames_at_level.values())
+        if total:
+            parts = ", ".join(f"レベル{level} {count / total:.0%}"
+                              for level, count in sorted(self.frames_at_level.items()))
+            print(f"[governor] {total}フレーム（予算 {self.budget_ms:.1f} ms, "
+                  f"変更 {len(self.changes)}回）: {parts}")
+        if self.log:
+            self.log.close()
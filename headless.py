@@ -0,0 +1,38 @@
+import os
+
+import pygame
+
+# ---------------------------
+# 高速起動・ヘッドレス実行
+# ---------------------------
+# pygame.init() は音声・ジョイスティックなど使わないサブシステムまで
+# 初期化するため、必要なモジュール（display と、HUDを描く場合は font）だけを
+# 初期化する。--headless ではSDLのダミードライバを使いウィンドウを開かない。
+
+
+def add_headless_arguments(parser, frame_limit=True):
+    """--headless（と --max-frames）引数を追加"""
+    group = parser.add_argument_group("headless")
+    group.add_argument("--headless", action="store_true",
+                       help="ウィンドウを開かずにSDLのダミードライバで実行する")
+    if frame_limit:
+        group.add_argument("--max-frames", type=int, default=0, metavar="N",
+                           help="指定したフレーム数で終了する（0で無制限）")
+    return parser
+
+
+def use_dummy_drivers():
+    """SDLのダミー映像・音声ドライバを使う（pygame.display の初期化前に呼ぶ）"""
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+
+
+def init_pygame(headless=False, font=False):
+    """必要なpygameのサブシステムだけを初期化"""
+    if headless:
+        use_dummy_drivers()
+    pygame.display.init()
+    if font:
+        pygame.font.init()
+    # get_ticks() はタイマーが初期化されるまで0を返すため、ここで初期化しておく
+    pygame.time.wait(0)
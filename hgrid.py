@@ -0,0 +1,176 @@
+import argparse
+import math
+import random
+import sys
+import time
+
+# ---------------------------
+# 大きさの違うボールのための階層格子（ブロードフェーズ）
+# ---------------------------
+# 一辺が1種類のセルの格子は、セルを最大の直径に合わせると小さなボールが1つの
+# セルに大量に集まり、最小の直径に合わせると大きなボールが何百ものセルに
+# またがる。階層格子ではセルの一辺を base, 2·base, 4·base, ... と段ごとに倍にし、
+# 各ボールを「セルの一辺 ≥ 直径」となる最も細かい段の、中心を含む1つのセルに
+# だけ登録する。
+#
+# 半径 r1, r2 のボールが重なるなら中心の距離は r1 + r2 未満で、大きい方の段の
+# セルの一辺（≥ 2·max(r1, r2)）より短い。したがって
+#
+#   同じ段どうし      周囲 3×3 のセル（重複しないよう半分の5セルだけ）を調べる
+#   違う段どうし      小さい方のボールが、より粗い段の周囲 3×3 のセルを調べる
+#
+# で重なりうる組をすべて拾える。小さな粒子が調べる大きなボールは近くのセルに
+# あるものだけで、大きなボールが登録されるセルは常に1つ。組は (i, j)（i < j）の
+# 順に並べて返すので、全組を順に調べる方法と同じ順に処理できる。
+
+BROADPHASES = ("hgrid", "all-pairs")
+FORWARD = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))  # 同じ段で調べる自分と前方のセル
+NEIGHBORS = tuple((i, j) for i in (-1, 0, 1) for j in (-1, 0, 1))
+
+
+def add_broadphase_arguments(parser):
+    """ボールの大きさとブロードフェーズの引数を追加"""
+    group = parser.add_argument_group("bodies")
+    group.add_argument("--radius-range", type=float, nargs=2, default=None, metavar=("MIN", "MAX"),
+                       help="ボールごとの半径の範囲（対数で一様に選ぶ）。質量は半径の2乗に比例する")
+    group.add_argument("--broadphase", choices=BROADPHASES, default="hgrid",
+                       help="衝突しうる組の探し方（hgrid: 階層格子、all-pairs: すべての組）")
+    return parser
+
+
+class HierarchicalGrid:
+    """半径に合った段のセルに、ボールを1つずつ登録する格子"""
+
+    def __init__(self, base):
+        self.base = base       # 最も細かい段のセルの一辺
+        self.levels = {}       # 段 → {(cx, cy): [番号, ...]}
+        self.entries = []      # 番号 → (x, y, 段)
+        self.tests = 0         # 最後の pairs() で拾った組の数
+
+    @classmethod
+    def build(cls, positions, radii):
+        """位置と半径の列から作る（最も細かい段は最小の直径に合わせる）"""
+        grid = cls(max(2 * min(radii, default=1.0), 1e-9))
+        for index, ((x, y), radius) in enumerate(zip(positions, radii)):
+            grid.insert(index, x, y, radius)
+        return grid
+
+    def level(self, radius):
+        """直径が収まる最も細かい段"""
+        if 2 * radius <= self.base:
+            return 0
+        return math.ceil(math.log2(2 * radius / self.base))
+
+    def size(self, level):
+        return self.base * (1 << level)
+
+    def insert(self, index, x, y, radius):
+        level = self.level(radius)
+        size = self.size(level)
+        cell = (int(x // size), int(y // size))
+        self.levels.setdefault(level, {}).setdefault(cell, []).append(index)
+        self.entries.append((x, y, level))
+
+    def pairs(self):
+        """重なりうる組 (i, j)（i < j）を番号の順に並べて返す"""
+        found = []
+        for level, cells in self.levels.items():
+            # 同じ段: 自分のセルの中と、前方の4セルとの組
+            for (cx, cy), members in cells.items():
+                for dx, dy in FORWARD:
+                    other = members if (dx, dy) == (0, 0) else cells.get((cx + dx, cy + dy))
+                    if not other:
+                        continue
+                    for a, i in enumerate(members):
+                        for j in (other[a + 1:] if other is members else other):
+                            found.append((i, j) if i < j else (j, i))
+        coarser = sorted(self.levels)
+        for i, (x, y, level) in enumerate(self.entries):
+            # 違う段: より粗い段の周囲 3×3 のセル
+            for upper in coarser:
+                if upper <= level:
+                    continue
+                size = self.size(upper)
+                cx, cy = int(x // size), int(y // size)
+                cells = self.levels[upper]
+                for dx, dy in NEIGHBORS:
+                    for j in cells.get((cx + dx, cy + dy), ()):
+                        found.append((i, j) if i < j else (j, i))
+        found.sort()
+        self.tests = len(found)
+        return found
+
+    def stats(self):
+        """段ごとのセルの一辺・ボール数・使っているセル数"""
+        return {level: {"cell": self.size(level), "balls": sum(map(len, cells.values())),
+                        "cells": len(cells)}
+                for level, cells in sorted(self.levels.items())}
+
+
+def all_pairs(count):
+    """すべての組 (i, j)（i < j）"""
+    return ((i, j) for i in range(count) for j in range(i + 1, count))
+
+
+def uniform_pairs(positions, radii):
+    """比較用: 最大の直径に合わせた1段の格子で拾う組"""
+    grid = HierarchicalGrid(2 * max(radii))
+    for index, ((x, y), radius) in enumerate(zip(positions, radii)):
+        grid.insert(index, x, y, min(radius, grid.base / 2))
+    return grid.pairs()
+
+
+def overlapping(positions, radii, pairs):
+    """組のうち実際に重なっているものの数"""
+    count = 0
+    for i, j in pairs:
+        (x1, y1), (x2, y2) = positions[i], positions[j]
+        if math.hypot(x1 - x2, y1 - y2) < radii[i] + radii[j]:
+            count += 1
+    return count
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="大きさの混ざったボールで、組の探し方ごとの調べる組の数と時間を比べる")
+    parser.add_argument("--balls", type=int, default=3000, help="ボールの数")
+    parser.add_argument("--small", type=float, default=2.0, help="小さなボールの半径")
+    parser.add_argument("--large", type=float, default=40.0, help="大きなボールの半径")
+    parser.add_argument("--large-fraction", type=float, default=0.02, help="大きなボールの割合")
+    parser.add_argument("--size", type=float, default=1200.0, help="ボールを置く正方形の一辺")
+    parser.add_argument("--all-pairs-limit", type=int, default=4000,
+                        help="これより多いときは全組を調べない（時間がかかるため）")
+    parser.add_argument("--seed", type=int, default=12345, help="乱数シード")
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    rng = random.Random(args.seed)
+    half = args.size / 2
+    radii = [args.large if rng.random() < args.large_fraction else args.small for _ in range(args.balls)]
+    positions = [(rng.uniform(-half, half), rng.uniform(-half, half)) for _ in range(args.balls)]
+    print(f"ボール {args.balls}個（半径 {args.small:g} と {args.large:g}、大きなボール "
+          f"{sum(r == args.large for r in radii)}個）")
+
+    methods = [("階層格子", lambda: HierarchicalGrid.build(positions, radii).pairs()),
+               ("1段の格子", lambda: uniform_pairs(positions, radii))]
+    if args.balls <= args.all_pairs_limit:
+        methods.append(("すべての組", lambda: list(all_pairs(args.balls))))
+    expected = None
+    for name, find in methods:
+        started = time.perf_counter()
+        pairs = find()
+        elapsed = (time.perf_counter() - started) * 1000
+        hits = overlapping(positions, radii, pairs)
+        expected = hits if expected is None else expected
+        check = "" if hits == expected else f"（階層格子と違う: {expected}組）"
+        print(f"{name:>6}: 調べる組 {len(pairs):>9,}  {elapsed:8.1f} ms  重なっている組 {hits}{check}")
+    grid = HierarchicalGrid.build(positions, radii)
+    for level, stats in grid.stats().items():
+        print(f"  段{level}: セル {stats['cell']:g} px, ボール {stats['balls']}個, セル {stats['cells']}個")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
@@ -0,0 +1,489 @@
+import importlib
+import math
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+from headless import init_pygame
+from transform import Affine
+
+# ---------------------------
+# 4つの実装を共通のインターフェースで扱うためのアダプタ
+# ---------------------------
+# 各スクリプトの物理（Ball.update / resolve_ball_collisions）と
+# 描画（draw_scene）をそのまま呼び出す。メインループ・イベント処理・
+# 実時間でのペーシングは含まない。
+#
+# 状態（SimState）は実装によらず「正方形の中心を原点とし、正方形の辺に
+# 沿った軸を持つローカル座標系」と「ラジアン単位の回転角」で表す。
+# 速度の単位は実装のまま（01/03はピクセル/フレーム、02/04はピクセル/秒）。
+# 半径と質量はボールごとに持つ実装（04）だけが埋め、それ以外は None
+# （半径は Scene.ball_radius、質量は実装の既定）とする。
+
+IMPLEMENTATIONS = {
+    "01": "01_o3_mini_basic",
+    "02": "02_o3_high_oop",
+    "03": "03_deepseek_r1_basic",
+    "04": "04_o3_improved_collision",
+}
+
+
+@dataclass
+class SimState:
+    """ある時点のシミュレーション状態（ローカル座標系）"""
+    angle: float
+    ids: np.ndarray         # (N,) int64
+    positions: np.ndarray   # (N, 2) float64
+    velocities: np.ndarray  # (N, 2) float64
+    colors: np.ndarray      # (N, 3) uint8
+    radii: np.ndarray = None   # (N,) float64（None ならすべて Scene.ball_radius）
+    masses: np.ndarray = None  # (N,) float64（None なら実装の既定）
+
+    @classmethod
+    def empty(cls, angle=0.0):
+        return cls(angle, np.zeros(0, np.int64), np.zeros((0, 2)), np.zeros((0, 2)),
+                   np.zeros((0, 3), np.uint8))
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def require_uniform(state, radius):
+    """すべてのボールが半径 radius・同じ質量か確かめる（違えば ValueError）
+
+    半径と質量を1つの値で持つエンジン（ensemble.py / parallel_engine.py）が、
+    大きさの混ざった状態を黙って一様なボールとして計算しないようにする。
+    """
+    if state.radii is not None and np.any(state.radii != radius):
+        raise ValueError(f"ボールごとに半径が違う状態は扱えません（半径 {radius} のボールだけ）")
+    if state.masses is not None and len(state.masses) and np.any(state.masses != state.masses[0]):
+        raise ValueError("ボールごとに質量が違う状態は扱えません")
+
+
+@dataclass
+class Scene:
+    """描画の固定パラメータ（draw_scene と同じ値）"""
+    size: tuple           # (WIDTH, HEIGHT)
+    center: tuple         # 正方形の中心（スクリーン座標）
+    square_size: float
+    ball_radius: float
+    background: tuple
+    outline: tuple
+    outline_width: int
+
+
+def _rotate(points, angle):
+    """(N, 2) 配列を原点まわりに angle ラジアン回転"""
+    return Affine.rotation(angle).apply(points)
+
+
+def _with_speed(vx, vy, speed):
+    """向きを変えずに速さを speed にした速度（止まっていれば x 方向）"""
+    length = math.hypot(vx, vy)
+    if length == 0:
+        return speed, 0.0
+    return vx * speed / length, vy * speed / length
+
+
+class Simulation:
+    """実装ごとの差異を吸収する共通インターフェース"""
+    key = ""
+    velocity_unit = "px/s"
+    FRAME_RATE = 60  # 01/03 のメインループのフレームレート
+
+    def __init__(self, module):
+        self.module = module
+        self.balls = []
+        self.ids = []
+        self.next_id = 0
+
+    def seed(self, seed):
+        """ボール生成の乱数ストリームを初期化"""
+        self.module.spawn_rng.reseed(seed)
+
+    def _register(self, count=1):
+        self.ids.extend(range(self.next_id, self.next_id + count))
+        self.next_id += count
+
+    @property
+    def size(self):
+        """描画先サーフェスの大きさ (WIDTH, HEIGHT)"""
+        return (self.module.WIDTH, self.module.HEIGHT)
+
+    def spawn(self):
+        """実装自身の生成ロジックでボールを1つ追加"""
+        raise NotImplementedError
+
+    def update(self, dt):
+        """ボールの移動・壁との衝突・正方形の回転を1ステップ進める"""
+        raise NotImplementedError
+
+    def collide(self):
+        """ボール同士の衝突処理（実装が持たない場合は何もしない）"""
+
+    def draw(self, surface):
+        """現在の状態をサーフェスに描画"""
+        raise NotImplementedError
+
+    def scene(self):
+        """描画の固定パラメータをSceneとして返す"""
+        raise NotImplementedError
+
+    def configure(self, square_size=None, ball_radius=None, ball_speed=None, rotation_speed=None):
+        """シーンのパラメータを変更（ボールを生成する前に呼ぶ）
+
+        単位は実装によらず px・px/s・度/s。フレーム単位で動く01/03は
+        FRAME_RATE で換算し、正方形の大きさと半径を整数に丸める。値は
+        モジュールの定数を書き換えるため、同じプロセスの同じ実装すべてに影響する。
+        """
+        raise NotImplementedError
+
+    def set_speed(self, index, speed):
+        """index 番目のボールの速さを speed（px/s）にする（向きは変えない）"""
+        raise NotImplementedError
+
+    def set_rotation_speed(self, speed):
+        """正方形の回転の速さ（度/s）を実行中に変える"""
+        self.configure(rotation_speed=speed)
+
+    def step(self, dt):
+        self.update(dt)
+        self.collide()
+
+    def state(self):
+        """現在の状態をSimStateとして取り出す"""
+        raise NotImplementedError
+
+    def load_state(self, state):
+        """SimStateから状態を復元（乱数は使わない）"""
+        raise NotImplementedError
+
+    def _state(self, angle, positions, velocities, colors, radii=None, masses=None):
+        # スクリプトとボールのリストを共有している場合は、追加されたボールにIDを振る
+        if len(self.ids) < len(positions):
+            self._register(len(positions) - len(self.ids))
+        return SimState(
+            angle,
+            np.array(self.ids, dtype=np.int64),
+            np.array(positions, dtype=np.float64).reshape(-1, 2),
+            np.array(velocities, dtype=np.float64).reshape(-1, 2),
+            np.array(colors, dtype=np.uint8).reshape(-1, 3),
+            None if radii is None else np.array(radii, dtype=np.float64),
+            None if masses is None else np.array(masses, dtype=np.float64),
+        )
+
+    def _load_ids(self, state):
+        self.ids = [int(i) for i in state.ids]
+        self.next_id = max(self.ids, default=-1) + 1
+
+
+class MiniBasicSimulation(Simulation):
+    """01: フレーム単位の移動、角度は度"""
+    key = "01"
+    velocity_unit = "px/frame"
+
+    def __init__(self, module):
+        super().__init__(module)
+        self.angle = 0
+
+    def spawn(self):
+        self.balls.append(self.module.Ball())
+        self._register()
+
+    def update(self, dt):
+        self.angle += self.module.ROTATION_SPEED
+        if self.angle >= 360:
+            self.angle = 0
+        for ball in self.balls:
+            ball.update()
+
+    def draw(self, surface):
+        self.module.draw_scene(surface, self.balls, self.angle)
+
+    def scene(self):
+        m = self.module
+        return Scene((m.WIDTH, m.HEIGHT), (m.WIDTH // 2, m.HEIGHT // 2), m.SQUARE_SIZE,
+                     m.BALL_RADIUS, m.BLACK, m.WHITE, 2)
+
+    def configure(self, square_size=None, ball_radius=None, ball_speed=None, rotation_speed=None):
+        m = self.module
+        # 01 は randint で位置を選ぶので、大きさは整数の px に丸める
+        if square_size is not None:
+            m.SQUARE_SIZE = int(round(square_size))
+        if ball_radius is not None:
+            m.BALL_RADIUS = int(round(ball_radius))
+        if ball_speed is not None:
+            m.BALL_SPEED = ball_speed / self.FRAME_RATE  # 各軸の最大値
+        if rotation_speed is not None:
+            m.ROTATION_SPEED = rotation_speed / self.FRAME_RATE
+
+    def set_speed(self, index, speed):
+        ball = self.balls[index]
+        ball.dx, ball.dy = _with_speed(ball.dx, ball.dy, speed / self.FRAME_RATE)
+
+    def state(self):
+        half = self.module.SQUARE_SIZE / 2
+        return self._state(math.radians(self.angle),
+                           [(b.x - half, b.y - half) for b in self.balls],
+                           [(b.dx, b.dy) for b in self.balls],
+                           [b.color for b in self.balls])
+
+    def load_state(self, state):
+        half = self.module.SQUARE_SIZE / 2
+        self.angle = math.degrees(state.angle)
+        self.balls = []
+        for (x, y), (vx, vy), color in zip(state.positions, state.velocities, state.colors):
+            ball = self.module.Ball.__new__(self.module.Ball)
+            ball.x, ball.y = float(x) + half, float(y) + half
+            ball.dx, ball.dy = float(vx), float(vy)
+            ball.color = tuple(int(c) for c in color)
+            self.balls.append(ball)
+        self._load_ids(state)
+
+
+class HighOopSimulation(Simulation):
+    """02: Config / RotatingSquare / Vector2D を使う実装"""
+    key = "02"
+
+    def __init__(self, module):
+        super().__init__(module)
+        self.config = module.Config()
+        self.square = module.RotatingSquare(self.config)
+
+    @property
+    def size(self):
+        return (self.config.WIDTH, self.config.HEIGHT)
+
+    def spawn(self):
+        self.balls.append(self.module.Ball(self.config))
+        self._register()
+
+    def update(self, dt):
+        for ball in self.balls:
+            ball.update(dt, self.config)
+        self.square.update(dt, self.config.ROTATION_SPEED)
+
+    def draw(self, surface):
+        self.module.draw_scene(surface, self.square, self.balls)
+
+    def scene(self):
+        colors = self.module.Colors
+        return Scene(self.size, (self.square.center.x, self.square.center.y),
+                     self.config.SQUARE_SIZE, self.config.BALL_RADIUS,
+                     colors.BLACK, colors.WHITE, 2)
+
+    def configure(self, square_size=None, ball_radius=None, ball_speed=None, rotation_speed=None):
+        config = self.config
+        if square_size is not None:
+            config.SQUARE_SIZE = square_size
+        if ball_radius is not None:
+            config.BALL_RADIUS = ball_radius
+        if ball_speed is not None:
+            # 既定の 100〜200 と同じ比率で、平均が ball_speed になる範囲
+            config.BALL_SPEED_MIN, config.BALL_SPEED_MAX = ball_speed * 2 / 3, ball_speed * 4 / 3
+        if rotation_speed is not None:
+            config.ROTATION_SPEED = rotation_speed
+        self.square = self.module.RotatingSquare(config)
+
+    def set_speed(self, index, speed):
+        velocity = self.balls[index].velocity
+        velocity.x, velocity.y = _with_speed(velocity.x, velocity.y, speed)
+
+    def set_rotation_speed(self, speed):
+        # configure() は RotatingSquare を作り直す（角度が戻る）ので、値だけ変える
+        self.config.ROTATION_SPEED = speed
+
+    def state(self):
+        half = self.config.SQUARE_SIZE / 2
+        return self._state(self.square.angle,
+                           [(b.position.x - half, b.position.y - half) for b in self.balls],
+                           [(b.velocity.x, b.velocity.y) for b in self.balls],
+                           [b.color for b in self.balls])
+
+    def load_state(self, state):
+        half = self.config.SQUARE_SIZE / 2
+        Vector2D = self.module.Vector2D
+        self.square.angle = state.angle
+        self.balls = []
+        for (x, y), (vx, vy), color in zip(state.positions, state.velocities, state.colors):
+            ball = self.module.Ball.__new__(self.module.Ball)
+            ball.position = Vector2D(float(x) + half, float(y) + half)
+            ball.velocity = Vector2D(float(vx), float(vy))
+            ball.radius = self.config.BALL_RADIUS
+            ball.color = tuple(int(c) for c in color)
+            self.balls.append(ball)
+        self._load_ids(state)
+
+
+class DeepSeekSimulation(Simulation):
+    """03: 状態をモジュールのグローバル変数に持つ実装（同時に1インスタンスのみ）"""
+    key = "03"
+    velocity_unit = "px/frame"
+
+    def __init__(self, module):
+        super().__init__(module)
+        module.balls.clear()
+        module.square_angle = 0
+        self.balls = module.balls
+
+    def spawn(self):
+        self.module.add_ball()
+        self._register()
+
+    def update(self, dt):
+        self.module.update_balls()
+        self.module.square_angle = (self.module.square_angle + self.module.square_rotation_speed) % 360
+
+    def draw(self, surface):
+        self.module.draw_scene(surface)
+
+    def scene(self):
+        m = self.module
+        return Scene(self.size, m.square_rect.center, m.square_size, m.ball_radius,
+                     m.WHITE, m.BLACK, 2)
+
+    def configure(self, square_size=None, ball_radius=None, ball_speed=None, rotation_speed=None):
+        m = self.module
+        # 03 は randint で位置を選び pygame.Rect で枠を持つので、大きさは整数の px に丸める
+        if square_size is not None:
+            square_size = int(round(square_size))
+            m.square_size = square_size
+            m.square_rect = m.pygame.Rect((m.WIDTH - square_size) // 2, (m.HEIGHT - square_size) // 2,
+                                          square_size, square_size)
+        if ball_radius is not None:
+            m.ball_radius = int(round(ball_radius))
+        if ball_speed is not None:
+            m.ball_speed = ball_speed / self.FRAME_RATE  # 各軸の最大値
+        if rotation_speed is not None:
+            m.square_rotation_speed = rotation_speed / self.FRAME_RATE
+
+    def set_speed(self, index, speed):
+        ball = self.balls[index]
+        ball['dx'], ball['dy'] = _with_speed(ball['dx'], ball['dy'], speed / self.FRAME_RATE)
+
+    def state(self):
+        # 03のボールは画面座標で動くため、正方形の回転を打ち消してローカル座標にする
+        angle = math.radians(self.module.square_angle)
+        cx, cy = self.module.square_rect.center
+        positions = np.array([(b['x'] - cx, b['y'] - cy) for b in self.balls], dtype=np.float64)
+        velocities = np.array([(b['dx'], b['dy']) for b in self.balls], dtype=np.float64)
+        return self._state(angle,
+                           _rotate(positions.reshape(-1, 2), -angle),
+                           _rotate(velocities.reshape(-1, 2), -angle),
+                           [b['color'] for b in self.balls])
+
+    def load_state(self, state):
+        cx, cy = self.module.square_rect.center
+        self.module.square_angle = math.degrees(state.angle)
+        positions = _rotate(state.positions, state.angle)
+        velocities = _rotate(state.velocities, state.angle)
+        self.balls.clear()
+        for (x, y), (vx, vy), color in zip(positions, velocities, state.colors):
+            self.balls.append({'x': float(x) + cx, 'y': float(y) + cy,
+                               'dx': float(vx), 'dy': float(vy),
+                               'color': tuple(int(c) for c in color)})
+        self._load_ids(state)
+
+
+class ImprovedCollisionSimulation(Simulation):
+    """04: ローカル座標系の物理とボール同士の衝突"""
+    key = "04"
+
+    def __init__(self, module):
+        super().__init__(module)
+        self.angle = 0
+
+    def spawn(self):
+        self.balls.append(self.module.spawn_ball())
+        self._register()
+
+    def update(self, dt):
+        self.angle += self.module.ROTATION_SPEED * dt
+        for ball in self.balls:
+            ball.update(dt)
+
+    def collide(self):
+        self.module.resolve_ball_collisions(self.balls)
+
+    def draw(self, surface):
+        self.module.draw_scene(surface, self.balls, self.angle)
+
+    def scene(self):
+        m = self.module
+        # 背景と枠の色は draw_scene に直接書かれている値
+        return Scene(self.size, m.SQUARE_CENTER, m.SQUARE_SIZE, m.BALL_RADIUS,
+                     (30, 30, 30), (200, 200, 200), 3)
+
+    def configure(self, square_size=None, ball_radius=None, ball_speed=None, rotation_speed=None):
+        m = self.module
+        if square_size is not None:
+            m.SQUARE_SIZE, m.SQUARE_HALF = square_size, square_size / 2
+        if ball_radius is not None:
+            m.BALL_RADIUS = ball_radius
+        if ball_speed is not None:
+            m.BALL_SPEED = ball_speed
+        if rotation_speed is not None:
+            m.ROTATION_SPEED = math.radians(rotation_speed)
+
+    def set_speed(self, index, speed):
+        ball = self.balls[index]
+        ball.vx, ball.vy = _with_speed(ball.vx, ball.vy, speed)
+
+    def state(self):
+        return self._state(self.angle,
+                           [(b.x, b.y) for b in self.balls],
+                           [(b.vx, b.vy) for b in self.balls],
+                           [b.color for b in self.balls],
+                           [b.radius for b in self.balls],
+                           [b.mass for b in self.balls])
+
+    def load_state(self, state):
+        self.angle = state.angle
+        # 半径・質量を持たない状態なら Ball の既定（BALL_RADIUS と半径の2乗）を使う
+        count = len(state)
+        radii = [None] * count if state.radii is None else state.radii.tolist()
+        masses = [None] * count if state.masses is None else state.masses.tolist()
+        self.balls = [self.module.Ball(float(x), float(y), float(vx), float(vy),
+                                       tuple(int(c) for c in color), radius, mass)
+                      for (x, y), (vx, vy), color, radius, mass
+                      in zip(state.positions, state.velocities, state.colors, radii, masses)]
+        self._load_ids(state)
+
+
+SIMULATIONS = {
+    cls.key: cls for cls in (MiniBasicSimulation, HighOopSimulation,
+                             DeepSeekSimulation, ImprovedCollisionSimulation)
+}
+
+
+def load_module(key):
+    """実装番号（"01"〜"04"）またはモジュール名からスクリプトを読み込む"""
+    return importlib.import_module(IMPLEMENTATIONS.get(key, key))
+
+
+def load_simulation(key, seed=None):
+    """実装番号に対応するSimulationを生成"""
+    if key not in SIMULATIONS:
+        raise ValueError(f"未知の実装です: {key}（{', '.join(SIMULATIONS)} のいずれか）")
+    # ヘッドレス実行（ベンチマーク等）ではウィンドウを開かない（環境変数で上書き可能）
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    init_pygame()
+    sim = SIMULATIONS[key](load_module(key))
+    sim.seed(seed)
+    return sim
+
+
+def attach_simulation(key, module, **attributes):
+    """実行中のスクリプトの状態を共有するSimulationを生成（軌跡の記録用）
+
+    ボールの生成や状態の初期化はせず、balls などの属性をそのまま差し込む。
+    ボールは追加されるだけという前提で、IDは追加された順に振られる。
+    """
+    cls = SIMULATIONS[key]
+    sim = cls.__new__(cls)
+    Simulation.__init__(sim, module)
+    for name, value in attributes.items():
+        setattr(sim, name, value)
+    return sim
@@ -0,0 +1,145 @@
+import argparse
+import hashlib
+import importlib
+import sys
+
+import numpy as np
+
+from implementations import SIMULATIONS, load_simulation
+
+# ---------------------------
+# 差分検証（リファレンス・オラクル）
+# ---------------------------
+# リファレンス実装（Ball.update / resolve_ball_collisions）と候補エンジンに
+# 同じ初期状態を与えて並走させ、最初に食い違ったフレームと誤差を報告する。
+#
+# 候補エンジンは次のメソッドを持てばよい（implementations.Simulation と同じ形）:
+#   load_state(state)  SimStateから状態を設定
+#   step(dt)           1ステップ進める
+#   state()            SimStateを返す
+
+
+def state_digest(state, decimals=6):
+    """位置・速度を丸めてからハッシュ化したフレームのダイジェスト"""
+    order = np.argsort(state.ids, kind="stable")
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(state.ids[order], dtype="<i8").tobytes())
+    for values in (state.positions, state.velocities):
+        # +0.0 で -0.0 を 0.0 にそろえる
+        rounded = np.round(values[order], decimals) + 0.0
+        h.update(np.ascontiguousarray(rounded, dtype="<f8").tobytes())
+    return h.hexdigest()
+
+
+def state_error(reference, candidate):
+    """IDで対応づけた位置・速度の最大誤差（IDの集合が異なる場合は inf）"""
+    if not np.array_equal(np.sort(reference.ids), np.sort(candidate.ids)):
+        return float("inf"), float("inf")
+    ref_order = np.argsort(reference.ids, kind="stable")
+    cand_order = np.argsort(candidate.ids, kind="stable")
+    if len(ref_order) == 0:
+        return 0.0, 0.0
+    position_error = np.abs(reference.positions[ref_order] - candidate.positions[cand_order]).max()
+    velocity_error = np.abs(reference.velocities[ref_order] - candidate.velocities[cand_order]).max()
+    return float(position_error), float(velocity_error)
+
+
+def load_engine(spec):
+    """"04" のような実装番号、または "module:factory" から候補エンジンを生成"""
+    if spec in SIMULATIONS:
+        return load_simulation(spec)
+    module_name, _, factory_name = spec.partition(":")
+    if not factory_name:
+        raise ValueError(f"候補エンジンは 'module:factory' の形式で指定してください: {spec}")
+    factory = getattr(importlib.import_module(module_name), factory_name)
+    return factory()
+
+
+def run_differential(reference, candidate, frames, dt, tolerance, decimals=6, digest_log=None):
+    """リファレンスと候補を並走させ、結果の辞書を返す"""
+    initial = reference.state()
+    candidate.load_state(initial)
+
+    result = {"frames": frames, "balls": len(initial), "diverged": False,
+              "max_position_error": 0.0, "max_velocity_error": 0.0}
+    for frame in range(1, frames + 1):
+        reference.step(dt)
+        candidate.step(dt)
+        ref_state, cand_state = reference.state(), candidate.state()
+        ref_digest = state_digest(ref_state, decimals)
+        cand_digest = state_digest(cand_state, decimals)
+        if digest_log is not None:
+            digest_log.write(f"{frame} {ref_digest} {cand_digest}\n")
+
+        position_error, velocity_error = state_error(ref_state, cand_state)
+        result["max_position_error"] = max(result["max_position_error"], position_error)
+        result["max_velocity_error"] = max(result["max_velocity_error"], velocity_error)
+        if max(position_error, velocity_error) > tolerance:
+            result.update({
+                "diverged": True,
+                "first_divergent_frame": frame,
+                "position_error": position_error,
+                "velocity_error": velocity_error,
+                "reference_digest": ref_digest,
+                "candidate_digest": cand_digest,
+            })
+            break
+        if "first_digest_mismatch" not in result and ref_digest != cand_digest:
+            # 許容誤差内だが丸めた値が一致しなくなった最初のフレーム
+            result["first_digest_mismatch"] = frame
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="リファレンス実装と候補エンジンの差分検証")
+    parser.add_argument("--reference", default="04", choices=list(SIMULATIONS),
+                        help="リファレンス実装")
+    parser.add_argument("--candidate", default=None,
+                        help="候補エンジン（実装番号 または module:factory、省略時はリファレンス自身）")
+    parser.add_argument("--balls", type=int, default=50, help="ボール数")
+    parser.add_argument("--frames", type=int, default=600, help="比較するフレーム数")
+    parser.add_argument("--dt", type=float, default=1.0 / 60, help="1ステップの時間（秒）")
+    parser.add_argument("--seed", type=int, default=12345, help="乱数シード")
+    parser.add_argument("--tolerance", type=float, default=1e-6,
+                        help="位置・速度の許容誤差")
+    parser.add_argument("--decimals", type=int, default=6, help="ダイジェストの丸め桁数")
+    parser.add_argument("--digest-log", metavar="PATH",
+                        help="フレームごとのダイジェストを書き出すファイル")
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    if (args.candidate or args.reference) == "03" and args.reference == "03":
+        # 03は状態をモジュールのグローバル変数に持つため、2つ同時には動かせない
+        print("03 同士の比較はできません（状態がモジュールで共有されるため）")
+        return 2
+    reference = load_simulation(args.reference, args.seed)
+    for _ in range(args.balls):
+        reference.spawn()
+    candidate = load_engine(args.candidate or args.reference)
+
+    digest_log = open(args.digest_log, "w", encoding="utf-8") if args.digest_log else None
+    try:
+        result = run_differential(reference, candidate, args.frames, args.dt,
+                                  args.tolerance, args.decimals, digest_log)
+    finally:
+        if digest_log:
+            digest_log.close()
+
+    name = args.candidate or f"{args.reference}（自己比較）"
+    if result["diverged"]:
+        print(f"{name}: フレーム {result['first_divergent_frame']} で食い違いました "
+              f"（位置誤差 {result['position_error']:.3g}, 速度誤差 {result['velocity_error']:.3g}）")
+        return 1
+    print(f"{name}: {result['frames']}フレーム一致しました "
+          f"（最大位置誤差 {result['max_position_error']:.3g}, "
+          f"最大速度誤差 {result['max_velocity_error']:.3g}）")
+    if "first_digest_mismatch" in result:
+        print(f"  ダイジェストはフレーム {result['first_digest_mismatch']} から不一致（許容誤差内）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
@@ -0,0 +1,395 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from ensemble import Ensemble
+from implementations import SimState, load_module, load_simulation, require_uniform
+from oracle import state_error
+
+# ---------------------------
+# 空間分割による並列ステップ（共有メモリ上のボール配列）
+# ---------------------------
+# 04_o3_improved_collision.py のシーンを複数のワーカープロセスで進める。
+# ボールの位置・速度は multiprocessing.shared_memory の配列に置き、
+# 正方形のローカル座標を x 方向の短冊（ストリップ）に分けて各ワーカーに
+# 割り当てる。1ステップは3つのフェーズで、間をバリアで同期する。
+#
+#   A. 移動と壁の衝突     前のステップで自分が持っていたボールだけを進める
+#   B. 衝突ペアの検出     自分のストリップ＋右隣の境界から 2r 以内（ハロー）の
+#                         ボールでペアを探し、補正量を求める（配列は読むだけ）
+#   C. 補正の反映         自分のボールの補正と、左隣から届いたハローの補正を足す
+#
+# ペアは左側のボールが入っているストリップのワーカーが受け持つので、
+# 境界をまたぐペアも1回だけ処理される。ストリップの幅は 2r 以上にするため、
+# ハローが届くのは右隣だけになる。
+#
+# 球同士の衝突は ensemble.py と同じヤコビ法（ステップ開始時の値から全ペアの
+# 補正を求めて足し合わせる）なので、直列の Ensemble と丸め誤差の範囲で一致する。
+
+MODULE = "04"
+STEP_TIMEOUT = 60.0  # ワーカーが応答しないとみなすまでの秒数
+
+# control 配列の添字
+DT, COUNT, COMMAND = range(3)
+RUN, STOP = 0.0, 1.0
+
+# ペア探索のセルの隣接（自分のセル＋半分の近傍で、各ペアを1回だけ数える）
+NEIGHBOR_CELLS = ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def _layout(capacity, workers, buffer=None):
+    """共有メモリ上の配列の配置。buffer を渡すと配列のビューも返す"""
+    fields = [
+        ("positions", (capacity, 2), np.float64),
+        ("velocities", (capacity, 2), np.float64),
+        ("halo_delta", (workers, capacity, 4), np.float64),  # 右隣へ送る補正 (dx, dy, dvx, dvy)
+        ("control", (4,), np.float64),
+        ("owner", (capacity,), np.int32),                    # ボールを受け持つワーカー
+        ("halo_index", (workers, capacity), np.int32),       # 補正を送るボールの番号
+        ("halo_count", (workers,), np.int32),
+    ]
+    arrays, offset = {}, 0
+    for name, shape, dtype in fields:
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if buffer is not None:
+            arrays[name] = np.ndarray(shape, dtype, buffer, offset)
+        offset += -(-size // 8) * 8
+    return offset, arrays
+
+
+def strip_of(x, half, workers):
+    """ローカル座標 x が入るストリップの番号（正方形の外は端のストリップ）"""
+    width = 2 * half / workers
+    return np.clip(np.floor((x + half) / width), 0, workers - 1).astype(np.int32)
+
+
+def touching_pairs(positions, radius):
+    """重なっているペア (a, b) をセル分割で探す（04と同じ hypot < 2r で判定）"""
+    n = len(positions)
+    if n < 2:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    cell = 2 * radius
+    origin = positions.min(axis=0)
+    cells = np.floor((positions - origin) / cell).astype(np.intp)
+    columns, rows = cells.max(axis=0) + 1
+    key = cells[:, 0] * rows + cells[:, 1]
+    order = np.argsort(key, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(np.bincount(key, minlength=columns * rows))))
+    ci, cj = cells[order, 0], cells[order, 1]
+
+    first, second = [], []
+    for di, dj in NEIGHBOR_CELLS:
+        ni, nj = ci + di, cj + dj
+        valid = (ni < columns) & (nj >= 0) & (nj < rows)
+        a = np.nonzero(valid)[0]
+        neighbor = ni[a] * rows + nj[a]
+        # 同じセルの中では、並べた順で自分より後ろのボールだけと組む
+        begin = a + 1 if (di, dj) == (0, 0) else starts[neighbor]
+        end = starts[neighbor + 1]
+        counts = np.maximum(end - begin, 0)
+        total = int(counts.sum())
+        if not total:
+            continue
+        skip = np.repeat(np.cumsum(counts) - counts - begin, counts)
+        first.append(np.repeat(a, counts))
+        second.append(np.arange(total) - skip)
+    if not first:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    a, b = order[np.concatenate(first)], order[np.concatenate(second)]
+
+    delta = positions[a] - positions[b]
+    # 平方根を取らずに候補を絞り、境界付近は04と同じ hypot で判定し直す
+    near = np.einsum("ij,ij->i", delta, delta) < cell * cell * (1 + 1e-9)
+    a, b = a[near], b[near]
+    exact = np.hypot(delta[near, 0], delta[near, 1]) < cell
+    return a[exact], b[exact]
+
+
+def pair_deltas(positions, velocities, a, b, radius):
+    """ペアごとの補正をボールごとに足し合わせた (N, 4) 配列（ensemble.py と同じ計算）"""
+    n = len(positions)
+    dx = positions[a, 0] - positions[b, 0]
+    dy = positions[a, 1] - positions[b, 1]
+    dist = np.hypot(dx, dy)
+    # 距離0のときは04と同じく法線を (1, 0) にする
+    with np.errstate(invalid="ignore", divide="ignore"):
+        nx = np.where(dist > 0, dx / dist, 1.0)
+        ny = np.where(dist > 0, dy / dist, 0.0)
+    correction = (2 * radius - dist) / 2
+    v_rel = ((velocities[a, 0] - velocities[b, 0]) * nx
+             + (velocities[a, 1] - velocities[b, 1]) * ny)
+    impulse = np.where(v_rel < 0, -v_rel, 0.0)
+
+    deltas = np.empty((n, 4))
+    for column, values in enumerate((nx * correction, ny * correction, nx * impulse, ny * impulse)):
+        deltas[:, column] = np.bincount(a, values, n) - np.bincount(b, values, n)
+    return deltas
+
+
+# ---------------------------
+# ワーカー
+# ---------------------------
+def _worker(name, capacity, workers, index, half, radius, step_barrier, phase_barrier):
+    """ワーカープロセス：step_barrier で1ステップずつ進める"""
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        _, arrays = _layout(capacity, workers, shm.buf)
+        _worker_loop(arrays, workers, index, half, radius, step_barrier, phase_barrier)
+    except threading.BrokenBarrierError:
+        pass  # 親プロセスが中断した
+    finally:
+        arrays = None
+        shm.close()
+
+
+def _worker_loop(arrays, workers, index, half, radius, step_barrier, phase_barrier):
+    positions, velocities = arrays["positions"], arrays["velocities"]
+    owner, control = arrays["owner"], arrays["control"]
+    halo_index, halo_delta, halo_count = arrays["halo_index"], arrays["halo_delta"], arrays["halo_count"]
+    limit = half - radius
+    right_edge = -half + 2 * half / workers * (index + 1)
+
+    while True:
+        step_barrier.wait()
+        if control[COMMAND] == STOP:
+            return
+        dt, n = control[DT], int(control[COUNT])
+
+        # --- A. 移動と壁の衝突（自分のボールだけ） ---
+        mine = np.nonzero(owner[:n] == index)[0]
+        p, v = positions[mine], velocities[mine]
+        p += v * dt
+        over, under = p > limit, p < -limit
+        p = np.where(over, limit, np.where(under, -limit, p))
+        v = np.where(over | under, -v, v)
+        positions[mine], velocities[mine] = p, v
+        phase_barrier.wait()
+
+        # --- B. 衝突ペアの検出（自分のストリップ＋右隣のハロー） ---
+        x = positions[:n, 0]
+        strips = strip_of(x, half, workers)
+        mine = np.nonzero(strips == index)[0]
+        owner[mine] = index
+        if index + 1 < workers:
+            halo = np.nonzero((strips == index + 1) & (x < right_edge + 2 * radius))[0]
+        else:
+            halo = np.zeros(0, dtype=np.intp)
+        window = np.concatenate((mine, halo))
+        local_p, local_v = positions[window], velocities[window]
+        a, b = touching_pairs(local_p, radius)
+        # ハロー同士のペアは右隣のワーカーが受け持つ
+        keep = (a < len(mine)) | (b < len(mine))
+        deltas = pair_deltas(local_p, local_v, a[keep], b[keep], radius)
+        sent = np.nonzero(deltas[len(mine):].any(axis=1))[0]
+        halo_index[index, :len(sent)] = halo[sent]
+        halo_delta[index, :len(sent)] = deltas[len(mine) + sent]
+        halo_count[index] = len(sent)
+        phase_barrier.wait()
+
+        # --- C. 補正の反映（自分の分と、左隣から届いた分） ---
+        positions[mine] += deltas[:len(mine), :2]
+        velocities[mine] += deltas[:len(mine), 2:]
+        if index > 0:
+            m = halo_count[index - 1]
+            received = halo_index[index - 1, :m]
+            positions[received] += halo_delta[index - 1, :m, :2]
+            velocities[received] += halo_delta[index - 1, :m, 2:]
+        step_barrier.wait()
+
+
+def _shutdown(shm, processes, step_barrier, control):
+    """ワーカーを止めて共有メモリを解放（weakref.finalize から呼ぶ）"""
+    if any(p.is_alive() for p in processes):
+        control[COMMAND] = STOP
+        try:
+            step_barrier.wait(timeout=5)
+        except threading.BrokenBarrierError:
+            pass
+        for p in processes:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+    del control
+    shm.close()
+    shm.unlink()
+
+
+# ---------------------------
+# エンジン
+# ---------------------------
+class ParallelEngine:
+    """04のシーンをストリップごとのワーカープロセスで進めるエンジン（oracle.py の候補にもなる）"""
+
+    def __init__(self, workers=None, module=None):
+        self.module = module or load_module(MODULE)
+        self.requested_workers = workers or default_workers()
+        self.workers = 0
+        self.capacity = 0
+        self.count = 0
+        self.angle = 0.0
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.colors = np.zeros((0, 3), dtype=np.uint8)
+        self.arrays = None
+        self._finalizer = None
+
+    def _start(self, capacity):
+        """共有メモリを確保してワーカーを起動（ボール数が容量を超えたら作り直す）"""
+        self.close()
+        half, radius = self.module.SQUARE_HALF, self.module.BALL_RADIUS
+        # ハローが右隣にしか届かないよう、ストリップの幅を 2r 以上にする
+        self.workers = max(1, min(self.requested_workers, int(2 * half // (2 * radius))))
+        self.capacity = capacity
+        size, _ = _layout(capacity, self.workers)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        _, self.arrays = _layout(capacity, self.workers, shm.buf)
+        self.arrays["control"][:] = 0.0
+
+        self.step_barrier = multiprocessing.Barrier(self.workers + 1)
+        phase_barrier = multiprocessing.Barrier(self.workers)
+        processes = [
+            multiprocessing.Process(target=_worker, daemon=True,
+                                    args=(shm.name, capacity, self.workers, index, half, radius,
+                                          self.step_barrier, phase_barrier))
+            for index in range(self.workers)
+        ]
+        for p in processes:
+            p.start()
+        self._finalizer = weakref.finalize(self, _shutdown, shm, processes,
+                                           self.step_barrier, self.arrays["control"])
+
+    def close(self):
+        if self._finalizer is not None:
+            self.arrays = None
+            self._finalizer()
+            self._finalizer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def load_state(self, state):
+        # ワーカーは半径を1つの値で持ち、質量は等しいものとして計算する
+        require_uniform(state, self.module.BALL_RADIUS)
+        n = len(state)
+        if self.arrays is None or n > self.capacity:
+            self._start(max(n, 1))
+        self.count = n
+        self.angle = state.angle
+        self.ids = state.ids.copy()
+        self.colors = state.colors.copy()
+        self.arrays["positions"][:n] = state.positions
+        self.arrays["velocities"][:n] = state.velocities
+        self.arrays["owner"][:n] = strip_of(state.positions[:, 0], self.module.SQUARE_HALF, self.workers)
+        self.arrays["control"][COUNT] = n
+
+    def step(self, dt):
+        self.angle += self.module.ROTATION_SPEED * dt
+        self.arrays["control"][DT] = dt
+        try:
+            self.step_barrier.wait(timeout=STEP_TIMEOUT)  # ステップ開始
+            self.step_barrier.wait(timeout=STEP_TIMEOUT)  # 全フェーズ完了
+        except threading.BrokenBarrierError:
+            self.step_barrier.abort()
+            raise RuntimeError("ワーカープロセスが応答しません") from None
+
+    def state(self):
+        n = self.count
+        return SimState(self.angle, self.ids.copy(), self.arrays["positions"][:n].copy(),
+                        self.arrays["velocities"][:n].copy(), self.colors.copy())
+
+
+def default_workers():
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+
+def make_engine():
+    return ParallelEngine()
+
+
+# ---------------------------
+# 計測
+# ---------------------------
+def initial_state(balls, seed):
+    sim = load_simulation(MODULE, seed)
+    for _ in range(balls):
+        sim.spawn()
+    return sim.state()
+
+
+def measure(state, workers, frames, dt, check=False):
+    """ParallelEngine を frames ステップ進め、ボール・ステップ/秒と直列の Ensemble との最大誤差を返す"""
+    reference = Ensemble.from_states([state]) if check else None
+    with ParallelEngine(workers) as engine:
+        engine.load_state(state)
+        engine.step(dt)  # 1回目はワーカーの起動待ちなどを含むので除く
+        if reference is not None:
+            reference.step(dt)
+        error = 0.0
+        elapsed = 0.0
+        for _ in range(frames):
+            started = time.perf_counter()
+            engine.step(dt)
+            elapsed += time.perf_counter() - started
+            if reference is not None:
+                reference.step(dt)
+                error = max(error, *state_error(reference.state(0), engine.state()))
+        return len(state) * frames / elapsed, error if check else None, engine.workers
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="04のシーンを空間分割して複数プロセスで進める")
+    parser.add_argument("--workers", nargs="+", type=int, default=None,
+                        help="ワーカー数（複数指定でスケーリングを計測、省略時は1とコア数）")
+    parser.add_argument("--balls", type=int, default=10000, help="ボール数")
+    parser.add_argument("--square-size", type=float, default=4000,
+                        help="正方形の一辺（ピクセル、ボール数に合わせて広げる）")
+    parser.add_argument("--frames", type=int, default=100, help="計測するステップ数")
+    parser.add_argument("--dt", type=float, default=1.0 / 60, help="1ステップの時間（秒）")
+    parser.add_argument("--seed", type=int, default=12345, help="乱数シード")
+    parser.add_argument("--check", action="store_true",
+                        help="直列の Ensemble と並走させて最大誤差を表示")
+    parser.add_argument("--tolerance", type=float, default=1e-6, help="--check の許容誤差")
+    parser.add_argument("--output", metavar="PATH", help="JSONレポートの出力先")
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    load_simulation(MODULE).configure(square_size=args.square_size)
+    state = initial_state(args.balls, args.seed)
+    counts = args.workers or sorted({1, default_workers()})
+
+    results = []
+    baseline = None
+    for workers in counts:
+        rate, error, used = measure(state, workers, args.frames, args.dt, args.check)
+        baseline = baseline or rate
+        results.append({"workers": used, "balls": args.balls, "frames": args.frames,
+                        "ball_steps_per_s": rate, "speedup": rate / baseline, "max_error": error})
+        line = f"ワーカー {used:>3}: {rate:>12,.0f} ボール・ステップ/秒（1つ目の {rate / baseline:.2f}倍）"
+        if error is not None:
+            line += f"  最大誤差 {error:.3g}"
+        print(line)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"cores": default_workers(), "results": results}, f, indent=2, ensure_ascii=False)
+    if args.check and any(r["max_error"] > args.tolerance for r in results):
+        print(f"直列の Ensemble との誤差が許容範囲（{args.tolerance}）を超えました")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
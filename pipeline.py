@@ -0,0 +1,202 @@
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+# ---------------------------
+# 物理と描画のパイプライン（ワーカースレッドとダブルバッファ）
+# ---------------------------
+# 通常のメインループは 物理 → 描画 → flip を1つのスレッドで順に行うため、
+# 次のフレームの物理は今のフレームの flip が終わるまで始まらない。
+# パイプラインでは、物理をワーカースレッドで1フレーム先まで進めて裏の
+# バッファ（NumPy配列）に書き、メインスレッドは表のバッファを描画する。
+# フレームの区切り（swap）で表と裏を入れ替える。
+#
+#   メイン    swap ─ 記録 ─ submit ─ 描画(n) ─ flip ─ tick ─ swap ─ ...
+#   ワーカー                  └─ 物理(n+1) ─ バッファへ ─┘
+#
+# swap() から submit() までの間はワーカーが止まっているので、ボールの
+# リストを読む処理（軌跡ログ・チェックポイント）はそこで行う。次のフレームの
+# dt には今のフレームの dt を使う（--fixed-dt なら結果は逐次実行と同じ）。
+#
+# Python のコードは物理も描画も GIL を取り合うため、実際に重なるのは GIL を
+# 手放す部分（display.flip、clock.tick の待ち、NumPy の大きな演算）になる。
+# close() で表示する「重なり」は、物理の時間のうちメインスレッドが待たずに
+# 済んだ分で、複数コアのマシンでの効果の目安になる。
+
+
+def add_pipeline_arguments(parser):
+    """--pipeline 引数を追加"""
+    group = parser.add_argument_group("pipeline")
+    group.add_argument("--pipeline", action="store_true",
+                       help="物理をワーカースレッドで1フレーム先に進め、描画と重ねる")
+    return parser
+
+
+class FrameBuffer:
+    """描画に必要なボールの状態（位置・色・半径・回転角）"""
+
+    def __init__(self, capacity=64):
+        self.angle = 0.0
+        self.count = 0
+        self.positions = np.zeros((capacity, 2))
+        self.colors = np.zeros((capacity, 3), dtype=np.uint8)
+        self.radius = np.zeros(capacity)
+        self.has_radii = False
+
+    def load(self, angle, positions, colors, radii=None):
+        """位置 (x, y) と色（と半径）の列を書き込む（足りなければ配列を広げる）"""
+        n = len(positions)
+        if n > len(self.positions):
+            capacity = max(n, 2 * len(self.positions))
+            self.positions = np.zeros((capacity, 2))
+            self.colors = np.zeros((capacity, 3), dtype=np.uint8)
+            self.radius = np.zeros(capacity)
+        if n:
+            self.positions[:n] = positions
+            self.colors[:n] = colors
+            if radii is not None:
+                self.radius[:n] = radii
+        self.angle, self.count = angle, n
+        self.has_radii = radii is not None
+
+    def balls(self):
+        """書き込まれたボールの (位置, 色) の配列"""
+        return self.positions[:self.count], self.colors[:self.count]
+
+    def radii(self):
+        """書き込まれたボールの半径のリスト（書き込まれていなければ None）"""
+        return self.radius[:self.count].tolist() if self.has_radii else None
+
+
+class PhysicsPipeline:
+    """物理をワーカースレッドで進め、表と裏のバッファを入れ替える"""
+
+    def __init__(self, step, publish):
+        self.step = step        # step(dt): 物理を1フレーム進める
+        self.publish = publish  # publish(buffer): 描画する状態をバッファに書く
+        self.front, self.back = FrameBuffer(), FrameBuffer()
+        self.pending = False    # ワーカーが物理を進めている
+        self.ready = False      # 裏のバッファに次のフレームがある
+        self.error = None
+        self.frames = 0
+        self.physics_seconds = 0.0  # 物理とバッファへの書き込みにかかった時間
+        self.wait_seconds = 0.0     # メインスレッドがワーカーを待った時間
+        self._dt = None
+        self._go = threading.Semaphore(0)
+        self._done = threading.Semaphore(0)
+        self.thread = threading.Thread(target=self._run, name="physics", daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def from_args(cls, args, step, publish):
+        """--pipeline が指定されていなければ None"""
+        if not getattr(args, "pipeline", False):
+            return None
+        return cls(step, publish)
+
+    def _advance(self, dt):
+        started = time.perf_counter()
+        self.step(dt)
+        self.publish(self.back)
+        self.physics_seconds += time.perf_counter() - started
+
+    def _run(self):
+        while True:
+            self._go.acquire()
+            if self._dt is None:
+                return
+            try:
+                self._advance(self._dt)
+            except BaseException as error:
+                self.error = error
+            self._done.release()
+
+    # --- メインループから呼ぶ ---
+    def wait(self):
+        """ワーカーが物理を進め終えるまで待つ（この後はボールのリストを読んでよい）"""
+        if not self.pending:
+            return
+        started = time.perf_counter()
+        self._done.acquire()
+        self.wait_seconds += time.perf_counter() - started
+        self.pending = False
+        self.ready = True
+        if self.error:
+            raise self.error
+
+    def swap(self, dt):
+        """このフレームの状態を表のバッファにして返す
+
+        最初のフレーム（まだ何も頼んでいないとき）は、その場で dt だけ進める。
+        """
+        self.wait()
+        if not self.ready:
+            self._advance(dt)
+        self.ready = False
+        self.front, self.back = self.back, self.front
+        self.frames += 1
+        return self.front
+
+    def submit(self, dt):
+        """次のフレームの物理をワーカーに頼む（描画の前に呼ぶ）"""
+        self._dt = dt
+        self.pending = True
+        self._go.release()
+
+    def stats(self):
+        """1フレームあたりの物理・待ち・重なりの時間（ミリ秒）"""
+        frames = max(self.frames, 1)
+        physics = self.physics_seconds * 1000 / frames
+        wait = self.wait_seconds * 1000 / frames
+        return {"frames": self.frames, "physics_ms": physics, "wait_ms": wait,
+                "overlap_ms": max(physics - wait, 0.0)}
+
+    def close(self):
+        """ワーカーを止めて、重なった時間を表示"""
+        self.wait()
+        self._dt = None
+        self._go.release()
+        self.thread.join()
+        stats = self.stats()
+        print(f"パイプライン: {stats['frames']}フレーム, 物理 {stats['physics_ms']:.2f} ms/フレーム, "
+              f"待ち {stats['wait_ms']:.2f} ms, 描画と重なった時間 {stats['overlap_ms']:.2f} ms")
+        return stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="04を逐次実行とパイプラインで動かし、フレーム時間を比べる")
+    parser.add_argument("--balls", type=int, nargs="+", default=[50, 100, 200], help="ボール数")
+    parser.add_argument("--frames", type=int, default=300, help="1回の実行のフレーム数")
+    parser.add_argument("--seed", type=int, default=12345, help="乱数シード")
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    from implementations import load_module
+
+    module = load_module("04")
+    print(f"04, {args.frames}フレーム（60 FPS の上限あり、ヘッドレス、CPU {os.cpu_count()}コア）")
+    for balls in args.balls:
+        times = {}
+        for mode in ("逐次", "パイプライン"):
+            argv = ["--headless", "--seed", str(args.seed), "--max-frames", str(args.frames),
+                    "--initial-balls", str(balls)]
+            if mode == "パイプライン":
+                argv.append("--pipeline")
+            started = time.perf_counter()
+            module.main(module.parse_args(argv))
+            times[mode] = (time.perf_counter() - started) * 1000 / args.frames
+        serial, pipelined = times["逐次"], times["パイプライン"]
+        print(f"ボール {balls:>4}個: 逐次 {serial:.2f} ms/フレーム, パイプライン {pipelined:.2f} ms/フレーム"
+              f"（{serial / pipelined:.2f}倍）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
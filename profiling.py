@@ -0,0 +1,190 @@
+import cProfile
+import os
+import pstats
+import tracemalloc
+from typing import Dict, List, Optional, Tuple
+
+# ---------------------------
+# プロファイリング用フック
+# ---------------------------
+# 指定したフレーム区間だけ cProfile と tracemalloc を有効にし、
+# それ以外のフレームは計測のオーバーヘッドなしで実行する。
+
+FuncKey = Tuple[str, int, str]
+
+
+def add_profile_arguments(parser):
+    """--profile 関連のコマンドライン引数を追加"""
+    group = parser.add_argument_group("profiling")
+    group.add_argument("--profile", metavar="PREFIX",
+                       help="プロファイル結果の出力先プレフィックス（例: out/run1）")
+    group.add_argument("--profile-start", type=int, default=0, metavar="FRAME",
+                       help="計測を開始するフレーム番号")
+    group.add_argument("--profile-frames", type=int, default=300, metavar="N",
+                       help="計測するフレーム数")
+    group.add_argument("--tracemalloc-interval", type=int, default=60, metavar="N",
+                       help="tracemallocのスナップショット間隔（フレーム数、0で無効）")
+    group.add_argument("--tracemalloc-top", type=int, default=15, metavar="N",
+                       help="レポートに載せる割り当て箇所の数")
+    return parser
+
+
+def _func_label(key: FuncKey) -> str:
+    filename, lineno, name = key
+    if filename == "~":
+        # 組み込み関数は "<built-in method ...>" のような名前になる
+        return name.replace(";", ",")
+    return f"{os.path.basename(filename)}:{name}:{lineno}".replace(";", ",")
+
+
+def write_collapsed_stacks(stats: pstats.Stats, path: str, max_depth: int = 64):
+    """pstatsの呼び出しグラフを flamegraph.pl 互換の折り畳みスタック形式で書き出す
+
+    cProfileは呼び出し元→呼び出し先の辺しか持たないため、各経路の時間は
+    辺ごとの累積時間の比率で按分する（値の単位はマイクロ秒）。
+    """
+    raw = stats.stats
+    callees: Dict[FuncKey, List[Tuple[FuncKey, float]]] = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    roots = [func for func, entry in raw.items() if not entry[4]]
+    lines: Dict[str, float] = {}
+
+    def visit(func: FuncKey, fraction: float, path_labels: List[str], on_path: set):
+        _, _, tt, ct, _ = raw[func]
+        labels = path_labels + [_func_label(func)]
+        stack = ";".join(labels)
+        lines[stack] = lines.get(stack, 0.0) + tt * fraction
+        if len(labels) >= max_depth:
+            return
+        for child, edge_ct in callees.get(func, []):
+            if child in on_path or child not in raw:
+                continue
+            child_ct = raw[child][3]
+            if child_ct <= 0:
+                continue
+            child_fraction = edge_ct * fraction / child_ct
+            if child_fraction * child_ct < 1e-6:
+                continue
+            on_path.add(child)
+            visit(child, child_fraction, labels, on_path)
+            on_path.discard(child)
+
+    for root in roots:
+        visit(root, 1.0, [], {root})
+
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, seconds in sorted(lines.items()):
+            micros = int(round(seconds * 1e6))
+            if micros > 0:
+                f.write(f"{stack} {micros}\n")
+
+
+class FrameProfiler:
+    """フレーム区間を限定して cProfile / tracemalloc を実行するプロファイラ"""
+
+    def __init__(self, prefix: str, start_frame: int = 0, frame_count: int = 300,
+                 snapshot_interval: int = 60, top: int = 15):
+        self.prefix = prefix
+        self.start_frame = start_frame
+        self.end_frame = start_frame + max(1, frame_count)
+        self.snapshot_interval = snapshot_interval
+        self.top = top
+        self.profile: Optional[cProfile.Profile] = None
+        self.snapshots: List[Tuple[int, tracemalloc.Snapshot]] = []
+        self.peak_bytes = 0
+        self.last_frame = start_frame
+        self.finished = False
+
+    @classmethod
+    def from_args(cls, args) -> Optional["FrameProfiler"]:
+        """--profile が指定されていればプロファイラを生成（未指定ならNone）"""
+        if not getattr(args, "profile", None):
+            return None
+        return cls(args.profile, args.profile_start, args.profile_frames,
+                   args.tracemalloc_interval, args.tracemalloc_top)
+
+    @property
+    def active(self) -> bool:
+        return self.profile is not None
+
+    def tick(self, frame: int):
+        """各フレームの先頭で呼び出す"""
+        if self.finished:
+            return
+        self.last_frame = frame
+        if self.profile is None:
+            if frame >= self.start_frame:
+                self._start(frame)
+            return
+        if frame >= self.end_frame:
+            self.close()
+            return
+        if self.snapshot_interval > 0 and (frame - self.start_frame) % self.snapshot_interval == 0:
+            self._snapshot(frame)
+
+    def _start(self, frame: int):
+        print(f"プロファイル開始: フレーム {frame}〜{self.end_frame - 1}")
+        if self.snapshot_interval > 0:
+            tracemalloc.start(25)
+            self._snapshot(frame)
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def _snapshot(self, frame: int):
+        _, peak = tracemalloc.get_traced_memory()
+        self.peak_bytes = max(self.peak_bytes, peak)
+        self.snapshots.append((frame, tracemalloc.take_snapshot()))
+
+    def close(self):
+        """計測を終了してレポートを書き出す（区間の途中で終了した場合にも呼び出す）"""
+        if self.finished or self.profile is None:
+            self.finished = True
+            return
+        self.profile.disable()
+        self.finished = True
+
+        directory = os.path.dirname(self.prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        pstats_path = self.prefix + ".pstats"
+        self.profile.dump_stats(pstats_path)
+        stats = pstats.Stats(self.profile)
+        collapsed_path = self.prefix + ".collapsed.txt"
+        write_collapsed_stacks(stats, collapsed_path)
+        print(f"プロファイルを保存しました: {pstats_path}, {collapsed_path}")
+
+        if tracemalloc.is_tracing():
+            self._snapshot(self.last_frame)
+            tracemalloc.stop()
+            report_path = self.prefix + ".tracemalloc.txt"
+            self._write_memory_report(report_path)
+            print(f"メモリレポートを保存しました: {report_path}")
+        self.profile = None
+
+    def _write_memory_report(self, path: str):
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ]
+        first_frame, first = self.snapshots[0]
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"peak traced memory: {self.peak_bytes / 1024:.1f} KiB\n")
+            for frame, snapshot in self.snapshots[1:]:
+                snapshot = snapshot.filter_traces(filters)
+                total = sum(stat.size for stat in snapshot.statistics("filename"))
+                f.write(f"\n== frame {frame} (traced {total / 1024:.1f} KiB, "
+                        f"diff vs frame {first_frame}) ==\n")
+                diff = snapshot.compare_to(first.filter_traces(filters), "lineno")
+                for stat in diff[:self.top]:
+                    f.write(f"{stat}\n")
+
+            _, last = self.snapshots[-1]
+            f.write("\n== top allocation sites (final snapshot, traceback) ==\n")
+            for stat in last.filter_traces(filters).statistics("traceback")[:self.top]:
+                f.write(f"\n{stat.count} blocks, {stat.size / 1024:.1f} KiB\n")
+                for line in stat.traceback.format(limit=5):
+                    f.write(f"{line}\n")
@@ -0,0 +1,231 @@
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# ---------------------------
+# 記録パイプラインのベンチマーク
+# ---------------------------
+# *_90s_gif.py をヘッドレス・全速力（--unpaced）で実行し、
+# シミュレーション＋描画 / キャプチャ / エンコードの各ステージの
+# スループット、出力サイズ、ピークRSSを計測する。
+# ピークRSSを実行ごとに分離するため、1回の実行ごとに子プロセスを起動する。
+
+RECORDERS = {
+    "01": "01_o3_mini_basic_90s_gif",
+    "02": "02_o3_high_oop_90s_gif",
+    "03": "03_deepseek_r1_basic_90s_gif",
+    "04": "04_o3_improved_collision_90s_gif",
+}
+
+SYNTHETIC_SIZE = (800, 600)
+SYNTHETIC_FPS = 30
+SYNTHETIC_FRAME_SKIP = 2
+
+
+def peak_rss_mb():
+    """このプロセスのピーク常駐メモリ（MB）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linuxは KiB、macOS はバイト単位
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_recorder(key, duration, output, seed):
+    """記録スクリプトをそのまま実行し、GifRecorderを返す"""
+    import importlib
+
+    module = importlib.import_module(RECORDERS[key])
+    args = module.parse_args(["--duration", str(duration), "--output", output, "--unpaced",
+                              "--seed", str(seed)])
+    if hasattr(module, "Game"):
+        return module.Game(args).run(), int(duration * module.Config.FPS)
+    return module.main(args), int(duration * module.FPS)
+
+
+def run_synthetic(duration, output, seed, ball_count):
+    """実装に依存しない合成シーン（移動する円）でキャプチャとエンコードだけを計測"""
+    import pygame
+    from recording import GifRecorder
+
+    rng = random.Random(seed)
+    width, height = SYNTHETIC_SIZE
+    surface = pygame.Surface(SYNTHETIC_SIZE)
+    balls = [[rng.uniform(0, width), rng.uniform(0, height),
+              rng.uniform(-5, 5), rng.uniform(-5, 5),
+              (rng.randint(50, 255), rng.randint(50, 255), rng.randint(50, 255))]
+             for _ in range(ball_count)]
+    total_frames = int(duration * SYNTHETIC_FPS)
+    recorder = GifRecorder(output, SYNTHETIC_FPS, SYNTHETIC_FRAME_SKIP, total_frames)
+    for frame_count in range(total_frames):
+        surface.fill((0, 0, 0))
+        for ball in balls:
+            ball[0] = (ball[0] + ball[2]) % width
+            ball[1] = (ball[1] + ball[3]) % height
+            pygame.draw.circle(surface, ball[4], (int(ball[0]), int(ball[1])), 10)
+        recorder.capture(surface, frame_count)
+    recorder.save()
+    return recorder, total_frames
+
+
+def worker(args):
+    """子プロセス側：1回分の記録を実行して結果をJSONで出力"""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    started = time.perf_counter()
+    if args.scene == "synthetic":
+        recorder, frames = run_synthetic(args.duration, args.output, args.seed, args.balls)
+    else:
+        recorder, frames = run_recorder(args.worker, args.duration, args.output, args.seed)
+    wall = time.perf_counter() - started
+
+    stats = recorder.stats()
+    sim_render = max(stats["loop_seconds"] - stats["capture_seconds"], 1e-9)
+    captured = stats["captured_frames"]
+    result = {
+        "recorder": args.worker,
+        "scene": args.scene,
+        "duration": args.duration,
+        "frames": frames,
+        **stats,
+        "simulate_render_fps": frames / sim_render,
+        "capture_fps": captured / stats["capture_seconds"] if stats["capture_seconds"] else None,
+        "encode_fps": captured / stats["encode_seconds"] if stats["encode_seconds"] else None,
+        "wall_seconds": wall,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    # 記録スクリプトの進捗表示と区別するため、最終行にJSONを出力する
+    print(json.dumps(result))
+
+
+def launch(key, scene, duration, seed, balls, keep_dir):
+    """子プロセスで1回分の記録を実行"""
+    out_dir = keep_dir or tempfile.mkdtemp(prefix="record_bench_")
+    output = os.path.join(out_dir, f"{key}_{scene}_{duration:g}s.gif")
+    command = [sys.executable, os.path.abspath(__file__), "--worker", key,
+               "--scene", scene, "--duration", str(duration), "--seed", str(seed),
+               "--balls", str(balls), "--output", output]
+    completed = subprocess.run(command, capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    if completed.returncode != 0:
+        raise RuntimeError(f"{key} の記録に失敗しました:\n{completed.stderr}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    if not keep_dir:
+        os.remove(output)
+        os.rmdir(out_dir)
+    return result
+
+
+def format_table(results):
+    header = (f"{'rec':<10}{'scene':<10}{'dur':>6}{'sim+render':>12}{'capture':>10}"
+              f"{'encode':>10}{'enc s':>8}{'bytes':>12}{'RSS MB':>9}")
+    lines = [header, "-" * len(header)]
+    for r in results:
+        def fps(value):
+            return f"{value:>7.1f}/s" if value else f"{'-':>9}"
+        lines.append(f"{r['recorder']:<10}{r['scene']:<10}{r['duration']:>6g}"
+                     f"{r['simulate_render_fps']:>10.1f}/s {fps(r['capture_fps'])}{fps(r['encode_fps'])}"
+                     f"{r['encode_seconds']:>8.2f}{r['output_bytes']:>12,}{r['peak_rss_mb']:>9.1f}")
+    return "\n".join(lines)
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """スループット低下・サイズ増加・メモリ増加を回帰として列挙"""
+    reference = {(r["recorder"], r["scene"], r["duration"]): r for r in baseline["results"]}
+    checks = [("simulate_render_fps", False), ("capture_fps", False), ("encode_fps", False),
+              ("output_bytes", True), ("peak_rss_mb", True)]
+    regressions = []
+    for result in results:
+        base = reference.get((result["recorder"], result["scene"], result["duration"]))
+        if base is None:
+            continue
+        for metric, higher_is_worse in checks:
+            now, before = result.get(metric), base.get(metric)
+            if not now or not before:
+                continue
+            worse = now > before * (1 + tolerance) if higher_is_worse else now < before / (1 + tolerance)
+            if worse:
+                regressions.append({"recorder": result["recorder"], "scene": result["scene"],
+                                    "duration": result["duration"], "metric": metric,
+                                    "baseline": before, "current": now})
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="GIF記録パイプラインのベンチマーク")
+    parser.add_argument("--recorders", nargs="+", default=list(RECORDERS),
+                        choices=list(RECORDERS), help="計測する記録スクリプト")
+    parser.add_argument("--durations", nargs="+", type=float, default=[10.0],
+                        help="記録時間（秒、複数指定可）")
+    parser.add_argument("--scene", choices=["seeded", "synthetic"], default="seeded",
+                        help="seeded: 各スクリプトをシード固定で実行 / synthetic: 合成シーン")
+    parser.add_argument("--balls", type=int, default=50, help="合成シーンのボール数")
+    parser.add_argument("--seed", type=int, default=12345, help="乱数シード")
+    parser.add_argument("--keep-output", metavar="DIR", help="生成したGIFを残すディレクトリ")
+    parser.add_argument("--report", default="record_benchmark_report.json",
+                        help="JSONレポートの出力先")
+    parser.add_argument("--save-baseline", metavar="PATH", help="結果をベースラインとして保存")
+    parser.add_argument("--baseline", metavar="PATH", help="比較するベースライン")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="回帰とみなす悪化率（0.2 = 20%%）")
+    # 子プロセス用の内部引数
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--duration", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    if args.worker:
+        worker(args)
+        return 0
+
+    if args.keep_output:
+        os.makedirs(args.keep_output, exist_ok=True)
+    keys = ["synthetic"] if args.scene == "synthetic" else args.recorders
+    results = []
+    for key in keys:
+        for duration in args.durations:
+            print(f"  {key} ({args.scene}, {duration:g}秒) を計測中...")
+            results.append(launch(key, args.scene, duration, args.seed, args.balls,
+                                  args.keep_output))
+
+    print()
+    print(format_table(results))
+    report = {
+        "meta": {"seed": args.seed, "scene": args.scene, "python": sys.version.split()[0],
+                 "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+        if regressions:
+            print(f"回帰を検出しました（{len(regressions)}件）:")
+            for r in regressions:
+                print(f"  {r['recorder']} {r['duration']:g}秒 {r['metric']}: "
+                      f"{r['baseline']:.2f} -> {r['current']:.2f}")
+            status = 1
+        else:
+            print("回帰はありません")
+
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"レポートを保存しました: {args.report}")
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"ベースラインを保存しました: {args.save_baseline}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
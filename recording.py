@@ -0,0 +1,203 @@
+import os
+import time
+
+import pygame
+
+from frame_sink import add_sink_arguments
+
+# ---------------------------
+# GIF記録（キャプチャとエンコード）
+# ---------------------------
+# *_90s_gif.py の記録処理を共通化したもの。各ステージの所要時間を
+# 記録し、record_benchmark.py から参照できるようにする。
+#
+# --also で、同じ実行から縮小版などの出力を追加できる（PATH[:REDUCE[:SKIP]]）。
+# シミュレーションと描画は1回だけで、キャプチャしたフレームを縮小率ごとに
+# 1度だけ Pillow の reduce（ボックスフィルタ）で縮める。出力ごとに間引きの
+# 間隔と形式（拡張子で .gif / .webp / .png（APNG））を選べる。
+#
+# --sink を付けると、描画したフレームを記録の間引きとは別に、毎フレーム
+# その場でパイプか共有メモリへ流す（frame_sink.py）。
+
+
+def add_recording_arguments(parser, output, duration=90):
+    """GIF記録版スクリプト共通のコマンドライン引数を追加"""
+    group = parser.add_argument_group("recording")
+    group.add_argument("--duration", type=float, default=duration,
+                       help="記録時間（秒）")
+    group.add_argument("--output", default=output, help="GIFの出力先")
+    group.add_argument("--unpaced", action="store_true",
+                       help="実時間に合わせて待たずに全速力で記録する")
+    group.add_argument("--also", action="append", default=[], metavar="PATH[:REDUCE[:SKIP]]",
+                       help="同じ実行から追加で書き出す出力（REDUCE分の1に縮小、SKIPフレームに1枚）。"
+                            "例: --also preview.gif:4:6")
+    add_sink_arguments(parser)
+    return parser
+
+
+def parse_target(text, frame_skip):
+    """--also の値を (パス, 縮小率, 間引き) に分ける"""
+    path, *options = text.split(":")
+    if len(options) > 2 or not path:
+        raise ValueError(f"--also は PATH[:REDUCE[:SKIP]] の形で指定してください: {text}")
+    reduce = int(options[0]) if options and options[0] else 1
+    skip = int(options[1]) if len(options) > 1 and options[1] else frame_skip
+    if reduce < 1 or skip < 1:
+        raise ValueError(f"縮小率と間引きは1以上にしてください: {text}")
+    return path, reduce, skip
+
+
+def surface_to_pil_image(surface):
+    """PyGame surfaceをPIL Imageに変換"""
+    # Pillowの読み込みは起動時間に効くため、最初のキャプチャまで遅らせる
+    from PIL import Image
+    image_string = pygame.image.tostring(surface, 'RGB')
+    return Image.frombytes('RGB', surface.get_size(), image_string)
+
+
+class GifRecorder:
+    """フレームを間引いて保持し、最後にGIFとして保存する"""
+
+    def __init__(self, path, fps, frame_skip, total_frames, reduce=1, quiet=False):
+        self.path = path
+        self.fps = fps
+        self.frame_skip = frame_skip
+        self.total_frames = total_frames
+        self.reduce = reduce  # 縮小率（1で元の大きさ）
+        self.quiet = quiet    # 進み具合を表示しない（追加の出力）
+        self.sink = None      # 描画したフレームを流す先（--sink）
+        self.frames = []
+        self.frame_numbers = []  # 記録したフレームの番号（間隔が変わったときの表示時間に使う）
+        self.started = time.perf_counter()
+        self.loop_seconds = 0.0
+        self.capture_seconds = 0.0
+        self.encode_seconds = 0.0
+        self.output_bytes = 0
+
+    def wants(self, frame_count, scale=1):
+        """このフレームを記録するか（scale 倍の間隔に広げられる）"""
+        if not self.frame_numbers:
+            return frame_count % self.frame_skip == 0
+        return frame_count - self.frame_numbers[-1] >= self.frame_skip * scale
+
+    def add(self, image, frame_count):
+        """キャプチャ済みの画像（PIL Image、縮小済み）を加える"""
+        self.frames.append(image)
+        self.frame_numbers.append(frame_count)
+        if not self.quiet and len(self.frames) % 15 == 0:
+            print(f"記録中... {(frame_count / self.total_frames * 100):.1f}% 完了")
+
+    def capture(self, surface, frame_count, scale=1):
+        """フレームを間引いてGIF用に保存（scale 倍の間隔に広げられる）"""
+        if self.sink:
+            self.sink.send(surface, frame_count)
+        if not self.wants(frame_count, scale):
+            return
+        t0 = time.perf_counter()
+        image = surface_to_pil_image(surface)
+        if self.reduce > 1:
+            image = image.reduce(self.reduce)
+        self.capture_seconds += time.perf_counter() - t0
+        self.add(image, frame_count)
+
+    def save(self):
+        """記録したフレームを書き出す（形式は拡張子で決まる）"""
+        self.loop_seconds = time.perf_counter() - self.started
+        if self.sink:
+            self.sink.close()
+        if not self.quiet:
+            print("GIFを生成中...")
+        if not self.frames:
+            return
+        t0 = time.perf_counter()
+        self.frames[0].save(
+            self.path,
+            save_all=True,
+            append_images=self.frames[1:],
+            optimize=True,
+            duration=self.durations(),
+            loop=0
+        )
+        self.encode_seconds = time.perf_counter() - t0
+        self.output_bytes = os.path.getsize(self.path)
+        print(f"{'GIF' if self.path.lower().endswith('.gif') else '動画'}を保存しました: {self.path}")
+
+    def durations(self):
+        """各フレームの表示時間（ミリ秒）。間隔が一定なら1つの値"""
+        default = (1000 * self.frame_skip)//self.fps
+        gaps = [b - a for a, b in zip(self.frame_numbers, self.frame_numbers[1:])]
+        if all(gap == self.frame_skip for gap in gaps):
+            return default
+        return [(1000 * gap)//self.fps for gap in gaps] + [default]
+
+    def stats(self):
+        """ステージごとの所要時間と出力サイズ"""
+        return {
+            "captured_frames": len(self.frames),
+            "loop_seconds": self.loop_seconds,
+            "capture_seconds": self.capture_seconds,
+            "encode_seconds": self.encode_seconds,
+            "output_bytes": self.output_bytes,
+        }
+
+
+class MultiRecorder:
+    """1回の実行から、縮小率や間引きの異なる複数の出力を作る
+
+    GifRecorder と同じように capture / save / stats を呼べる。フレームの
+    キャプチャはどれかの出力が必要とするときだけ1回行い、縮小率ごとに
+    1度だけ縮める。
+    """
+
+    def __init__(self, recorders):
+        self.recorders = recorders
+        self.capture_seconds = 0.0
+        self.sink = None
+
+    def capture(self, surface, frame_count, scale=1):
+        if self.sink:
+            self.sink.send(surface, frame_count)
+        wanting = [r for r in self.recorders if r.wants(frame_count, scale)]
+        if not wanting:
+            return
+        t0 = time.perf_counter()
+        images = {1: surface_to_pil_image(surface)}
+        for recorder in wanting:
+            if recorder.reduce not in images:
+                images[recorder.reduce] = images[1].reduce(recorder.reduce)
+        self.capture_seconds += time.perf_counter() - t0
+        for recorder in wanting:
+            recorder.add(images[recorder.reduce], frame_count)
+
+    def save(self):
+        if self.sink:
+            self.sink.close()
+        for recorder in self.recorders:
+            recorder.save()
+
+    def stats(self):
+        """最初の出力の値に、キャプチャ（共通）とエンコード・サイズの合計を加えたもの"""
+        stats = self.recorders[0].stats()
+        stats["capture_seconds"] = self.capture_seconds
+        stats["encode_seconds"] = sum(r.encode_seconds for r in self.recorders)
+        stats["output_bytes"] = sum(r.output_bytes for r in self.recorders)
+        stats["outputs"] = [{"path": r.path, "reduce": r.reduce, "frame_skip": r.frame_skip,
+                             **r.stats()} for r in self.recorders]
+        return stats
+
+
+def create_recorder(args, fps, frame_skip, total_frames):
+    """--output（と --also, --sink）から記録オブジェクトを作る"""
+    recorder = GifRecorder(args.output, fps, frame_skip, total_frames)
+    also = getattr(args, "also", None)
+    if also:
+        extra = []
+        for text in also:
+            path, reduce, skip = parse_target(text, frame_skip)
+            extra.append(GifRecorder(path, fps, skip, total_frames, reduce, quiet=True))
+        recorder = MultiRecorder([recorder] + extra)
+    if getattr(args, "sink", None):
+        # 出力先のクラス（共有メモリなど）は --sink のときだけ読み込む
+        from frame_sink import FrameSink
+        recorder.sink = FrameSink.from_args(args)
+    return recorder
@@ -0,0 +1,100 @@
+import argparse
+import os
+import sys
+import time
+
+import pygame
+
+from implementations import load_simulation
+from recording import GifRecorder
+from trajectory import TrajectoryReader
+
+# ---------------------------
+# 軌跡ログからの再描画
+# ---------------------------
+# 記録済みの軌跡ログ（--trajectory）から各フレームの状態を読み込み、
+# 実装自身の描画処理（draw_scene）でそのまま描き直す。物理計算も
+# 実時間での待ちもないため、かかるのは描画とエンコードの時間だけ。
+
+
+def source_fps(reader, start, end):
+    """記録時の時刻から元のフレームレートを推定"""
+    if end - start < 2:
+        return 60
+    elapsed = reader[end - 1].time - reader[start].time
+    return round((end - start - 1) / elapsed) if elapsed > 0 else 60
+
+
+def frame_range(reader, start, end, every):
+    """再描画するフレームのインデックス（範囲指定と間引き）"""
+    count = len(reader)
+    start = max(0, start + count if start < 0 else start)
+    end = count if end is None else min(count, end + count if end < 0 else end)
+    return range(start, end, every)
+
+
+def replay(reader, frames, output, scale=1.0, fps=None):
+    """選んだフレームを再描画して GIF（.gif）または PNG 連番（ディレクトリ）に書き出す"""
+    sim = load_simulation(reader.key)
+    surface = pygame.Surface(sim.size)
+    size = (round(sim.size[0] * scale), round(sim.size[1] * scale))
+
+    as_gif = output.lower().endswith(".gif")
+    recorder = GifRecorder(output, fps, 1, len(frames)) if as_gif else None
+    if not as_gif:
+        os.makedirs(output, exist_ok=True)
+
+    t0 = time.perf_counter()
+    for n, i in enumerate(frames):
+        sim.load_state(reader.state(i))
+        sim.draw(surface)
+        image = surface if scale == 1.0 else pygame.transform.smoothscale(surface, size)
+        if recorder:
+            recorder.capture(image, n)
+        else:
+            pygame.image.save(image, os.path.join(output, f"frame_{n:06d}.png"))
+    render_seconds = time.perf_counter() - t0
+    if recorder:
+        recorder.save()
+    return render_seconds, recorder
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="軌跡ログからGIF/PNG連番を再描画")
+    parser.add_argument("trajectory", help="軌跡ログのパス（--trajectory の出力）")
+    parser.add_argument("--output", default="replay.gif",
+                        help="出力先（.gif ならGIF、それ以外はPNG連番のディレクトリ）")
+    parser.add_argument("--start", type=int, default=0, help="最初のフレーム（負の値は末尾から）")
+    parser.add_argument("--end", type=int, default=None, help="最後のフレーム（含まない）")
+    parser.add_argument("--every", type=int, default=2, help="Nフレームごとに1枚描画する")
+    parser.add_argument("--scale", type=float, default=1.0, help="出力解像度の倍率")
+    parser.add_argument("--fps", type=float, default=None,
+                        help="元のフレームレート（省略時は記録時刻から推定）")
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    if args.every < 1 or args.scale <= 0:
+        print("--every は1以上、--scale は正の値を指定してください")
+        return 2
+    reader = TrajectoryReader(args.trajectory)
+    try:
+        frames = frame_range(reader, args.start, args.end, args.every)
+        if not frames:
+            print("描画するフレームがありません")
+            return 1
+        fps = (args.fps or source_fps(reader, frames.start, frames.stop)) / args.every
+        print(f"{args.trajectory}（実装 {reader.key}）から {len(frames)}フレームを再描画します...")
+        render_seconds, recorder = replay(reader, frames, args.output, args.scale, fps)
+    finally:
+        reader.close()
+
+    encode = f", エンコード {recorder.encode_seconds:.2f}秒" if recorder else ""
+    print(f"描画 {render_seconds:.2f}秒（{len(frames) / render_seconds:.0f} fps）{encode}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
@@ -0,0 +1,368 @@
+import argparse
+import copy
+import importlib
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+import pygame
+
+# ---------------------------
+# 負荷試験のシナリオ
+# ---------------------------
+# スクリプトが生む負荷は「5秒ごとにボールを1つ追加」だけなので、調べたい
+# ボール数に届くまで何時間もかかり、実行ごとに結果も変わる。シナリオは
+# 初期のボール数・生成のスケジュール・速さの分布・回転の変化・時間を
+# JSON で書いたもので、4つの実装のどれに対しても（implementations の
+# アダプタを通して）同じ負荷を再現する。
+#
+#   {
+#     "name": "spawn-storm",
+#     "description": "...",
+#     "duration": 15,                    シミュレーション時間（秒）
+#     "dt": 0.016667,                    1ステップの時間（秒、省略時は 1/60）
+#     "seed": 12345,                     乱数シード（--seed で上書きできる）
+#     "scene": {"square_size": 400, "ball_radius": 6},   Simulation.configure に渡す値
+#     "initial": 0,                      最初に置くボールの数
+#     "max_balls": 1500,                 これを超えては生成しない（省略時は無制限）
+#     "speed": {"distribution": "uniform", "min": 100, "max": 300},   生成したボールの速さ（px/s）
+#     "spawn": [                         生成のスケジュール（時刻は秒）
+#       {"type": "interval", "every": 5, "count": 1, "start": 0, "end": 15},
+#       {"type": "burst", "at": 5, "count": 100},
+#       {"type": "ramp", "start": 0, "end": 10, "from": 5, "to": 200}     生成の頻度（個/秒）を直線的に変える
+#     ],
+#     "rotation": {"type": "sine", "mean": 10, "amplitude": 60, "period": 4}   回転の速さ（度/s）
+#   }
+#
+# 速さの分布は fixed（value）・uniform（min, max）・normal（mean, std）。
+# 回転は constant（speed）・sine（mean, amplitude, period）・steps（[[時刻, 速さ], ...]）。
+# 速さと回転は実装によらず px/s・度/s で、フレーム単位で動く01/03はアダプタが換算する。
+# 生成するボールの位置・向き・色は各実装の生成処理に任せ、速さだけを分布に合わせる。
+
+DEFAULT_DT = 1.0 / 60
+SPAWN_TYPES = ("interval", "burst", "ramp")
+DISTRIBUTIONS = ("fixed", "uniform", "normal")
+ROTATION_TYPES = ("constant", "sine", "steps")
+STAGES = ("update", "collide", "render")
+
+BUILTIN = {
+    "dense-packing": {
+        "description": "小さな正方形に大きめのボールをすき間なく詰める（ボール同士の衝突が多い）",
+        "duration": 10,
+        "scene": {"square_size": 400, "ball_radius": 12},
+        "initial": 220,
+        "speed": {"distribution": "uniform", "min": 50, "max": 150},
+        "spawn": [],
+        "rotation": {"type": "constant", "speed": 10},
+    },
+    "high-speed-tunnelling": {
+        "description": "1フレームで直径より長く進む速いボール（壁やボールのすり抜けが起きやすい）",
+        "duration": 10,
+        "scene": {"square_size": 400, "ball_radius": 10},
+        "initial": 40,
+        "speed": {"distribution": "normal", "mean": 1800, "std": 300},
+        "spawn": [{"type": "interval", "every": 1, "count": 2}],
+        "rotation": {"type": "sine", "mean": 30, "amplitude": 150, "period": 3},
+    },
+    "sparse-large-n": {
+        "description": "大きな正方形に小さなボールをたくさん（衝突は少なく、ボール数に比例する処理が効く）",
+        "duration": 5,
+        "scene": {"square_size": 560, "ball_radius": 2},
+        "initial": 2000,
+        "speed": {"distribution": "uniform", "min": 60, "max": 240},
+        "spawn": [],
+        "rotation": {"type": "constant", "speed": 10},
+    },
+    "spawn-storm": {
+        "description": "生成の頻度を 5→200 個/秒 に上げ、途中で100個ずつまとめて追加する",
+        "duration": 15,
+        "scene": {"square_size": 400, "ball_radius": 6},
+        "initial": 0,
+        "max_balls": 1500,
+        "speed": {"distribution": "uniform", "min": 100, "max": 300},
+        "spawn": [
+            {"type": "ramp", "start": 0, "end": 10, "from": 5, "to": 200},
+            {"type": "burst", "at": 5, "count": 100},
+            {"type": "burst", "at": 10, "count": 100},
+        ],
+        "rotation": {"type": "steps", "values": [[0, 10], [5, 45], [10, 90]]},
+    },
+}
+
+
+def load_scenario(name_or_path):
+    """組み込みの名前か JSON ファイルからシナリオを読み込み、検証して返す"""
+    if name_or_path in BUILTIN:
+        scenario = {"name": name_or_path, **copy.deepcopy(BUILTIN[name_or_path])}
+    else:
+        with open(name_or_path, encoding="utf-8") as f:
+            scenario = json.load(f)
+        scenario.setdefault("name", os.path.splitext(os.path.basename(name_or_path))[0])
+    validate(scenario)
+    return scenario
+
+
+def validate(scenario):
+    """足りない項目や未知の種類があれば ValueError"""
+    name = scenario.get("name", "?")
+    if not scenario.get("duration", 0) > 0:
+        raise ValueError(f"{name}: duration（秒）を正の数で指定してください")
+    for entry in scenario.get("spawn", []):
+        if entry.get("type") not in SPAWN_TYPES:
+            raise ValueError(f"{name}: 生成の種類は {', '.join(SPAWN_TYPES)} のいずれかです: {entry}")
+        validate_spawn(name, entry)
+    speed = scenario.get("speed")
+    if speed and speed.get("distribution") not in DISTRIBUTIONS:
+        raise ValueError(f"{name}: 速さの分布は {', '.join(DISTRIBUTIONS)} のいずれかです: {speed}")
+    rotation = scenario.get("rotation")
+    if rotation and rotation.get("type") not in ROTATION_TYPES:
+        raise ValueError(f"{name}: 回転の種類は {', '.join(ROTATION_TYPES)} のいずれかです: {rotation}")
+    unknown = set(scenario.get("scene", {})) - {"square_size", "ball_radius", "ball_speed", "rotation_speed"}
+    if unknown:
+        raise ValueError(f"{name}: scene の未知の項目です: {', '.join(sorted(unknown))}")
+
+
+# 生成の種類ごとの項目（必須・正の数・0以上）
+SPAWN_REQUIRED = {"interval": ("every",), "burst": ("at", "count"), "ramp": ("start", "end", "from", "to")}
+SPAWN_POSITIVE = {"interval": ("every", "count"), "burst": ("count",), "ramp": ()}
+SPAWN_NON_NEGATIVE = {"interval": ("start", "end"), "burst": ("at",), "ramp": ("start", "end", "from", "to")}
+
+
+def validate_spawn(name, entry):
+    """生成のスケジュール1件の項目と値を確かめる（spawn_count() が途中で落ちないように）"""
+    kind = entry["type"]
+    missing = [key for key in SPAWN_REQUIRED[kind] if key not in entry]
+    if missing:
+        raise ValueError(f"{name}: {kind} には {', '.join(missing)} が必要です: {entry}")
+    for key in set(SPAWN_POSITIVE[kind] + SPAWN_NON_NEGATIVE[kind]) & set(entry):
+        value = entry[key]
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{name}: {kind} の {key} は数で指定してください: {entry}")
+        if key in SPAWN_POSITIVE[kind] and not value > 0:
+            raise ValueError(f"{name}: {kind} の {key} は正の数で指定してください: {entry}")
+        if not value >= 0:
+            raise ValueError(f"{name}: {kind} の {key} は0以上で指定してください: {entry}")
+    if "end" in entry and not entry["end"] > entry.get("start", 0):
+        raise ValueError(f"{name}: {kind} の end は start より後にしてください: {entry}")
+
+
+# ---------------------------
+# スケジュール
+# ---------------------------
+def ramp_rate(entry, t):
+    """ramp の時刻 t での生成の頻度（個/秒）"""
+    fraction = (t - entry["start"]) / (entry["end"] - entry["start"])
+    return entry["from"] + (entry["to"] - entry["from"]) * fraction
+
+
+def spawn_count(entries, t0, t1, carry):
+    """時刻 (t0, t1] に生成する数（ramp の端数は carry に持ち越す）"""
+    count = 0
+    for i, entry in enumerate(entries):
+        kind = entry["type"]
+        if kind == "burst":
+            if t0 < entry["at"] <= t1 or (t0 == 0 and entry["at"] == 0):
+                count += entry["count"]
+        elif kind == "interval":
+            start, end, every = entry.get("start", 0), entry.get("end", math.inf), entry["every"]
+            # start + k·every の時刻（k ≥ 1）が区間に入った回数
+            if t1 > start and t0 < end:
+                fired = math.floor((min(t1, end) - start) / every) - math.floor(max(t0 - start, 0) / every)
+                count += max(fired, 0) * entry.get("count", 1)
+        elif kind == "ramp":
+            start, end = entry["start"], entry["end"]
+            a, b = max(t0, start), min(t1, end)
+            if b > a:
+                # 頻度を直線で補間し、区間で積分する（台形）
+                carry[i] = carry.get(i, 0.0) + (ramp_rate(entry, a) + ramp_rate(entry, b)) / 2 * (b - a)
+                whole = int(carry[i])
+                carry[i] -= whole
+                count += whole
+    return count
+
+
+def rotation_speed(profile, t):
+    """時刻 t の回転の速さ（度/s）"""
+    kind = profile["type"]
+    if kind == "constant":
+        return profile["speed"]
+    if kind == "sine":
+        return profile["mean"] + profile["amplitude"] * math.sin(2 * math.pi * t / profile["period"])
+    speed = profile["values"][0][1]
+    for start, value in profile["values"]:
+        if t >= start:
+            speed = value
+    return speed
+
+
+def sample_speed(distribution, rng):
+    """速さの分布から1つ取り出す（px/s、負にはしない）"""
+    kind = distribution["distribution"]
+    if kind == "fixed":
+        return distribution["value"]
+    if kind == "uniform":
+        return rng.uniform(distribution["min"], distribution["max"])
+    return max(rng.gauss(distribution["mean"], distribution["std"]), 0.0)
+
+
+# ---------------------------
+# 実行
+# ---------------------------
+class ScenarioRun:
+    """1つのシナリオを1つの実装で動かす"""
+
+    def __init__(self, scenario, key, seed=None):
+        from headless import init_pygame
+        from implementations import SIMULATIONS, load_module
+
+        self.scenario = scenario
+        self.seed = scenario.get("seed", 12345) if seed is None else seed
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+        init_pygame()
+        # 前のシナリオが書き換えた定数を元に戻すため、モジュールを読み込み直す
+        module = importlib.reload(load_module(key))
+        self.sim = SIMULATIONS[key](module)
+        self.sim.configure(**scenario.get("scene", {}))
+        self.sim.seed(self.seed)
+        self.rng = random.Random(f"{self.seed}:scenario")
+        self.carry = {}
+        self.time = 0.0
+        self.capped = 0  # max_balls のため生成しなかった数
+        rotation = scenario.get("rotation")
+        if rotation:
+            self.sim.set_rotation_speed(rotation_speed(rotation, 0.0))
+        self.spawn(scenario.get("initial", 0))
+
+    def spawn(self, count):
+        limit = self.scenario.get("max_balls")
+        if limit is not None:
+            allowed = max(min(count, limit - len(self.sim.balls)), 0)
+            self.capped += count - allowed
+            count = allowed
+        speed = self.scenario.get("speed")
+        for _ in range(count):
+            self.sim.spawn()
+            if speed:
+                self.sim.set_speed(len(self.sim.balls) - 1, sample_speed(speed, self.rng))
+
+    def step(self, dt):
+        """生成と回転を時刻に合わせてから1ステップ進め、(update, collide) の秒数を返す"""
+        t0, self.time = self.time, self.time + dt
+        self.spawn(spawn_count(self.scenario.get("spawn", []), t0, self.time, self.carry))
+        rotation = self.scenario.get("rotation")
+        if rotation and rotation["type"] != "constant":
+            self.sim.set_rotation_speed(rotation_speed(rotation, self.time))
+        started = time.perf_counter()
+        self.sim.update(dt)
+        updated = time.perf_counter()
+        self.sim.collide()
+        return updated - started, time.perf_counter() - updated
+
+
+def run_scenario(scenario, key, seed=None, render=False, max_seconds=None):
+    """シナリオを最後まで（または max_seconds の実時間まで）動かし、結果の辞書を返す"""
+    run = ScenarioRun(scenario, key, seed)
+    surface = pygame.Surface(run.sim.size) if render else None
+    dt = scenario.get("dt", DEFAULT_DT)
+    steps = int(round(scenario["duration"] / dt))
+    timings = {stage: [] for stage in STAGES}
+    peak = len(run.sim.balls)
+    started = time.perf_counter()
+    for _ in range(steps):
+        update, collide = run.step(dt)
+        timings["update"].append(update)
+        timings["collide"].append(collide)
+        if surface is not None:
+            t0 = time.perf_counter()
+            run.sim.draw(surface)
+            timings["render"].append(time.perf_counter() - t0)
+        peak = max(peak, len(run.sim.balls))
+        if max_seconds and time.perf_counter() - started > max_seconds:
+            break
+    frames = len(timings["update"])
+    totals = [u + c + (timings["render"][i] if surface is not None else 0.0)
+              for i, (u, c) in enumerate(zip(timings["update"], timings["collide"]))]
+    totals.sort()
+    result = {
+        "scenario": scenario["name"],
+        "implementation": key,
+        "seed": run.seed,
+        "frames": frames,
+        "completed": frames == steps,
+        "sim_seconds": frames * dt,
+        "balls_final": len(run.sim.balls),
+        "balls_peak": peak,
+        "capped": run.capped,
+        "frame_ms_p50": totals[len(totals) // 2] * 1000 if totals else 0.0,
+        "frame_ms_p99": totals[min(len(totals) - 1, int(len(totals) * 0.99))] * 1000 if totals else 0.0,
+        "wall_seconds": time.perf_counter() - started,
+    }
+    for stage, values in timings.items():
+        if values:
+            result[f"{stage}_ms"] = statistics.fmean(values) * 1000
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="負荷試験のシナリオを4つの実装で動かし、フレーム時間を比べる")
+    parser.add_argument("scenarios", nargs="*", default=list(BUILTIN), metavar="SCENARIO",
+                        help=f"組み込みの名前（{', '.join(BUILTIN)}）か JSON ファイル（省略時はすべての組み込み）")
+    parser.add_argument("--implementations", nargs="+", default=["01", "02", "03", "04"],
+                        help="実装")
+    parser.add_argument("--seed", type=int, default=None, help="シナリオのシードを上書きする")
+    parser.add_argument("--duration", type=float, default=None, help="シナリオの時間（秒）を上書きする")
+    parser.add_argument("--render", action="store_true", help="描画の時間も計る（ダミーのサーフェスへ）")
+    parser.add_argument("--max-seconds", type=float, default=60.0,
+                        help="1回の実行の実時間の上限（秒、超えたら打ち切る）")
+    parser.add_argument("--list", action="store_true", help="組み込みのシナリオを一覧する")
+    parser.add_argument("--show", metavar="NAME", help="シナリオを JSON で表示する（書き換えて使う元に）")
+    parser.add_argument("--output", metavar="PATH", help="結果を JSON で書き出す")
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    if args.list:
+        for name, scenario in BUILTIN.items():
+            print(f"{name:<22} {scenario['description']}")
+        return 0
+    if args.show:
+        print(json.dumps(load_scenario(args.show), indent=2, ensure_ascii=False))
+        return 0
+
+    from implementations import SIMULATIONS
+
+    unknown = [key for key in args.implementations if key not in SIMULATIONS]
+    if unknown:
+        print(f"未知の実装です: {', '.join(unknown)}")
+        return 2
+    results = []
+    for name in args.scenarios:
+        scenario = load_scenario(name)
+        if args.duration:
+            scenario["duration"] = args.duration
+        print(f"{scenario['name']}: {scenario.get('description', '')}")
+        for key in args.implementations:
+            result = run_scenario(scenario, key, args.seed, args.render, args.max_seconds)
+            results.append(result)
+            stages = ", ".join(f"{stage} {result[f'{stage}_ms']:.2f}" for stage in STAGES
+                               if f"{stage}_ms" in result)
+            note = "" if result["completed"] else f"（{result['sim_seconds']:.1f}秒で打ち切り）"
+            print(f"  {key}: ボール {result['balls_final']}（最大 {result['balls_peak']}）, "
+                  f"フレーム p50 {result['frame_ms_p50']:.2f} ms / p99 {result['frame_ms_p99']:.2f} ms "
+                  f"[{stages}]{note}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"results": results}, f, indent=2, ensure_ascii=False)
+        print(f"結果を保存しました: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
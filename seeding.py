@@ -0,0 +1,37 @@
+import random
+
+# ---------------------------
+# 再現可能な乱数ストリーム
+# ---------------------------
+# 生成位置・速度・色ごとに独立した random.Random を持つ。ストリームを分けて
+# おくことで、例えば色の決め方を変えても位置と速度の系列は変わらない。
+
+
+def add_seed_argument(parser):
+    """--seed 引数を追加"""
+    parser.add_argument("--seed", type=int, default=None,
+                        help="ボール生成の乱数シード（省略時は毎回異なる）")
+    return parser
+
+
+class SpawnStreams:
+    """ボール生成用の乱数ストリーム（position / velocity / color）"""
+    NAMES = ("position", "velocity", "color")
+
+    def __init__(self, seed=None):
+        self.reseed(seed)
+
+    def reseed(self, seed=None):
+        """シードを設定し直す（Noneならシステムの乱数で初期化）"""
+        self.seed = seed
+        for name in self.NAMES:
+            # 文字列シードはPythonのバージョンやハッシュのランダム化に依存しない
+            stream = random.Random() if seed is None else random.Random(f"{seed}:{name}")
+            setattr(self, name, stream)
+
+    def getstate(self):
+        return {name: getattr(self, name).getstate() for name in self.NAMES}
+
+    def setstate(self, state):
+        for name in self.NAMES:
+            getattr(self, name).setstate(state[name])
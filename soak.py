@@ -0,0 +1,216 @@
+import gc
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+
+# ---------------------------
+# ソークテスト（ボール数の上限とオブジェクトの再利用）
+# ---------------------------
+# どのスクリプトも5秒ごとにボールを追加するだけで減らさないため、長時間の
+# 実行ではボール数とフレーム時間が増え続ける。ソークモードでは上限
+# （--max-balls）を設け、超える前に方針に従ってボールを退場させる。
+#
+#   oldest    最も古いボールから
+#   lifetime  --ball-lifetime 秒を過ぎたボールから（上限を超えるときは古い順）
+#   random    ランダムに選んだボールを
+#
+# 退場したボール（オブジェクトやdict）はプールに戻し、次の生成で初期化し
+# 直して使う。一定時間ごとにフレーム時間・割り当ての量・メモリを報告し、
+# 終了時には後半の区間を定常状態としてまとめる。
+#
+# 割り当ての量は、世代0のGCの回数 × しきい値（＝GC対象オブジェクトの
+# 割り当て数の目安）と、生きているメモリブロック数の増減で見る。
+
+POLICIES = ("oldest", "lifetime", "random")
+
+
+def add_soak_arguments(parser):
+    """--max-balls などソークモードの引数を追加"""
+    group = parser.add_argument_group("soak")
+    group.add_argument("--max-balls", type=int, default=0, metavar="N",
+                       help="ボール数の上限（0で無制限＝従来どおり）")
+    group.add_argument("--retire", choices=POLICIES, default="oldest",
+                       help="上限に達したときに退場させるボールの選び方")
+    group.add_argument("--ball-lifetime", type=float, default=60.0, metavar="SECONDS",
+                       help="--retire lifetime でのボールの寿命（秒）")
+    group.add_argument("--soak-report", metavar="PATH",
+                       help="区間ごとの統計を書き出すファイル（JSON Lines）")
+    group.add_argument("--soak-interval", type=float, default=60.0, metavar="SECONDS",
+                       help="統計を報告する間隔（秒、実時間）")
+    return parser
+
+
+def rss_mb():
+    """現在の常駐メモリ（MB）。/proc がなければ最大値で代用する"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Population:
+    """ボール数の上限・退場・オブジェクトプールと、定常状態の計測"""
+
+    def __init__(self, max_balls, policy="oldest", lifetime=60.0, seed=None,
+                 report_path=None, interval=60.0, watchers=()):
+        self.max_balls = max_balls
+        self.policy = policy
+        self.lifetime = lifetime
+        self.rng = random.Random(None if seed is None else f"{seed}:retire")
+        self.pool = []
+        self.born = []          # balls と同じ順に並べた生成時刻（シミュレーション時間）
+        self.clock = 0.0
+        self.retired = 0
+        self.reused = 0
+        # ボールのリストを共有する Simulation（軌跡ログ・配信）のIDも一緒に消す
+        self.watchers = [w for w in watchers if w is not None]
+
+        self.interval = interval
+        self.report = open(report_path, "a", encoding="utf-8") if report_path else None
+        self.intervals = []
+        self.started = time.perf_counter()
+        self._reset_interval(self.started)
+
+    @classmethod
+    def from_args(cls, args, *shared):
+        """--max-balls が指定されていなければ None
+
+        shared には軌跡ログや配信サーバーを渡す（それぞれの source のIDを同期する）。
+        """
+        if not getattr(args, "max_balls", 0):
+            return None
+        watchers = [getattr(s, "source", None) for s in shared if s is not None]
+        return cls(args.max_balls, args.retire, args.ball_lifetime, args.seed,
+                   args.soak_report, args.soak_interval, watchers)
+
+    # --- 退場とプール ---
+    def _sync(self, balls):
+        # スクリプトが追加したボールの生成時刻を記録
+        if len(self.born) < len(balls):
+            self.born.extend([self.clock] * (len(balls) - len(self.born)))
+
+    def _retire(self, balls, index):
+        ball = balls.pop(index)
+        self.born.pop(index)
+        for sim in self.watchers:
+            if index < len(sim.ids):
+                del sim.ids[index]
+        if len(self.pool) < self.max_balls:
+            self.pool.append(ball)
+        self.retired += 1
+
+    def _victim(self, balls):
+        if self.policy == "random":
+            return self.rng.randrange(len(balls))
+        return 0  # 追加順に並んでいるので先頭が最も古い
+
+    def make_room(self, balls, count=1):
+        """count 個を追加できるよう、上限を超える分のボールを退場させる"""
+        self._sync(balls)
+        while balls and len(balls) + count > self.max_balls:
+            self._retire(balls, self._victim(balls))
+
+    def take(self):
+        """プールのボールを1つ取り出す（空なら None、呼び出し側で初期化し直す）"""
+        if not self.pool:
+            return None
+        self.reused += 1
+        return self.pool.pop()
+
+    def recycle(self, cls, *args):
+        """プールのオブジェクトを __init__ で初期化し直して返す（空なら新しく作る）"""
+        ball = self.take()
+        if ball is None:
+            return cls(*args)
+        ball.__init__(*args)
+        return ball
+
+    # --- 毎フレーム ---
+    def tick(self, balls, dt):
+        """寿命・上限の処理と計測（毎フレーム、シミュレーションの dt 秒を渡す）"""
+        self.clock += dt
+        self._sync(balls)
+        if self.policy == "lifetime":
+            expired = [i for i, born in enumerate(self.born) if self.clock - born > self.lifetime]
+            for index in reversed(expired):
+                self._retire(balls, index)
+        while len(balls) > self.max_balls:
+            self._retire(balls, self._victim(balls))
+
+        now = time.perf_counter()
+        self.frame_times.append((now - self.last_tick) * 1000)
+        self.last_tick = now
+        if now - self.interval_started >= self.interval:
+            self._report(balls, now)
+
+    def _reset_interval(self, now):
+        self.interval_started = now
+        self.last_tick = now
+        self.frame_times = []
+        self.gc_collections = gc.get_stats()[0]["collections"]
+        self.blocks = sys.getallocatedblocks()
+        self.retired_at_start = self.retired
+        self.reused_at_start = self.reused
+
+    def _report(self, balls, now):
+        elapsed = now - self.interval_started
+        times = sorted(self.frame_times) or [0.0]
+        collections = gc.get_stats()[0]["collections"] - self.gc_collections
+        blocks = sys.getallocatedblocks()
+        entry = {
+            "elapsed_s": round(now - self.started, 1),
+            "frames": len(self.frame_times),
+            "balls": len(balls),
+            "pool": len(self.pool),
+            "frame_ms_mean": statistics.fmean(times),
+            "frame_ms_p50": times[len(times) // 2],
+            "frame_ms_p99": times[min(len(times) - 1, int(len(times) * 0.99))],
+            "allocations_per_s": collections * gc.get_threshold()[0] / elapsed,
+            "live_blocks": blocks,
+            "live_blocks_per_s": (blocks - self.blocks) / elapsed,
+            "rss_mb": rss_mb(),
+            "retired": self.retired - self.retired_at_start,
+            "reused": self.reused - self.reused_at_start,
+        }
+        self.intervals.append(entry)
+        print(f"[soak {entry['elapsed_s']:.0f}s] ボール {entry['balls']} (プール {entry['pool']}), "
+              f"フレーム {entry['frame_ms_mean']:.2f} ms (p99 {entry['frame_ms_p99']:.2f}), "
+              f"割り当て {entry['allocations_per_s']:,.0f}/s, "
+              f"ブロック増減 {entry['live_blocks_per_s']:+.1f}/s, RSS {entry['rss_mb']:.1f} MB")
+        if self.report:
+            self.report.write(json.dumps(entry) + "\n")
+            self.report.flush()
+        self._reset_interval(now)
+
+    def summary(self):
+        """後半の区間を定常状態としてまとめる"""
+        steady = self.intervals[len(self.intervals) // 2:]
+        if not steady:
+            return None
+        return {
+            "intervals": len(steady),
+            "frame_ms_mean": statistics.fmean(e["frame_ms_mean"] for e in steady),
+            "frame_ms_p99": max(e["frame_ms_p99"] for e in steady),
+            "allocations_per_s": statistics.fmean(e["allocations_per_s"] for e in steady),
+            "live_blocks_per_hour": statistics.fmean(e["live_blocks_per_s"] for e in steady) * 3600,
+            "rss_mb_growth": steady[-1]["rss_mb"] - steady[0]["rss_mb"],
+            "balls": steady[-1]["balls"],
+        }
+
+    def close(self):
+        summary = self.summary()
+        if summary:
+            print(f"[soak] 定常状態（後半 {summary['intervals']}区間）: "
+                  f"フレーム {summary['frame_ms_mean']:.2f} ms (p99 最大 {summary['frame_ms_p99']:.2f}), "
+                  f"割り当て {summary['allocations_per_s']:,.0f}/s, "
+                  f"ブロック増減 {summary['live_blocks_per_hour']:+,.0f}/時, "
+                  f"RSSの増加 {summary['rss_mb_growth']:+.1f} MB")
+            if self.report:
+                self.report.write(json.dumps({"summary": summary}) + "\n")
+        if self.report:
+            self.report.close()
@@ -0,0 +1,367 @@
+import argparse
+import heapq
+import math
+import sys
+import time
+
+import numpy as np
+import pygame
+
+from transform import Affine
+
+# ---------------------------
+# ボールの位置の検索（点・半径・近い順）
+# ---------------------------
+# 「この点の近くにどのボールがあるか」を調べる手段がなかったので、生きている
+# ボールの位置に索引を付け、マウスでの選択・重ね描きの当たり判定・分析から
+# 次の問い合わせができるようにする。
+#
+#   at_point(x, y)        その点を含むボール
+#   within(x, y, r)       中心が点から r 以内のボール
+#   nearest(x, y, k)      中心が点に近い順に k 個（距離も返す）
+#
+# 座標は正方形のローカル座標で、screen=True ならスクリーン座標を set_transform()
+# で渡した変換の逆でローカル座標に直してから調べる（回転なので距離は変わらない）。
+# 複数の点をまとめて調べる *_many() は (N, 2) の配列を受け取る。
+#
+# 索引はセルの一辺が一定のハッシュ格子で、ボールごとにスロット（配列の行）を
+# 割り当てて位置を持つ。update() は毎フレーム位置をまとめて書き込み、セルが
+# 変わったボールだけを移す（作り直さない）。ボールの追加・退場もスロットの
+# 割り当てと解放だけで済ませる。
+
+CELL_FACTOR = 2.0  # セルの一辺 = 最大の半径 × CELL_FACTOR（点の問い合わせは周囲 3×3 で足りる）
+
+
+def add_query_arguments(parser):
+    """--pick 引数を追加"""
+    group = parser.add_argument_group("spatial query")
+    group.add_argument("--pick", action="store_true",
+                       help="クリックしたボールを選んで強調し、近くのボールを表示する")
+    return parser
+
+
+def _cell_key(cx, cy):
+    """セルの座標を1つの整数にまとめる（NumPy 配列にも使える）"""
+    return (cx << 32) ^ (cy & 0xFFFFFFFF)
+
+
+class SpatialIndex:
+    """ボールの位置のハッシュ格子（フレームごとに差分だけ更新する）"""
+
+    def __init__(self, cell=20.0, capacity=1024):
+        self.cell = cell
+        self.cells = {}            # セルのキー → スロットの集合
+        self.slot_of = {}          # id(ボール) → スロット
+        self.items = [None] * capacity
+        self.free = list(range(capacity - 1, -1, -1))
+        self.positions = np.zeros((capacity, 2))
+        self.radii = np.zeros(capacity)
+        self.keys = np.zeros(capacity, dtype=np.int64)
+        self.placed = np.zeros(capacity, dtype=bool)  # どれかのセルに入っている
+        self.max_radius = 0.0
+        self._order = []           # 前回の update() のボールの並び（id）
+        self._slots = np.zeros(0, dtype=np.int64)
+        self.inverse = None        # スクリーン → ローカルの変換
+        self.moved = 0             # 最後の update() でセルを移ったボールの数
+
+    # --- 更新 ---
+    def _grow(self):
+        old = len(self.items)
+        self.items.extend([None] * old)
+        self.free.extend(range(2 * old - 1, old - 1, -1))
+        self.positions = np.concatenate([self.positions, np.zeros((old, 2))])
+        self.radii = np.concatenate([self.radii, np.zeros(old)])
+        self.keys = np.concatenate([self.keys, np.zeros(old, dtype=np.int64)])
+        self.placed = np.concatenate([self.placed, np.zeros(old, dtype=bool)])
+
+    def _remove(self, slot):
+        if self.placed[slot]:
+            self.cells[int(self.keys[slot])].discard(slot)
+        del self.slot_of[id(self.items[slot])]
+        self.items[slot] = None
+        self.placed[slot] = False
+        self.free.append(slot)
+
+    def _reassign(self, balls, order):
+        """ボールの並びが変わったとき: 退場したものを外し、新しいものにスロットを割り当てる"""
+        present = set(order)
+        for key in [key for key in self.slot_of if key not in present]:
+            self._remove(self.slot_of[key])
+        slots = []
+        for ball, key in zip(balls, order):
+            slot = self.slot_of.get(key)
+            if slot is None:
+                if not self.free:
+                    self._grow()
+                slot = self.free.pop()
+                self.slot_of[key] = slot
+                self.items[slot] = ball
+            slots.append(slot)
+        self._order = order
+        self._slots = np.array(slots, dtype=np.int64)
+
+    def update(self, balls, positions, radii):
+        """今のボールの位置（ローカル座標）と半径で索引を更新する"""
+        order = [id(ball) for ball in balls]
+        if order != self._order:
+            self._reassign(balls, order)
+        slots = self._slots
+        if not len(slots):
+            self.moved = 0
+            return
+        self.positions[slots] = positions
+        self.radii[slots] = radii
+        self.max_radius = float(self.radii[slots].max())
+        cells = np.floor(self.positions[slots] / self.cell).astype(np.int64)
+        keys = _cell_key(cells[:, 0], cells[:, 1])
+        moved = np.flatnonzero((keys != self.keys[slots]) | ~self.placed[slots])
+        for slot, key, placed in zip(slots[moved].tolist(), keys[moved].tolist(),
+                                     self.placed[slots[moved]].tolist()):
+            if placed:
+                self.cells[int(self.keys[slot])].discard(slot)
+            self.cells.setdefault(key, set()).add(slot)
+        self.keys[slots] = keys
+        self.placed[slots] = True
+        self.moved = len(moved)
+
+    def set_transform(self, transform):
+        """スクリーン座標での問い合わせに使う変換（ローカル → スクリーン）"""
+        self.inverse = transform.inverse()
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def __contains__(self, ball):
+        return id(ball) in self.slot_of
+
+    def position(self, ball):
+        """最後の update() の時点でのボールの位置と半径（ローカル座標）"""
+        slot = self.slot_of[id(ball)]
+        x, y = self.positions[slot].tolist()
+        return x, y, float(self.radii[slot])
+
+    # --- 問い合わせ ---
+    def _local(self, x, y, screen):
+        if screen:
+            if self.inverse is None:
+                raise ValueError("screen=True の前に set_transform() を呼んでください")
+            return self.inverse.point(x, y)
+        return x, y
+
+    def _candidates(self, x, y, reach):
+        """中心が (x, y) から reach 以内にありうるスロット"""
+        size = self.cell
+        x0, x1 = math.floor((x - reach) / size), math.floor((x + reach) / size)
+        y0, y1 = math.floor((y - reach) / size), math.floor((y + reach) / size)
+        found = []
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                members = self.cells.get(_cell_key(cx, cy))
+                if members:
+                    found.extend(members)
+        return np.array(found, dtype=np.int64)
+
+    def _distances(self, slots, x, y):
+        return np.hypot(self.positions[slots, 0] - x, self.positions[slots, 1] - y)
+
+    def at_point(self, x, y, screen=False):
+        """その点を含むボール（中心に近い順）"""
+        x, y = self._local(x, y, screen)
+        slots = self._candidates(x, y, self.max_radius)
+        if not len(slots):
+            return []
+        distances = self._distances(slots, x, y)
+        inside = distances <= self.radii[slots]
+        order = np.argsort(distances[inside], kind="stable")
+        return [self.items[slot] for slot in slots[inside][order].tolist()]
+
+    def within(self, x, y, radius, screen=False):
+        """中心が点から radius 以内のボール（近い順）"""
+        x, y = self._local(x, y, screen)
+        slots = self._candidates(x, y, radius)
+        if not len(slots):
+            return []
+        distances = self._distances(slots, x, y)
+        near = distances <= radius
+        order = np.argsort(distances[near], kind="stable")
+        return [self.items[slot] for slot in slots[near][order].tolist()]
+
+    def nearest(self, x, y, k=1, screen=False):
+        """中心が点に近い順に k 個の (ボール, 距離)
+
+        点のセルから1周ずつ外へ広げ、k 番目の距離がまだ調べていない周より
+        近くなった時点でやめる。
+        """
+        x, y = self._local(x, y, screen)
+        k = min(k, len(self))
+        if k <= 0:
+            return []
+        size = self.cell
+        cx, cy = math.floor(x / size), math.floor(y / size)
+        best = []  # (-距離, スロット) の最大ヒープ（k 個まで）
+        ring = 0
+        while True:
+            for i, j in _ring(cx, cy, ring):
+                members = self.cells.get(_cell_key(i, j))
+                if not members:
+                    continue
+                slots = np.fromiter(members, dtype=np.int64, count=len(members))
+                for slot, distance in zip(slots.tolist(), self._distances(slots, x, y).tolist()):
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, slot))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, slot))
+            # 次の周のセルはどれも ring × size より遠い
+            if len(best) == k and -best[0][0] <= ring * size:
+                break
+            ring += 1
+        return [(self.items[slot], -negative) for negative, slot in sorted(best, reverse=True)]
+
+    # --- まとめて問い合わせ ---
+    def _points(self, points, screen):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if screen:
+            if self.inverse is None:
+                raise ValueError("screen=True の前に set_transform() を呼んでください")
+            points = self.inverse.apply(points)
+        return points.tolist()
+
+    def at_points(self, points, screen=False):
+        """(N, 2) の点ごとの at_point() の結果のリスト"""
+        return [self.at_point(x, y) for x, y in self._points(points, screen)]
+
+    def within_many(self, points, radius, screen=False):
+        """(N, 2) の点ごとの within() の結果のリスト"""
+        return [self.within(x, y, radius) for x, y in self._points(points, screen)]
+
+    def nearest_many(self, points, k=1, screen=False):
+        """(N, 2) の点ごとの nearest() の結果のリスト"""
+        return [self.nearest(x, y, k) for x, y in self._points(points, screen)]
+
+
+class Picker:
+    """クリックしたボールを選び、強調して描く（--pick）"""
+
+    def __init__(self, max_radius, center, neighbors=4):
+        self.index = SpatialIndex(max_radius * CELL_FACTOR)
+        self.center = center        # 正方形の中心（スクリーン座標）
+        self.neighbors = neighbors  # 選んだときに表示する近くのボールの数
+        self.picked = None
+        self.transform = None
+
+    @classmethod
+    def from_args(cls, args, max_radius, center):
+        """--pick が指定されていなければ None"""
+        if not getattr(args, "pick", False):
+            return None
+        return cls(max_radius, center)
+
+    def track(self, balls, angle):
+        """今のフレームの位置で索引を更新する（ボールのリストを読めるときに呼ぶ）"""
+        self.index.update(balls, [(b.x, b.y) for b in balls], [b.radius for b in balls])
+        self.transform = Affine.rotation(angle, self.center)
+        self.index.set_transform(self.transform)
+
+    def click(self, position):
+        """スクリーン座標の点にあるボールを選び、その様子を表示する"""
+        if self.transform is None:
+            return None
+        started = time.perf_counter()
+        hits = self.index.at_point(*position, screen=True)
+        elapsed = (time.perf_counter() - started) * 1e6
+        self.picked = hits[0] if hits else None
+        if self.picked is None:
+            print(f"[pick] {position}: ボールはありません（{elapsed:.0f} µs）")
+            return None
+        x, y, radius = self.index.position(self.picked)
+        near = [(ball, distance) for ball, distance in self.index.nearest(x, y, self.neighbors + 1)
+                if ball is not self.picked][:self.neighbors]
+        print(f"[pick] ({x:.1f}, {y:.1f}) 半径 {radius:.1f}, 速さ "
+              f"{math.hypot(self.picked.vx, self.picked.vy):.1f} px/s（{elapsed:.0f} µs）。近いボール: "
+              + ", ".join(f"{distance:.1f} px" for _, distance in near))
+        return self.picked
+
+    def draw(self, screen):
+        """選んだボールに輪を描く（退場していれば選択を外す）"""
+        if self.picked is None:
+            return
+        if self.picked not in self.index:
+            self.picked = None
+            return
+        x, y, radius = self.index.position(self.picked)
+        sx, sy = self.transform.point(x, y)
+        pygame.draw.circle(screen, (255, 255, 255), (int(sx), int(sy)), int(radius) + 4, 2)
+
+
+def _ring(cx, cy, ring):
+    """(cx, cy) からチェビシェフ距離 ring のセル"""
+    if ring == 0:
+        yield cx, cy
+        return
+    for i in range(cx - ring, cx + ring + 1):
+        yield i, cy - ring
+        yield i, cy + ring
+    for j in range(cy - ring + 1, cy + ring):
+        yield cx - ring, j
+        yield cx + ring, j
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="動いているボールの索引の更新時間と、問い合わせの時間を計る")
+    parser.add_argument("--balls", type=int, default=10000, help="ボールの数")
+    parser.add_argument("--size", type=float, default=2000.0, help="ボールを置く正方形の一辺")
+    parser.add_argument("--radius", type=float, default=5.0, help="ボールの半径")
+    parser.add_argument("--frames", type=int, default=60, help="動かして更新するフレーム数")
+    parser.add_argument("--queries", type=int, default=1000, help="問い合わせの回数")
+    parser.add_argument("--seed", type=int, default=12345, help="乱数シード")
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    rng = np.random.default_rng(args.seed)
+    half = args.size / 2
+    balls = [object() for _ in range(args.balls)]
+    positions = rng.uniform(-half, half, (args.balls, 2))
+    velocities = rng.normal(0, 200, (args.balls, 2))
+    radii = np.full(args.balls, args.radius)
+    index = SpatialIndex(args.radius * CELL_FACTOR)
+
+    started = time.perf_counter()
+    index.update(balls, positions, radii)
+    print(f"ボール {args.balls}個: 最初の登録 {(time.perf_counter() - started) * 1000:.2f} ms")
+    update_ms, moved = [], []
+    for _ in range(args.frames):
+        positions += velocities / 60
+        np.clip(positions, -half, half, out=positions)
+        started = time.perf_counter()
+        index.update(balls, positions, radii)
+        update_ms.append((time.perf_counter() - started) * 1000)
+        moved.append(index.moved)
+    print(f"  更新 {np.mean(update_ms):.2f} ms/フレーム（セルを移ったボール 平均 {np.mean(moved):.0f}個）")
+
+    points = rng.uniform(-half, half, (args.queries, 2))
+    # 正しさの確認用に総当たりで求める
+    distances = np.hypot(positions[:, None, 0] - points[None, :, 0], positions[:, None, 1] - points[None, :, 1])
+    within_r = 4 * args.radius
+    cases = [
+        ("at_point", lambda x, y: index.at_point(x, y), lambda d: int((d <= radii).sum())),
+        (f"within r={within_r:g}", lambda x, y: index.within(x, y, within_r),
+         lambda d: int((d <= within_r).sum())),
+        ("nearest k=8", lambda x, y: index.nearest(x, y, 8), lambda d: 8),
+    ]
+    for name, query, expected in cases:
+        started = time.perf_counter()
+        results = [query(x, y) for x, y in points.tolist()]
+        elapsed = (time.perf_counter() - started) * 1e6 / args.queries
+        wrong = sum(len(result) != expected(distances[:, i]) for i, result in enumerate(results))
+        print(f"  {name:<14} {elapsed:8.1f} µs/回  総当たりと数が違う: {wrong}")
+    started = time.perf_counter()
+    index.nearest_many(points, 8)
+    print(f"  nearest_many   {(time.perf_counter() - started) * 1000:8.2f} ms / {args.queries}点")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
@@ -0,0 +1,231 @@
+import argparse
+import math
+import sys
+import time
+
+# ---------------------------
+# 重ならないボールの一括生成
+# ---------------------------
+# 04 の spawn_ball() は一様な乱数で位置を決めるだけなので、混み合うと既存の
+# ボールの中に生成され、resolve_ball_collisions が何フレームもかけて強く
+# 押し戻すことになる。ここではボールの中心を格子（セルの一辺 = 最小距離）に
+# 登録し、周囲 3×3 のセルだけを調べて重ならない位置を探す。
+#
+#   rejection  一様な乱数で候補を出し、重なるものを捨てる（attempts 回まで）
+#   poisson    ポアソンディスク（Bridson法）で既存のボールの周りから空きを埋める
+#
+# 置けなくなったら「満杯」として、置けた数を返す。乱数は spawn_rng の
+# position ストリームを使うので、--seed を付ければ同じ配置になる。
+
+METHODS = ("uniform", "rejection", "poisson")
+POISSON_CANDIDATES = 30  # Bridson法で1点の周りに試す候補の数
+
+
+def add_spawning_arguments(parser):
+    """ボール生成の方法・一度に生成する数の引数を追加"""
+    group = parser.add_argument_group("spawning")
+    group.add_argument("--spawn-method", choices=METHODS, default="uniform",
+                       help="uniform: 重なりを確かめない（従来どおり）、"
+                            "rejection: 棄却サンプリング、poisson: ポアソンディスクで空きを埋める")
+    group.add_argument("--spawn-burst", type=int, default=1, metavar="N",
+                       help="生成のたびに置くボールの数")
+    group.add_argument("--initial-balls", type=int, default=0, metavar="N",
+                       help="開始時にまとめて置くボールの数（高密度のシーンをすぐ作る）")
+    group.add_argument("--spawn-gap", type=float, default=0.0, metavar="PX",
+                       help="ボール同士の最小の隙間（ピクセル）")
+    group.add_argument("--spawn-attempts", type=int, default=200, metavar="N",
+                       help="rejection で1個あたりに試す候補の数（超えたら満杯とみなす）")
+    return parser
+
+
+class OccupancyGrid:
+    """ボールの中心を登録する格子（重ならない位置かどうかを近傍のセルだけで判定）"""
+
+    def __init__(self, limit, distance):
+        self.limit = limit          # 中心が取れる範囲 ±limit
+        self.distance = distance    # 中心同士の最小距離（2r + 隙間）
+        self.cells = {}
+
+    def _cell(self, x, y):
+        return int((x + self.limit) // self.distance), int((y + self.limit) // self.distance)
+
+    def add(self, x, y):
+        self.cells.setdefault(self._cell(x, y), []).append((x, y))
+
+    def inside(self, x, y):
+        return -self.limit <= x <= self.limit and -self.limit <= y <= self.limit
+
+    def free(self, x, y):
+        """(x, y) に置いても既存のボールと重ならないか"""
+        cx, cy = self._cell(x, y)
+        d2 = self.distance * self.distance
+        for i in (cx - 1, cx, cx + 1):
+            for j in (cy - 1, cy, cy + 1):
+                for px, py in self.cells.get((i, j), ()):
+                    if (px - x) ** 2 + (py - y) ** 2 < d2:
+                        return False
+        return True
+
+    def points(self):
+        return [p for cell in self.cells.values() for p in cell]
+
+
+def rejection_sample(grid, rng, count, attempts):
+    """一様な候補のうち重ならないものを count 個まで選ぶ"""
+    placed = []
+    for _ in range(count):
+        for _ in range(attempts):
+            x = rng.uniform(-grid.limit, grid.limit)
+            y = rng.uniform(-grid.limit, grid.limit)
+            if grid.free(x, y):
+                grid.add(x, y)
+                placed.append((x, y))
+                break
+        else:
+            break  # attempts 回続けて置けなければ満杯
+    return placed
+
+
+def poisson_fill(grid, rng, count, candidates=POISSON_CANDIDATES):
+    """ポアソンディスク（Bridson法）で count 個まで置く（既存のボールを起点にする）"""
+    placed = []
+    active = grid.points()
+    if not active:
+        first = rejection_sample(grid, rng, 1, 1)
+        placed += first
+        active += first
+    d = grid.distance
+    while active and len(placed) < count:
+        index = rng.randrange(len(active))
+        ox, oy = active[index]
+        for _ in range(candidates):
+            # 起点から d〜2d の円環上の候補
+            radius = d * (1 + rng.random())
+            theta = rng.uniform(0, 2 * math.pi)
+            x, y = ox + radius * math.cos(theta), oy + radius * math.sin(theta)
+            if grid.inside(x, y) and grid.free(x, y):
+                grid.add(x, y)
+                placed.append((x, y))
+                active.append((x, y))
+                break
+        else:
+            # 周りに空きがなくなった起点は外す
+            active[index] = active[-1]
+            active.pop()
+    return placed
+
+
+class Spawner:
+    """04のボールを、重ならない位置にまとめて生成する"""
+
+    def __init__(self, module, method="rejection", burst=1, gap=0.0, attempts=200):
+        self.module = module
+        self.method = method
+        self.burst = burst
+        self.gap = gap
+        self.attempts = attempts
+        self.full = False
+
+    @classmethod
+    def from_args(cls, args, module):
+        """従来どおり（uniform で1個ずつ、初期配置なし）なら None"""
+        if args.spawn_method == "uniform" and args.spawn_burst == 1 and not args.initial_balls:
+            return None
+        return cls(module, args.spawn_method, args.spawn_burst, args.spawn_gap, args.spawn_attempts)
+
+    def grid(self, balls):
+        m = self.module
+        # 半径がボールごとに違うときは最大の半径で間隔を取る（重ならない側に倒す）
+        radius = m.max_ball_radius()
+        grid = OccupancyGrid(m.SQUARE_HALF - radius, 2 * radius + self.gap)
+        for ball in balls:
+            grid.add(ball.x, ball.y)
+        return grid
+
+    def positions(self, balls, count):
+        """重ならない位置を count 個まで返す（足りなければコンテナは満杯）"""
+        rng = self.module.spawn_rng.position
+        if self.method == "uniform":
+            return [None] * count  # spawn_ball() に位置を決めさせる
+        grid = self.grid(balls)
+        if self.method == "poisson":
+            return poisson_fill(grid, rng, count)
+        return rejection_sample(grid, rng, count, self.attempts)
+
+    def spawn(self, balls, count=None, take=None):
+        """balls にボールを追加し、追加した数を返す（満杯なら知らせる）
+
+        take を渡すと、ボールを新しく作らずに take() が返すオブジェクト
+        （ソークモードのプールのボール、空なら None）を初期化し直して使う。
+        """
+        count = self.burst if count is None else count
+        positions = self.positions(balls, count)
+        balls.extend(self.module.spawn_ball(position, ball=take() if take else None)
+                     for position in positions)
+        full = len(positions) < count
+        if full and not self.full:
+            print(f"コンテナが満杯です: {count}個のうち {len(positions)}個だけ置きました"
+                  f"（ボール {len(balls)}個）")
+        self.full = full
+        return len(positions)
+
+
+def overlapping_pairs(balls, radius):
+    """重なっているボールの組の数（格子で近傍だけを調べる）"""
+    grid = {}
+    size = 2 * radius
+    for i, ball in enumerate(balls):
+        grid.setdefault((int(ball.x // size), int(ball.y // size)), []).append(i)
+    count = 0
+    for i, ball in enumerate(balls):
+        cx, cy = int(ball.x // size), int(ball.y // size)
+        for a in (cx - 1, cx, cx + 1):
+            for b in (cy - 1, cy, cy + 1):
+                for j in grid.get((a, b), ()):
+                    if j > i and math.hypot(ball.x - balls[j].x, ball.y - balls[j].y) < size:
+                        count += 1
+    return count
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="04のボールを重ならないように一括生成し、方法ごとに比べる")
+    parser.add_argument("--balls", type=int, default=300, help="置こうとするボールの数")
+    parser.add_argument("--methods", nargs="+", choices=METHODS, default=list(METHODS),
+                        help="比べる生成方法")
+    parser.add_argument("--seed", type=int, default=12345, help="乱数シード")
+    parser.add_argument("--settle-frames", type=int, default=60,
+                        help="生成後に進めて重なりの解消にかかる時間を測るフレーム数")
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    from implementations import load_module
+
+    module = load_module("04")
+    for method in args.methods:
+        module.spawn_rng.reseed(args.seed)
+        balls = []
+        spawner = Spawner(module, method)
+        started = time.perf_counter()
+        placed = spawner.spawn(balls, args.balls)
+        spawn_ms = (time.perf_counter() - started) * 1000
+        overlaps = overlapping_pairs(balls, module.BALL_RADIUS)
+
+        line = f"{method:>9}: {placed}個を {spawn_ms:.1f} ms で配置、重なり {overlaps}組"
+        if args.settle_frames:
+            started = time.perf_counter()
+            for _ in range(args.settle_frames):
+                for ball in balls:
+                    ball.update(1 / 60)
+                module.resolve_ball_collisions(balls)
+            settle_ms = (time.perf_counter() - started) * 1000 / args.settle_frames
+            line += (f"、その後の1フレーム {settle_ms:.2f} ms、{args.settle_frames}フレーム後の重なり "
+                     f"{overlapping_pairs(balls, module.BALL_RADIUS)}組")
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
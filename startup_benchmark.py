@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# ---------------------------
+# 起動時間のベンチマーク
+# ---------------------------
+# 各スクリプトを子プロセスとして --headless で1フレームだけ実行し、
+# プロセス起動から終了までの時間（コールドスタート）を計測する。
+# あわせて pygame.init() と必要なサブシステムだけの初期化、
+# Pillowの読み込みにかかる時間も比較する。
+
+SCRIPTS = {
+    "01": "01_o3_mini_basic",
+    "02": "02_o3_high_oop",
+    "03": "03_deepseek_r1_basic",
+    "04": "04_o3_improved_collision",
+}
+RECORDERS = {key: f"{name}_90s_gif" for key, name in SCRIPTS.items()}
+
+# 初期化方法の比較に使う短いスニペット
+SNIPPETS = {
+    "pygame.init()": "import pygame; pygame.init()",
+    "init_pygame()": "from headless import init_pygame; init_pygame(headless=True)",
+    "init_pygame(font)": "from headless import init_pygame; init_pygame(headless=True, font=True)",
+    "import PIL.Image": "import PIL.Image",
+    "python": "pass",
+}
+
+
+def time_command(command, repeats, env):
+    """コマンドを repeats 回実行し、壁時計時間（秒）のリストを返す"""
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        completed = subprocess.run(command, capture_output=True, text=True, env=env)
+        elapsed = time.perf_counter() - started
+        if completed.returncode != 0:
+            raise RuntimeError(f"{' '.join(command)} が失敗しました:\n{completed.stderr}")
+        times.append(elapsed)
+    return times
+
+
+def build_cases(keys, tmpdir):
+    """計測するケース（名前, コマンド）の一覧"""
+    cases = []
+    for key in keys:
+        cases.append((f"{key} import", [sys.executable, "-c", f"import importlib; importlib.import_module('{SCRIPTS[key]}')"]))
+        cases.append((f"{key} 1 frame", [sys.executable, f"{SCRIPTS[key]}.py", "--headless", "--max-frames", "1"]))
+        output = os.path.join(tmpdir, f"{key}.gif")
+        cases.append((f"{key} gif 1 frame", [sys.executable, f"{RECORDERS[key]}.py", "--headless", "--unpaced",
+                                           "--duration", "0.01", "--output", output]))
+    for name, code in SNIPPETS.items():
+        cases.append((name, [sys.executable, "-c", code]))
+    return cases
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="各スクリプトのコールドスタート時間を計測")
+    parser.add_argument("--implementations", nargs="+", default=list(SCRIPTS),
+                        choices=list(SCRIPTS), help="計測する実装")
+    parser.add_argument("--repeats", type=int, default=5, help="1ケースあたりの実行回数")
+    parser.add_argument("--output", metavar="PATH", help="JSONレポートの出力先")
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy",
+               PYGAME_HIDE_SUPPORT_PROMPT="1")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [here, env.get("PYTHONPATH")]))
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cwd = os.getcwd()
+        os.chdir(here)
+        try:
+            for name, command in build_cases(args.implementations, tmpdir):
+                times = time_command(command, args.repeats, env)
+                results.append({"case": name, "median_ms": statistics.median(times) * 1000,
+                                "min_ms": min(times) * 1000, "repeats": len(times)})
+                print(f"  {name:<20}{results[-1]['median_ms']:>10.1f}ms "
+                      f"(最小 {results[-1]['min_ms']:.1f}ms)")
+        finally:
+            os.chdir(cwd)
+
+    if args.output:
+        report = {"python": sys.version.split()[0], "repeats": args.repeats, "results": results}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"レポートを保存しました: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import base64
+import os
+import socket
+import struct
+import sys
+import time
+import zlib
+from urllib.parse import urlparse
+
+import numpy as np
+
+from stream_server import (DELTA, HEADER, KEY, STATE, STATE_HEADER, read_websocket_frame,
+                           websocket_accept, websocket_frame)
+
+# ---------------------------
+# 配信のテスト用クライアント
+# ---------------------------
+# stream_server.py の WebSocket に接続してメッセージを受け取り、KEY / DELTA から
+# 画像を組み立て直す（STATE はボールの状態を読むだけ）。--delay で
+# 遅いビューアをまねると、サーバー側でフレームが間引かれる様子を確かめられる。
+
+RECEIVE_BUFFER = 4 * 1024  # --delay のときの受信バッファ
+
+
+class FrameDecoder:
+    """KEY / DELTA / STATE のメッセージを復元する"""
+
+    def __init__(self):
+        self.indices = None
+        self.palette = None
+        self.width = self.height = 0
+        self.state = None
+        self.counts = {KEY: 0, DELTA: 0, STATE: 0}
+
+    def decode(self, message):
+        magic, kind, tile, palette_count, frame, width, height = HEADER.unpack_from(message)
+        if magic != b"BBS1":
+            raise ValueError("配信サーバーのメッセージではありません")
+        body = zlib.decompress(message[HEADER.size:])
+        self.counts[kind] += 1
+        self.width, self.height = width, height
+        if kind == STATE:
+            self.state = decode_state(body)
+            return frame
+        palette_bytes = palette_count * 3
+        self.palette = np.frombuffer(body[:palette_bytes], np.uint8).reshape(-1, 3)
+        tiles_y, tiles_x = -(-height // tile), -(-width // tile)
+        if kind == KEY:
+            self.indices = np.frombuffer(body[palette_bytes:], np.uint8).reshape(tiles_y * tile, tiles_x * tile).copy()
+            return frame
+        if self.indices is None:
+            raise ValueError("KEY より前に DELTA を受け取りました")
+        count, = struct.unpack_from("<I", body, palette_bytes)
+        offset = palette_bytes + 4
+        ids = np.frombuffer(body, "<u4", count, offset)
+        tiles = np.frombuffer(body, np.uint8, count * tile * tile, offset + count * 4).reshape(count, tile, tile)
+        view = self.indices.reshape(tiles_y, tile, tiles_x, tile).swapaxes(1, 2).reshape(-1, tile, tile)
+        view[ids] = tiles
+        self.indices = view.reshape(tiles_y, tiles_x, tile, tile).swapaxes(1, 2).reshape(self.indices.shape)
+        return frame
+
+    def image(self):
+        """最後に組み立てた画像（高さ × 幅 × RGB）"""
+        return self.palette[self.indices[:self.height, :self.width]]
+
+
+def decode_state(body):
+    angle, count = STATE_HEADER.unpack_from(body)
+    offset = STATE_HEADER.size
+    ids = np.frombuffer(body, "<i4", count, offset)
+    offset += count * 4
+    positions = np.frombuffer(body, "<f4", count * 2, offset).reshape(count, 2)
+    offset += count * 8
+    velocities = np.frombuffer(body, "<f4", count * 2, offset).reshape(count, 2)
+    offset += count * 8
+    colors = np.frombuffer(body, np.uint8, count * 3, offset).reshape(count, 3)
+    return {"angle": angle, "ids": ids, "positions": positions, "velocities": velocities, "colors": colors}
+
+
+async def connect(url, receive_buffer=None):
+    """WebSocket のハンドシェイクを行い (reader, writer) を返す"""
+    parsed = urlparse(url)
+    sock = socket.create_connection((parsed.hostname, parsed.port or 80))
+    if receive_buffer:
+        # 受信バッファを小さくして、読むのが遅いクライアントの回線をまねる
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+        # asyncio も先読みを limit の2倍までに抑える（既定では 128 KiB まで読み込んでしまう）
+        reader, writer = await asyncio.open_connection(sock=sock, limit=receive_buffer)
+    else:
+        reader, writer = await asyncio.open_connection(sock=sock)
+    key = base64.b64encode(os.urandom(16)).decode("ascii")
+    writer.write((f"GET {parsed.path or '/'} HTTP/1.1\r\nHost: {parsed.netloc}\r\n"
+                  "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                  f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode("ascii"))
+    response = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+    if " 101 " not in response.split("\r\n")[0] or websocket_accept(key) not in response:
+        writer.close()
+        raise ConnectionError(f"WebSocket に切り替えられませんでした: {response.splitlines()[0]}")
+    return reader, writer
+
+
+async def receive(url, frames, delay, decoder):
+    """frames 個のメッセージを受け取り (受信バイト数, 受け取ったフレーム番号のリスト) を返す"""
+    reader, writer = await connect(url, RECEIVE_BUFFER if delay else None)
+    received, numbers = 0, []
+    try:
+        while len(numbers) < frames:
+            opcode, payload = await read_websocket_frame(reader)
+            if opcode == 0x8:
+                break
+            if opcode != 0x2:
+                continue
+            received += len(payload)
+            numbers.append(decoder.decode(payload))
+            if delay:
+                await asyncio.sleep(delay)
+    finally:
+        writer.write(websocket_frame(0x8, b"", mask=os.urandom(4)))
+        writer.close()
+    return received, numbers
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="配信サーバーのテスト用クライアント")
+    parser.add_argument("url", nargs="?", default="ws://127.0.0.1:8765/stream", help="配信のURL")
+    parser.add_argument("--frames", type=int, default=300, help="受け取るメッセージ数")
+    parser.add_argument("--delay", type=float, default=0.0,
+                        help="1メッセージごとに待つ秒数（遅いビューアをまねる）")
+    parser.add_argument("--save", metavar="PATH", help="最後に組み立てた画像をPNGで保存")
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    decoder = FrameDecoder()
+    started = time.perf_counter()
+    received, numbers = asyncio.run(receive(args.url, args.frames, args.delay, decoder))
+    elapsed = time.perf_counter() - started
+    if not numbers:
+        print("メッセージを受け取れませんでした")
+        return 1
+
+    skipped = sum(b - a - 1 for a, b in zip(numbers, numbers[1:]) if b > a + 1)
+    print(f"{len(numbers)}メッセージ（KEY {decoder.counts[KEY]}, DELTA {decoder.counts[DELTA]}, "
+          f"STATE {decoder.counts[STATE]}）を {elapsed:.2f}秒で受信: {len(numbers) / elapsed:.1f} 件/秒, "
+          f"平均 {received / len(numbers) / 1024:.1f} KiB")
+    print(f"フレーム番号 {numbers[0]}〜{numbers[-1]}、間引かれたフレーム {skipped}")
+    if decoder.state is not None:
+        print(f"最後の状態: ボール {len(decoder.state['ids'])}個, 角度 {decoder.state['angle']:.3f} rad")
+    if args.save and decoder.indices is not None:
+        from PIL import Image
+
+        Image.fromarray(decoder.image()).save(args.save)
+        print(f"画像を保存しました: {args.save}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
@@ -0,0 +1,34 @@
+# ---------------------------
+# --stream の引数（配信サーバー本体は読み込まない）
+# ---------------------------
+# stream_server.py は asyncio と implementations を読み込むため、各スクリプトの
+# 起動を遅くする。引数の定義だけをここに置き、サーバーは --stream が
+# 指定されたときにだけ読み込む。
+
+MODES = ("frames", "state")
+DEFAULT_PORT = 8765
+
+
+def add_stream_arguments(parser):
+    """--stream 関連の引数を追加"""
+    group = parser.add_argument_group("streaming")
+    group.add_argument("--stream", metavar="HOST:PORT",
+                       help=f"フレームを配信するアドレス（例: 0.0.0.0:{DEFAULT_PORT}）")
+    group.add_argument("--stream-mode", choices=MODES, default="frames",
+                       help="frames: パレット化した差分フレーム、state: ボールの状態のレコード")
+    group.add_argument("--stream-queue", type=int, default=4, metavar="N",
+                       help="クライアントごとのキューの長さ（あふれたら古いフレームを捨てる）")
+    return parser
+
+
+def stream_from_args(args, key="", module=None, **attributes):
+    """--stream が指定されていなければ None（そのときだけ stream_server を読み込む）"""
+    if not getattr(args, "stream", None):
+        return None
+    from stream_server import StreamServer
+    return StreamServer.from_args(args, key, module, **attributes)
+
+
+def parse_address(text):
+    host, _, port = text.rpartition(":")
+    return host or "0.0.0.0", int(port or DEFAULT_PORT)
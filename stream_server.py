@@ -0,0 +1,438 @@
+import asyncio
+import base64
+import hashlib
+import json
+import socket
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+try:  # OSの送信キューの残りを調べる（Linux / macOS）
+    import fcntl
+    import termios
+except ImportError:
+    fcntl = None
+
+from implementations import attach_simulation
+from stream_options import DEFAULT_PORT, parse_address
+
+# ---------------------------
+# フレーム配信サーバー（HTTP / WebSocket）
+# ---------------------------
+# 実行中のスクリプトが描いたフレームを、LAN上の複数のビューアへ配信する。
+# サーバーは別スレッドの asyncio ループで動き、メインループは publish() で
+# フレームのコピーを渡すだけにする。エンコードは1フレームにつき1回で、
+# その結果を全クライアントで共有する。
+#
+# クライアントごとのキューは長さが決まっていて、あふれたら古いフレームから
+# 捨てる。遅いビューアは間引かれたフレームを受け取るだけで、シミュレーションの
+# 速さはビューアの数や速さに左右されない。エンコードが追いつかない場合も、
+# 最新のフレームだけをエンコードする。
+#
+# キューがあふれるのを待つだけでは、OSの送信バッファに溜まった分だけ
+# 遅れが積み重なる。そこで各メッセージにエンコードし終えた時刻を付け、送る
+# 時点でメッセージの間隔の STALE_INTERVALS 倍より古ければ送らずに捨てる。
+# さらに、次のメッセージはOSの送信キューが空になってから（前のメッセージを
+# 相手が受け取ってから）選ぶ。asyncio の送信バッファも持たないので、
+# サーバー側に溜まるのは送信中の1メッセージだけになる。
+#
+# メッセージ（WebSocket のバイナリメッセージ、すべてリトルエンディアン）:
+#   ヘッダ（20バイト）  magic kind tile palette_count frame width height
+#   本体（zlib）        KEY:   パレット(RGB × palette_count) + 色番号(u8 × 高さ × 幅)
+#                       DELTA: パレット + タイル数(u32) + タイル番号(u32 × n) + タイル(u8 × n × tile²)
+#                       STATE: angle(f64) count(u32) pad(4) ids(i32) positions(f32 × 2)
+#                              velocities(f32 × 2) colors(u8 × 3)
+#
+# 色番号の画像は幅・高さを tile の倍数に切り上げた大きさで持つ。DELTA は
+# 直前に配信したフレームから変わったタイルだけを送る。フレームを捨てた
+# クライアントには、次のフレームを KEY として送り直す。
+
+MAGIC = b"BBS1"
+HEADER = struct.Struct("<4sBBHIHH4x")
+STATE_HEADER = struct.Struct("<dI4x")
+KEY, DELTA, STATE = range(3)
+TILE = 16
+MAX_COLORS = 255  # 255番は「未登録の色」に使う
+UNKNOWN = 255
+COMPRESS_LEVEL = 1
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+# OSの送信バッファ。大きいとOSのバッファに古いフレームが溜まり、
+# 遅いクライアントでもキューがあふれず間引きが効かない
+SEND_BUFFER = 16 * 1024
+STALE_INTERVALS = 2  # 送る時点でこの数のメッセージ間隔より古いフレームは捨てる
+FLUSH_POLL = 0.002   # OSの送信キューが空になるのを待つ間隔（秒）
+
+
+# ---------------------------
+# エンコード
+# ---------------------------
+class Message:
+    """配信する1フレーム（KEY は必要になったときだけ作り、全クライアントで共有する）"""
+
+    def __init__(self, frame, delta=None, key=None, key_source=None):
+        self.frame = frame
+        self.created = None  # クライアントのキューに入れた時刻（time.monotonic）
+        self.delta = delta
+        self._key = key
+        self._key_source = key_source
+
+    def key(self):
+        if self._key is None:
+            self._key = self._key_source()
+            self._key_source = None
+        return self._key
+
+
+def _pack(kind, palette_count, frame, width, height, body):
+    return HEADER.pack(MAGIC, kind, TILE, palette_count, frame, width, height) + \
+        zlib.compress(body, COMPRESS_LEVEL)
+
+
+class FrameEncoder:
+    """RGBXのバイト列をパレット化し、前のフレームとの差分（タイル単位）にする"""
+
+    def __init__(self):
+        self.lookup = np.full(1 << 24, UNKNOWN, dtype=np.uint8)  # RGB24 → 色番号
+        self.colors = []                                         # 色番号 → RGB24
+        self.previous = None
+
+    def _index(self, rgb):
+        indices = self.lookup[rgb]
+        missing = indices == UNKNOWN
+        if missing.any():
+            new = np.unique(rgb[missing])
+            if len(self.colors) + len(new) > MAX_COLORS:
+                # パレットを作り直す（以前の色番号は使えなくなるので KEY を送る）
+                self.lookup[np.array(self.colors, dtype=np.int64)] = UNKNOWN
+                self.colors = []
+                self.previous = None
+                new = np.unique(rgb)
+            new = new[:MAX_COLORS - len(self.colors)]  # それでも多すぎる色は背景の番号で代用
+            self.lookup[new] = np.arange(len(self.colors), len(self.colors) + len(new))
+            self.colors.extend(new.tolist())
+            indices = self.lookup[rgb]
+            indices[indices == UNKNOWN] = 0
+        return indices
+
+    def palette(self):
+        colors = np.array(self.colors, dtype=np.uint32)
+        rgb = np.stack([colors & 0xFF, (colors >> 8) & 0xFF, colors >> 16], axis=1)
+        return rgb.astype(np.uint8).tobytes()
+
+    def encode(self, frame, rgbx, width, height):
+        """1フレームをエンコードして Message を返す"""
+        rgb = np.frombuffer(rgbx, dtype="<u4").reshape(height, width) & 0xFFFFFF
+        tiles_y, tiles_x = -(-height // TILE), -(-width // TILE)
+        indices = np.zeros((tiles_y * TILE, tiles_x * TILE), dtype=np.uint8)
+        indices[:height, :width] = self._index(rgb)
+        palette, count = self.palette(), len(self.colors)
+
+        def key():
+            return _pack(KEY, count, frame, width, height, palette + indices.tobytes())
+
+        previous, self.previous = self.previous, indices
+        if previous is None:
+            return Message(frame, key=key())
+        tiled = indices.reshape(tiles_y, TILE, tiles_x, TILE).swapaxes(1, 2)
+        changed = (tiled != previous.reshape(tiles_y, TILE, tiles_x, TILE).swapaxes(1, 2)).any(axis=(2, 3))
+        ids = np.flatnonzero(changed).astype("<u4")
+        body = b"".join((palette, struct.pack("<I", len(ids)), ids.tobytes(),
+                         np.ascontiguousarray(tiled.reshape(-1, TILE, TILE)[ids]).tobytes()))
+        return Message(frame, delta=_pack(DELTA, count, frame, width, height, body), key_source=key)
+
+
+def encode_state(frame, state, size):
+    """SimStateを STATE メッセージにする"""
+    body = b"".join((STATE_HEADER.pack(state.angle, len(state)),
+                     np.ascontiguousarray(state.ids, dtype="<i4").tobytes(),
+                     np.ascontiguousarray(state.positions, dtype="<f4").tobytes(),
+                     np.ascontiguousarray(state.velocities, dtype="<f4").tobytes(),
+                     np.ascontiguousarray(state.colors, dtype=np.uint8).tobytes()))
+    return Message(frame, key=_pack(STATE, 0, frame, size[0], size[1], body))
+
+
+# ---------------------------
+# WebSocket（RFC 6455 の必要な部分だけ）
+# ---------------------------
+def valid_websocket_key(key):
+    """Sec-WebSocket-Key が16バイトを base64 にしたものか"""
+    if key is None:
+        return False
+    try:
+        return len(base64.b64decode(key, validate=True)) == 16
+    except ValueError:
+        return False
+
+
+def websocket_accept(key):
+    digest = hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest()
+    return base64.b64encode(digest).decode("ascii")
+
+
+def websocket_frame(opcode, payload, mask=None):
+    """1つのWebSocketフレーム（クライアントからは mask が必要）"""
+    length = len(payload)
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        head = struct.pack("!BB", 0x80 | opcode, mask_bit | length)
+    elif length < 1 << 16:
+        head = struct.pack("!BBH", 0x80 | opcode, mask_bit | 126, length)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode, mask_bit | 127, length)
+    if mask:
+        data = np.frombuffer(payload, dtype=np.uint8) ^ np.resize(np.frombuffer(mask, np.uint8), length)
+        return head + mask + data.tobytes()
+    return head + payload
+
+
+async def read_websocket_frame(reader):
+    """(opcode, payload) を読む（フラグメントは使わない前提）"""
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack("!Q", await reader.readexactly(8))
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = (np.frombuffer(payload, np.uint8) ^ np.resize(np.frombuffer(mask, np.uint8), length)).tobytes()
+    return first & 0x0F, payload
+
+
+class _Client:
+    def __init__(self, address, writer, queue_size):
+        self.address = address
+        self.writer = writer
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.needs_key = True  # 最初のフレームと、フレームを捨てた後は KEY を送る
+        self.sent = 0
+        self.dropped = 0
+        self.stale = 0  # dropped のうち、古くなって送らなかった数
+
+    def offer(self, message):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            self.needs_key = True
+        self.queue.put_nowait(message)
+
+    def skip(self):
+        """古くなったメッセージを送らずに捨てる"""
+        self.dropped += 1
+        self.stale += 1
+        self.needs_key = True
+
+
+# ---------------------------
+# サーバー
+# ---------------------------
+class StreamServer:
+    """別スレッドの asyncio ループでフレームを配信する"""
+
+    def __init__(self, host="0.0.0.0", port=DEFAULT_PORT, mode="frames", queue_size=4, source=None):
+        self.host, self.port = host, port
+        self.mode = mode
+        self.queue_size = queue_size
+        self.source = source  # state モードで状態を取り出す Simulation
+        self.encoder = FrameEncoder()
+        self.clients = set()
+        self.published = 0
+        self.encoded = 0
+        self.interval = None  # メッセージの間隔（秒、指数移動平均）
+        self.loop = None
+        self._pending = None
+        self._last_offer = None
+        self._wakeup = None
+        self._stopped = None
+        self._ready = threading.Event()
+        self._error = None
+        self.thread = threading.Thread(target=self._run, name="stream-server", daemon=True)
+        self.thread.start()
+        self._ready.wait()
+        if self._error:
+            raise self._error
+
+    @classmethod
+    def from_args(cls, args, key="", module=None, **attributes):
+        """--stream が指定されていなければ None
+
+        state モードでは、そのスクリプトの状態（balls などの属性）を共有する
+        Simulationを結びつけ、publish() で状態を配信する。
+        """
+        if not getattr(args, "stream", None):
+            return None
+        host, port = parse_address(args.stream)
+        source = attach_simulation(key, module, **attributes) if args.stream_mode == "state" else None
+        server = cls(host, port, args.stream_mode, args.stream_queue, source)
+        print(f"配信中: ws://{host}:{server.port}/stream（状態: http://{host}:{server.port}/）")
+        return server
+
+    # --- メインループから呼ぶ ---
+    def publish(self, frame, surface, **attributes):
+        """描画済みのフレームを配信（ビューアがいなければ何もしない）"""
+        self.published += 1
+        if not self.clients:
+            return
+        if self.mode == "state":
+            for name, value in attributes.items():
+                setattr(self.source, name, value)
+            payload = (self.source.state(), surface.get_size())
+        else:
+            payload = (pygame_bytes(surface), surface.get_size())
+        self.loop.call_soon_threadsafe(self._offer, frame, payload)
+
+    def close(self):
+        if self.loop is not None and self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self._stopped.set)
+        self.thread.join(timeout=5)
+
+    def status(self):
+        return {"mode": self.mode, "published": self.published, "encoded": self.encoded,
+                "clients": [{"address": c.address, "sent": c.sent, "dropped": c.dropped, "stale": c.stale}
+                            for c in self.clients]}
+
+    # --- サーバースレッド ---
+    def _run(self):
+        try:
+            asyncio.run(self._serve())
+        except Exception as error:  # 起動に失敗したらメインスレッドに伝える
+            self._error = error
+            self._ready.set()
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopped = asyncio.Event()
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]  # ポート0なら割り当てられた番号
+        self._ready.set()
+        encoder = asyncio.create_task(self._encode_loop())
+        async with server:
+            await self._stopped.wait()
+        encoder.cancel()
+        for client in list(self.clients):
+            client.writer.write(websocket_frame(0x8, b""))
+            client.writer.close()
+
+    def _offer(self, frame, payload):
+        # エンコード待ちは1つだけ持つ（追いつかなければ古いフレームは捨てる）
+        self._pending = (frame, payload)
+        self._wakeup.set()
+
+    async def _encode_loop(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            frame, (data, size) = self._pending
+            if self.mode == "state":
+                message = encode_state(frame, data, size)
+            else:
+                message = await self.loop.run_in_executor(None, self.encoder.encode, frame, data, *size)
+            self.encoded += 1
+            now = time.monotonic()
+            if self._last_offer is not None:
+                gap = now - self._last_offer
+                self.interval = gap if self.interval is None else 0.9 * self.interval + 0.1 * gap
+            self._last_offer = message.created = now
+            for client in self.clients:
+                client.offer(message)
+
+    def _stale(self, message):
+        """メッセージの間隔の STALE_INTERVALS 倍より前に作られたか"""
+        if self.interval is None:
+            return False
+        return time.monotonic() - message.created > STALE_INTERVALS * self.interval
+
+    async def _handle(self, reader, writer):
+        address = "%s:%d" % writer.get_extra_info("peername")[:2]
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            writer.close()
+            return
+        lines = request.decode("latin-1").split("\r\n")
+        path = lines[0].split(" ")[1] if len(lines[0].split(" ")) > 1 else "/"
+        headers = {k.strip().lower(): v.strip() for k, _, v in (line.partition(":") for line in lines[1:] if line)}
+
+        if path == "/stream" and headers.get("upgrade", "").lower() == "websocket":
+            if not valid_websocket_key(headers.get("sec-websocket-key")):
+                writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                await writer.drain()
+                writer.close()
+                return
+            await self._serve_websocket(address, headers, reader, writer)
+        elif path == "/":
+            body = json.dumps(self.status(), ensure_ascii=False).encode("utf-8")
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json; charset=utf-8\r\n"
+                         b"Content-Length: %d\r\nConnection: close\r\n\r\n%s" % (len(body), body))
+            await writer.drain()
+            writer.close()
+        else:
+            writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            writer.close()
+
+    async def _serve_websocket(self, address, headers, reader, writer):
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {websocket_accept(headers['sec-websocket-key'])}\r\n\r\n"
+                      ).encode("ascii"))
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+        writer.transport.set_write_buffer_limits(high=0)
+        client = _Client(address, writer, self.queue_size)
+        self.clients.add(client)
+        sender = asyncio.create_task(self._send_loop(client))
+        try:
+            while True:
+                opcode, payload = await read_websocket_frame(reader)
+                if opcode == 0x8:    # close
+                    break
+                if opcode == 0x9:    # ping
+                    writer.write(websocket_frame(0xA, payload))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+            writer.close()
+
+    async def _send_loop(self, client):
+        sock = client.writer.get_extra_info("socket")
+        try:
+            while True:
+                # 前のメッセージが相手に届くまで待ってから、その時点で新しいものを選ぶ
+                while unsent_bytes(sock):
+                    await asyncio.sleep(FLUSH_POLL)
+                message = await client.queue.get()
+                if self._stale(message):
+                    client.skip()
+                    continue
+                data = message.key() if client.needs_key or message.delta is None else message.delta
+                client.needs_key = False
+                client.writer.write(websocket_frame(0x2, data))
+                await client.writer.drain()
+                client.sent += 1
+        except ConnectionError:
+            pass
+
+
+def unsent_bytes(sock):
+    """ソケットの送信キューに残っている（相手が受け取っていない）バイト数（調べられなければ 0）"""
+    if fcntl is None or sock is None:
+        return 0
+    try:
+        return struct.unpack("i", fcntl.ioctl(sock.fileno(), termios.TIOCOUTQ, b"\0\0\0\0"))[0]
+    except (AttributeError, OSError, ValueError):
+        return 0
+
+
+def pygame_bytes(surface):
+    """サーフェスを RGBX のバイト列としてコピー"""
+    import pygame
+
+    return pygame.image.tobytes(surface, "RGBX")
@@ -0,0 +1,312 @@
+import argparse
+import hashlib
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import sqlite3
+import sys
+import time
+import traceback
+
+# ---------------------------
+# パラメータスイープ
+# ---------------------------
+# パラメータの格子（実装 × SQUARE_SIZE × BALL_RADIUS × BALL_SPEED × ROTATION_SPEED
+# × 生成間隔 × シード）の各点をヘッドレスで実行し、指標を1つの表にまとめる。
+#
+# ジョブはSQLiteのファイルに保存するため、途中で止めても再実行すれば
+# 続きから進む。パラメータのハッシュで結果をキャッシュし、実行済みの
+# 点は飛ばす。ワーカープロセスはそれぞれ1つのCPUコアに固定し、
+# アドレス空間の上限（RLIMIT_AS）でメモリを制限する。
+
+# 指標の計算方法を変えたら上げる（古いキャッシュを使わないように）
+SWEEP_VERSION = 1
+
+# 単位は実装によらず px・px/s・度/s・秒（Simulation.configure を参照）
+PARAMETERS = {
+    "square_size": int,  # 01/03 は整数の px でしか扱えない（半径は02/04が小数も使うので float）
+    "ball_radius": float,
+    "ball_speed": float,
+    "rotation_speed": float,
+    "spawn_interval": float,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    hash TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated REAL
+)
+"""
+
+
+def param_hash(params):
+    """パラメータ（とSWEEP_VERSION）から決まるジョブのキー"""
+    text = json.dumps({"version": SWEEP_VERSION, **params}, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def build_grid(implementations, values, common):
+    """格子の全点をパラメータの辞書のリストとして返す"""
+    names = list(values)
+    grid = []
+    for key in implementations:
+        for combination in itertools.product(*(values[name] for name in names)):
+            grid.append({"implementation": key, **common, **dict(zip(names, combination))})
+    return grid
+
+
+def parse_param(text):
+    """'name=v1,v2,...' を (name, [値...]) に変換"""
+    name, _, raw = text.partition("=")
+    name = name.strip().replace("-", "_")
+    if name not in PARAMETERS or not raw:
+        raise argparse.ArgumentTypeError(
+            f"'{text}' は 名前=値1,値2,... の形式で指定してください（名前: {', '.join(PARAMETERS)}）")
+    try:
+        return name, [PARAMETERS[name](v) for v in raw.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"'{text}' の値は {PARAMETERS[name].__name__} で指定してください") from None
+
+
+# ---------------------------
+# ジョブキュー（SQLite）
+# ---------------------------
+class JobQueue:
+    """SQLiteファイルに保存するジョブキュー（書き込みは親プロセスだけが行う）"""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute(SCHEMA)
+        # 前回の実行が途中で止まった場合、実行中のままのジョブを戻す
+        self.db.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running'")
+        self.db.commit()
+
+    def add(self, grid, retry_failed=False):
+        """格子の点を登録し、（キャッシュ済みを除いた）実行待ちのジョブ数を返す"""
+        with self.db:
+            for params in grid:
+                self.db.execute("INSERT OR IGNORE INTO jobs (hash, params) VALUES (?, ?)",
+                                (param_hash(params), json.dumps(params, sort_keys=True)))
+            if retry_failed:
+                self.db.execute("UPDATE jobs SET status = 'pending' WHERE status = 'failed'")
+        hashes = [param_hash(params) for params in grid]
+        return sum(1 for h in hashes if self.status(h) == "pending")
+
+    def status(self, job_hash):
+        row = self.db.execute("SELECT status FROM jobs WHERE hash = ?", (job_hash,)).fetchone()
+        return row[0] if row else None
+
+    def pending(self, hashes):
+        rows = self.db.execute("SELECT hash, params FROM jobs WHERE status = 'pending'").fetchall()
+        wanted = set(hashes)
+        return [(h, json.loads(p)) for h, p in rows if h in wanted]
+
+    def mark_running(self, job_hash):
+        with self.db:
+            self.db.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1, updated = ? "
+                            "WHERE hash = ?", (time.time(), job_hash))
+
+    def finish(self, job_hash, result=None, error=None):
+        with self.db:
+            self.db.execute("UPDATE jobs SET status = ?, result = ?, error = ?, updated = ? WHERE hash = ?",
+                            ("failed" if error else "done", json.dumps(result) if result else None,
+                             error, time.time(), job_hash))
+
+    def results(self, hashes):
+        """完了したジョブのパラメータと指標を1行ずつの辞書で返す"""
+        wanted = set(hashes)
+        rows = self.db.execute("SELECT hash, params, result FROM jobs WHERE status = 'done'").fetchall()
+        return [{"hash": h, **json.loads(p), **json.loads(r)} for h, p, r in rows if h in wanted]
+
+    def close(self):
+        self.db.close()
+
+
+# ---------------------------
+# ワーカー
+# ---------------------------
+def init_worker(cores, counter, memory_mb):
+    """ワーカーをCPUコアに固定し、アドレス空間の上限を設定"""
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cores[index % len(cores)]})
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def simulate(params):
+    """1つのパラメータの組でシミュレーションし、指標の辞書を返す"""
+    import numpy as np
+
+    from analysis import detect_events, event_rates, kinetic_energy, load_dataframe
+    from implementations import SIMULATIONS, load_module
+    from trajectory import TrajectoryFrame
+
+    key = params["implementation"]
+    # 前のジョブが書き換えた定数を元に戻すため、モジュールを読み込み直す
+    module = importlib.reload(load_module(key))
+    sim = SIMULATIONS[key](module)
+    sim.configure(**{name: params.get(name) for name in
+                     ("square_size", "ball_radius", "ball_speed", "rotation_speed")})
+    sim.seed(params["seed"])
+    for _ in range(params["balls"]):
+        sim.spawn()
+
+    dt = params["dt"]
+    steps = int(round(params["duration"] / dt))
+    spawn_interval = params.get("spawn_interval")
+    spawn_timer = 0.0
+    frames = []
+    started = time.perf_counter()
+    for step in range(steps):
+        sim.step(dt)
+        if spawn_interval:
+            spawn_timer += dt
+            if spawn_timer >= spawn_interval:
+                spawn_timer = 0.0
+                sim.spawn()
+        state = sim.state()
+        frames.append(TrajectoryFrame(step, step * dt, state.angle, state.ids,
+                                      state.positions, state.velocities, state.radii, state.masses))
+    elapsed = time.perf_counter() - started
+
+    scene = sim.scene()
+    half = scene.square_size / 2
+    df = load_dataframe(frames, range(len(frames)), radius=scene.ball_radius)
+    duration = steps * dt
+    events = detect_events(df, half, scene.ball_radius)
+    _, rates = event_rates(events, duration)
+    energy = kinetic_energy(df)
+    final = frames[-1] if frames else None
+    escaped = (np.abs(final.positions).max(axis=1) > half).mean() if final is not None and len(final.ids) else 0.0
+    return {
+        "balls_final": len(final.ids) if final is not None else 0,
+        "escaped_fraction": float(escaped),
+        "mean_speed": float(np.hypot(df["vx"], df["vy"]).mean()) if len(df) else 0.0,
+        "velocity_unit": sim.velocity_unit,
+        "ke_drift_final": float(energy["drift"].iloc[-1]) if len(energy) else 0.0,
+        "wall_hits_per_s": rates["wall"],
+        "ball_hits_per_s": rates["ball"],
+        "step_ms": elapsed / max(steps, 1) * 1000,
+    }
+
+
+def run_job(job):
+    """ワーカーで1ジョブを実行（例外は文字列にして返す）"""
+    job_hash, params = job
+    try:
+        return job_hash, simulate(params), None
+    except MemoryError:
+        return job_hash, None, "MemoryError: --memory-mb の上限を超えました"
+    except Exception:
+        return job_hash, None, traceback.format_exc(limit=5)
+
+
+# ---------------------------
+# 実行
+# ---------------------------
+def run_sweep(queue, grid, workers, cores, memory_mb):
+    """実行待ちのジョブをプロセスプールで実行し、(完了数, 失敗数) を返す"""
+    jobs = queue.pending([param_hash(params) for params in grid])
+    if not jobs:
+        return 0, 0
+    done = failed = 0
+    counter = multiprocessing.Value("i", 0)
+    with multiprocessing.Pool(workers, initializer=init_worker,
+                              initargs=(cores, counter, memory_mb)) as pool:
+        for job_hash, _ in jobs:
+            queue.mark_running(job_hash)
+        for job_hash, result, error in pool.imap_unordered(run_job, jobs):
+            queue.finish(job_hash, result, error)
+            if error:
+                failed += 1
+                print(f"  失敗 {job_hash}: {error.strip().splitlines()[-1]}")
+            else:
+                done += 1
+            print(f"  {done + failed}/{len(jobs)} 完了")
+    return done, failed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="パラメータの格子をヘッドレスで実行し、指標を表にまとめる")
+    parser.add_argument("--param", action="append", type=parse_param, default=[],
+                        metavar="NAME=V1,V2",
+                        help=f"スイープするパラメータ（{', '.join(PARAMETERS)}、複数指定可）")
+    parser.add_argument("--grid", metavar="PATH",
+                        help="格子のJSON（{\"implementations\": [...], \"square_size\": [...], ...}）")
+    parser.add_argument("--implementations", nargs="+", default=["01", "02", "03", "04"],
+                        help="実装")
+    parser.add_argument("--seeds", nargs="+", type=int, default=[12345], help="乱数シード")
+    parser.add_argument("--balls", type=int, default=10, help="最初に生成するボール数")
+    parser.add_argument("--duration", type=float, default=20.0, help="シミュレーション時間（秒）")
+    parser.add_argument("--dt", type=float, default=1.0 / 60, help="1ステップの時間（秒）")
+    parser.add_argument("--workers", type=int, default=None, help="ワーカー数（省略時はコア数）")
+    parser.add_argument("--memory-mb", type=int, default=2048,
+                        help="ワーカー1つあたりのアドレス空間の上限（MB、0で無制限）")
+    parser.add_argument("--db", default="sweep.db", help="ジョブキューのSQLiteファイル")
+    parser.add_argument("--retry-failed", action="store_true", help="失敗したジョブを再実行する")
+    parser.add_argument("--output", default="sweep_results.csv", help="結果の表（CSV）の出力先")
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    from implementations import SIMULATIONS
+
+    values = {}
+    implementations = args.implementations
+    if args.grid:
+        with open(args.grid, encoding="utf-8") as f:
+            spec = json.load(f)
+        implementations = spec.pop("implementations", implementations)
+        for name, raw in spec.items():
+            values[name] = [PARAMETERS[name](v) for v in (raw if isinstance(raw, list) else [raw])]
+    values.update(dict(args.param))
+    values["seed"] = args.seeds
+    unknown = [key for key in implementations if key not in SIMULATIONS]
+    if unknown:
+        print(f"未知の実装です: {', '.join(unknown)}")
+        return 2
+
+    common = {"balls": args.balls, "duration": args.duration, "dt": args.dt}
+    grid = build_grid(implementations, values, common)
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+    workers = args.workers or max(1, len(cores) or os.cpu_count() or 1)
+
+    queue = JobQueue(args.db)
+    try:
+        pending = queue.add(grid, args.retry_failed)
+        print(f"{len(grid)}点のうち {len(grid) - pending}点はキャッシュ済み、{pending}点を {workers}プロセスで実行します")
+        done, failed = run_sweep(queue, grid, workers, cores, args.memory_mb)
+        rows = queue.results([param_hash(params) for params in grid])
+    finally:
+        queue.close()
+
+    import pandas as pd
+
+    table = pd.DataFrame(rows)
+    if not table.empty:
+        table = table.sort_values(["implementation"] + [name for name in values if name in table])
+        table.to_csv(args.output, index=False)
+        shown = ["implementation"] + list(values) + ["balls_final", "escaped_fraction",
+                                                     "wall_hits_per_s", "ball_hits_per_s", "step_ms"]
+        print(table[[c for c in shown if c in table]].to_string(index=False, float_format="%.3g"))
+        print(f"結果を保存しました: {args.output}（{len(table)}行）")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
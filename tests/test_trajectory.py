@@ -0,0 +1,96 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis import detect_events, kinetic_energy, load_dataframe  # noqa: E402
+from implementations import load_simulation  # noqa: E402
+from trajectory import TrajectoryFrame, TrajectoryReader, TrajectoryWriter  # noqa: E402
+
+
+def write_and_read(path, key, state):
+    writer = TrajectoryWriter(path, key)
+    writer.append(0, 0.0, state)
+    writer.close()
+    reader = TrajectoryReader(path)
+    try:
+        return reader.state(0)
+    finally:
+        reader.close()
+
+
+def test_radius_and_mass_survive_the_log(tmp_path):
+    sim = load_simulation("04", seed=1)
+    sim.module.BALL_RADIUS_RANGE = (3, 30)
+    try:
+        for _ in range(5):
+            sim.spawn()
+    finally:
+        sim.module.BALL_RADIUS_RANGE = None
+    state = sim.state()
+    assert len(set(state.radii.tolist())) == 5
+
+    restored = write_and_read(str(tmp_path / "run.traj"), "04", state)
+    np.testing.assert_array_equal(restored.radii, state.radii)
+    np.testing.assert_array_equal(restored.masses, state.masses)
+
+    # 再描画用に読み込んだボールも同じ半径・質量を持つ
+    replay = load_simulation("04")
+    replay.load_state(restored)
+    assert [b.radius for b in replay.balls] == state.radii.tolist()
+    assert [b.mass for b in replay.balls] == state.masses.tolist()
+
+
+def test_logs_without_radius_use_the_scene(tmp_path):
+    sim = load_simulation("01", seed=1)
+    for _ in range(3):
+        sim.spawn()
+    restored = write_and_read(str(tmp_path / "run.traj"), "01", sim.state())
+    assert restored.radii is None and restored.masses is None
+
+    reader = TrajectoryReader(str(tmp_path / "run.traj"))
+    try:
+        df = load_dataframe(reader, [0], radius=10)
+    finally:
+        reader.close()
+    assert (df["radius"] == 10).all() and (df["mass"] == 1).all()
+
+
+def test_wall_contact_uses_each_ball_radius():
+    # 半径30のボールが右の壁（half=200）で跳ね返る。シーンの半径10で測ると壁から遠い
+    frames = []
+    for i, (x, vx) in enumerate([(165.0, 100.0), (170.0, -100.0), (168.0, -100.0)]):
+        frames.append(TrajectoryFrame(i, i / 60, 0.0, np.array([0], np.int32),
+                                      np.array([[x, 0.0]], np.float32), np.array([[vx, 0.0]], np.float32),
+                                      np.array([30.0]), np.array([900.0])))
+    df = load_dataframe(frames, range(len(frames)), radius=10)
+    events = detect_events(df, 200, 10)
+    assert events["kind"].tolist() == ["wall"]
+    energy = kinetic_energy(df)
+    assert energy["ke_total"].iloc[0] == 0.5 * 900 * 100 ** 2
+    assert (energy["drift"] == 0).all()
+
+
+def test_uniform_engines_reject_mixed_radii():
+    from ensemble import Ensemble
+
+    sim = load_simulation("04", seed=1)
+    sim.module.BALL_RADIUS_RANGE = (3, 30)
+    try:
+        for _ in range(5):
+            sim.spawn()
+    finally:
+        sim.module.BALL_RADIUS_RANGE = None
+    with pytest.raises(ValueError):
+        Ensemble.from_states([sim.state()])
+
+    # 大きさのそろったボールなら今まで通り読み込める
+    uniform = load_simulation("04", seed=1)
+    for _ in range(5):
+        uniform.spawn()
+    assert Ensemble.from_states([uniform.state()]).alive.sum() == 5
@@ -0,0 +1,252 @@
+import argparse
+import math
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from transform import Affine
+
+# ---------------------------
+# タイルに分けて並列に描くソフトウェアラスタライザ
+# ---------------------------
+# pygame.draw はボールを1つずつ描くので、ボールが数千個になると描画だけで
+# 1コアを使い切る。ここでは画面を tile×tile のタイルに分け、
+#
+#   1. ボールの中心を world_to_screen と同じ変換（Affine.to_screen）で画面へ移し、
+#      外接矩形が触れるタイルへ振り分ける（ビニング、NumPy でまとめて行う）
+#   2. タイルごとに「背景 → 正方形の枠 → ボール」の順に NumPy で塗る
+#   3. タイルをスレッドプールで並行に処理する
+#
+# タイルはフレームバッファ（(高さ, 幅, 3) の uint8 配列1つ）の重ならない範囲
+# なので、ロックなしで同じ配列に直接書き込める。NumPy の配列演算は実行中に
+# GIL を手放すため、タイルの処理はコア数に応じて並列に進む。
+#
+# ボールはタイルの中でも番号の順に塗るので、重なったときは後のボールが上に
+# なる（pygame.draw で順に描くのと同じ）。スレッド数を変えても結果は同じ画素になる。
+# 円は pygame.draw.circle に合わせ、半径を整数に切り捨てて「画素の中心と中心の
+# 距離 ≤ 半径」の画素を塗る（中心は画素の角、ずれるのは縁の数画素）。枠線は
+# 画素をローカル座標へ戻して帯の中かを調べるので、回転中は太い線の端が pygame と少し違う。
+
+DEFAULT_TILE = 128
+
+
+def add_tile_arguments(parser):
+    """--tiled-render などタイル描画の引数を追加"""
+    group = parser.add_argument_group("tiled render")
+    group.add_argument("--tiled-render", action="store_true",
+                       help="pygame.draw の代わりに、タイルに分けてスレッドプールで並行に描く")
+    group.add_argument("--tile-size", type=int, default=DEFAULT_TILE, metavar="PX",
+                       help="タイルの一辺（ピクセル）")
+    group.add_argument("--render-threads", type=int, default=None, metavar="N",
+                       help="描画に使うスレッド数（既定は CPU のコア数）")
+    return parser
+
+
+def _ramp(counts):
+    """counts = [2, 3] → [0, 1, 0, 1, 2]（repeat で展開した各区間の中の通し番号）"""
+    total = np.cumsum(counts)
+    return np.arange(total[-1] if len(total) else 0) - np.repeat(total - counts, counts)
+
+
+class TileRasterizer:
+    """画面をタイルに分け、ボールと正方形の枠を NumPy で並行に塗る"""
+
+    def __init__(self, size, tile=DEFAULT_TILE, threads=None, background=(30, 30, 30)):
+        self.width, self.height = size
+        self.tile = max(int(tile), 8)
+        self.threads = max(threads or os.cpu_count() or 1, 1)
+        self.frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self.clear = np.empty((self.tile, self.tile, 3), dtype=np.uint8)  # 背景色で塗ったタイル
+        self.clear[:] = background
+        self.columns = -(-self.width // self.tile)
+        self.rows = -(-self.height // self.tile)
+        self.pool = ThreadPoolExecutor(self.threads, "tile-raster") if self.threads > 1 else None
+        self.binned = 0  # 最後のフレームで（タイル, ボール）の組にした数
+
+    @classmethod
+    def from_args(cls, args, size, background=(30, 30, 30)):
+        """--tiled-render が指定されていなければ None"""
+        if not getattr(args, "tiled_render", False):
+            return None
+        return cls(size, args.tile_size, args.render_threads, background)
+
+    # --- ビニング ---
+    def bin(self, centers, radii):
+        """ボールを外接矩形が触れるタイルへ振り分け、タイル番号 → ボール番号の配列を返す"""
+        # 半径 r の円が塗る画素は中心 c から c - r .. c + r - 1
+        reach = radii.astype(np.int64)
+        left = np.clip((centers[:, 0] - reach) // self.tile, 0, None)
+        right = np.clip((centers[:, 0] + reach - 1) // self.tile, None, self.columns - 1)
+        top = np.clip((centers[:, 1] - reach) // self.tile, 0, None)
+        bottom = np.clip((centers[:, 1] + reach - 1) // self.tile, None, self.rows - 1)
+        spans = np.maximum(right - left + 1, 0)
+        counts = spans * np.maximum(bottom - top + 1, 0)  # 画面の外のボールは 0
+        balls = np.repeat(np.arange(len(centers)), counts)
+        offset = _ramp(counts)  # 各ボールの中での通し番号 → タイルの列と行
+        span = spans[balls]
+        tiles = (top[balls] + offset // span) * self.columns + left[balls] + offset % span
+        # 安定ソートなので、タイルの中ではボールの番号の順（描く順）が保たれる
+        order = np.argsort(tiles, kind="stable")
+        balls, tiles = balls[order], tiles[order]
+        bounds = np.searchsorted(tiles, np.arange(self.columns * self.rows + 1))
+        self.binned = len(balls)
+        return {tile: balls[start:end] for tile, (start, end) in enumerate(zip(bounds[:-1], bounds[1:]))}
+
+    # --- 1つのタイルを塗る（ワーカースレッドで実行） ---
+    def _tile(self, tile, members, centers, radii, colors, inverse, half, outline, outline_color):
+        x0, y0 = tile % self.columns * self.tile, tile // self.columns * self.tile
+        x1, y1 = min(x0 + self.tile, self.width), min(y0 + self.tile, self.height)
+        view = self.frame[y0:y1, x0:x1]  # フレームバッファの重ならない範囲
+        view[:] = self.clear[:y1 - y0, :x1 - x0]  # 色を広げて埋めるより、塗った配列の複写が速い
+
+        # 正方形の枠: 画素をローカル座標へ戻し、max(|u|, |v|) が半辺 ± 線幅/2 に入るか
+        if outline > 0 and self._touches(inverse, half, outline, x0, y0, x1, y1):
+            # 画面の中の座標なら float32 で足りる（float64 の4分の1ほどの時間）
+            (a, b, tx), (c, d, ty) = inverse.matrix.astype(np.float32)
+            ys = np.arange(y0, y1, dtype=np.float32)[:, None]
+            xs = np.arange(x0, x1, dtype=np.float32)[None, :]
+            u = np.abs((a * xs + tx) + b * ys)  # 1次元の行と列を足してから広げる
+            edge = np.maximum(u, np.abs((c * xs + ty) + d * ys), out=u)
+            edge -= half
+            view[np.abs(edge, out=edge) <= outline / 2] = outline_color
+
+        # ボール: タイルに入る行ごとに円が覆う列の範囲を求め、行 → 画素の順に展開する
+        if not len(members):
+            return
+        cx, cy, r = centers[members, 0], centers[members, 1], radii[members]
+        first = np.maximum(cy - r, y0)
+        counts = np.maximum(np.minimum(cy + r, y1) - first, 0)
+        ball = np.repeat(np.arange(len(members)), counts)
+        y = np.repeat(first, counts) + _ramp(counts)
+        # 画素の中心 (x + 0.5, y + 0.5) と中心 (cx, cy) の距離 ≤ r となる x の範囲
+        dy = y + 0.5 - cy[ball]
+        reach = np.sqrt(np.maximum(r[ball] ** 2 - dy * dy, 0.0))
+        left = np.maximum(np.ceil(cx[ball] - 0.5 - reach).astype(np.int64), x0)
+        spans = np.maximum(np.minimum(np.floor(cx[ball] - 0.5 + reach).astype(np.int64), x1 - 1) - left + 1, 0)
+        # 画素はボールの順に並ぶので、同じ画素には後のボールの色が残る
+        rows = np.repeat(y - y0, spans)
+        columns = np.repeat(left - x0, spans) + _ramp(spans)
+        view[rows, columns] = colors[members[np.repeat(ball, spans)]]
+
+    @staticmethod
+    def _touches(inverse, half, outline, x0, y0, x1, y1):
+        """枠線の帯がタイルにかかりうるか（内側の正方形の中か、外側のどれかの辺の外なら描かない）"""
+        corners = inverse.apply([(x0, y0), (x1 - 1, y0), (x0, y1 - 1), (x1 - 1, y1 - 1)])
+        inner, outer = half - outline / 2, half + outline / 2
+        if np.abs(corners).max(axis=1).max() < inner:
+            return False
+        return not (np.any(corners.min(axis=0) > outer) or np.any(corners.max(axis=0) < -outer))
+
+    def render(self, transform, half, positions, colors, radii, outline=3, outline_color=(200, 200, 200)):
+        """1フレームをフレームバッファへ描く（transform はローカル → スクリーンの Affine）"""
+        centers = transform.to_screen(positions) if len(positions) else np.empty((0, 2), dtype=np.int64)
+        radii = np.asarray(radii, dtype=np.float64).reshape(-1).astype(np.int64)  # pygame と同じく切り捨て
+        colors = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+        bins = self.bin(centers, radii)
+        arguments = (centers, radii, colors, transform.inverse(), half, outline, outline_color)
+        if self.pool:
+            # 結果を受け取って、ワーカーでの例外をここで再送出する
+            for _ in self.pool.map(lambda item: self._tile(*item, *arguments), bins.items()):
+                pass
+        else:
+            for item in bins.items():
+                self._tile(*item, *arguments)
+        return self.frame
+
+    def draw(self, screen, transform, half, positions, colors, radii, outline=3, outline_color=(200, 200, 200)):
+        """描いたフレームを pygame の画面へ転送"""
+        import pygame
+
+        self.render(transform, half, positions, colors, radii, outline, outline_color)
+        screen.blit(pygame.image.frombuffer(self.frame, (self.width, self.height), "RGB"), (0, 0))
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown()
+
+
+# ---------------------------
+# ベンチマーク
+# ---------------------------
+def reference(size, transform, half, positions, colors, radii, outline):
+    """比較用: pygame.draw で同じ場面を描いた Surface"""
+    import pygame
+
+    surface = pygame.Surface(size)
+    surface.fill((30, 30, 30))
+    corners = [(-half, -half), (half, -half), (half, half), (-half, half)]
+    pygame.draw.polygon(surface, (200, 200, 200), transform.points(corners), outline)
+    for position, color, radius in zip(transform.to_screen(positions).tolist(), colors, radii):
+        pygame.draw.circle(surface, color, position, radius)
+    return surface
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="タイル描画のスレッド数ごとの1フレームの時間を pygame.draw と比べる")
+    parser.add_argument("--balls", type=int, default=5000, help="ボールの数")
+    parser.add_argument("--radius-range", type=float, nargs=2, default=(2.0, 10.0), metavar=("MIN", "MAX"),
+                        help="ボールの半径の範囲")
+    parser.add_argument("--size", type=int, nargs=2, default=(800, 600), metavar=("W", "H"), help="画面の大きさ")
+    parser.add_argument("--tile-size", type=int, default=DEFAULT_TILE, help="タイルの一辺（ピクセル）")
+    parser.add_argument("--threads", type=int, nargs="+", default=None,
+                        help="比べるスレッド数（既定は 1, 2, 4, … コア数まで）")
+    parser.add_argument("--frames", type=int, default=20, help="計測するフレーム数")
+    parser.add_argument("--seed", type=int, default=12345, help="乱数シード")
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    width, height = args.size
+    half = min(width, height) / 3
+    rng = np.random.default_rng(args.seed)
+    positions = rng.uniform(-half, half, (args.balls, 2))
+    radii = np.exp(rng.uniform(*np.log(args.radius_range), args.balls))
+    colors = rng.integers(50, 256, (args.balls, 3))
+    angles = np.linspace(0, math.pi / 2, args.frames)
+    cores = os.cpu_count() or 1
+    threads = args.threads or sorted({cores, *(1 << i for i in range(cores.bit_length()))})
+    print(f"ボール {args.balls}個, 画面 {width}x{height}, タイル {args.tile_size} px, コア {cores}個")
+
+    try:
+        import pygame
+
+        started = time.perf_counter()
+        for angle in angles:
+            expected = reference((width, height), Affine.rotation(angle, (width // 2, height // 2)), half,
+                                 positions, colors.tolist(), radii.tolist(), 3)
+        base = (time.perf_counter() - started) * 1000 / args.frames
+        expected = pygame.surfarray.array3d(expected).transpose(1, 0, 2)
+        print(f"pygame.draw      : {base:7.1f} ms/フレーム")
+    except ImportError:
+        expected, base = None, None
+
+    # 最初のスレッド数の時間と最後のフレームを基準に、ほかのスレッド数を比べる
+    first_elapsed, first_frame = None, None
+    for count in threads:
+        raster = TileRasterizer((width, height), args.tile_size, count)
+        started = time.perf_counter()
+        for angle in angles:
+            frame = raster.render(Affine.rotation(angle, (width // 2, height // 2)), half, positions, colors, radii)
+        elapsed = (time.perf_counter() - started) * 1000 / args.frames
+        raster.close()
+        if first_frame is None:
+            first_elapsed, first_frame, same = elapsed, frame.copy(), ""
+        else:
+            same = "（1つ目と同じ画素）" if np.array_equal(frame, first_frame) else "（1つ目と画素が違う）"
+        speedup = f", pygame.draw の {base / elapsed:.2f}倍" if base else ""
+        print(f"タイル {count:>2}スレッド: {elapsed:7.1f} ms/フレーム（{threads[0]}スレッドの "
+              f"{first_elapsed / elapsed:.2f}倍{speedup}）{same}")
+    print(f"タイルへ振り分けた組 {raster.binned}（ボール {args.balls}個）")
+    if expected is not None:
+        differ = np.any(first_frame != expected, axis=2).mean()
+        print(f"pygame.draw と色が違う画素: {differ:.2%}（円の縁と枠線の端）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
@@ -0,0 +1,316 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+
+# ---------------------------
+# 軌跡ログ（追記専用・メモリマップ）
+# ---------------------------
+# 毎フレームの状態（フレーム番号・時刻・角度と、全ボールのID・位置・速度）を
+# 事前に確保したメモリマップファイルへ追記する。領域が足りなくなったら
+# 倍々に拡張するので、1フレームあたりの書き込みはメモリへのコピーだけで済む。
+#
+# ファイル構成:
+#   PATH        ヘッダ（64バイト）+ フレームレコードの列
+#   PATH.idx    各フレームレコードの先頭オフセット（uint64 の配列）
+#   PATH.balls  ボールごとの色（JSON Lines、初めて現れたときに1行）。ボールごとに
+#               半径と質量を持つ実装（04）では "radius" と "mass" も書く
+#
+# レコード: frame(u64) time(f64) angle(f64) count(u32) pad(4)
+#           ids(i32 × count) positions(f32 × count × 2) velocities(f32 × count × 2)
+#
+# 書き込み中でも読めるように、レコードとオフセットを書いてから最後に
+# ヘッダのフレーム数を更新する。読み手はヘッダのフレーム数までだけを読む。
+
+MAGIC = b"TRAJLOG\x00"
+VERSION = 1
+HEADER_SIZE = 64
+HEADER = struct.Struct("<8sHH8s4xQQ")  # magic, version, flags, key, frames, data_end
+FRAMES_OFFSET = 24
+DATA_END_OFFSET = 32
+RECORD = struct.Struct("<QddI4x")
+OFFSET = struct.Struct("<Q")
+FLAG_COMPLETE = 1
+INITIAL_BYTES = 1 << 20
+
+
+def add_trajectory_arguments(parser):
+    """--trajectory 引数を追加"""
+    parser.add_argument("--trajectory", metavar="PATH",
+                        help="毎フレームの状態を軌跡ログとして書き出す")
+    return parser
+
+
+class _GrowableMap:
+    """サイズを倍々に拡張できる書き込み用メモリマップ"""
+
+    def __init__(self, path, size):
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        self.size = size
+        os.ftruncate(self.fd, size)
+        self.map = mmap.mmap(self.fd, size)
+
+    def reserve(self, end):
+        """end バイト目まで書けるように領域を確保"""
+        if end <= self.size:
+            return
+        size = self.size
+        while size < end:
+            size *= 2
+        os.ftruncate(self.fd, size)
+        self.map.resize(size)
+        self.size = size
+
+    def close(self, length):
+        """書き込んだ長さに切り詰めて閉じる"""
+        self.map.flush()
+        self.map.close()
+        os.ftruncate(self.fd, length)
+        os.close(self.fd)
+
+
+class TrajectoryWriter:
+    """フレームごとの状態を軌跡ログに追記する"""
+
+    def __init__(self, path, key="", initial_bytes=INITIAL_BYTES):
+        self.path = path
+        self.data = _GrowableMap(path, max(initial_bytes, HEADER_SIZE))
+        self.index = _GrowableMap(path + ".idx", max(initial_bytes // 64, OFFSET.size))
+        self.balls = open(path + ".balls", "w", encoding="utf-8")
+        self.known_ids = set()
+        self.frames = 0
+        self.data_end = HEADER_SIZE
+        self.source = None
+        HEADER.pack_into(self.data.map, 0, MAGIC, VERSION, 0, key.encode("ascii"), 0, self.data_end)
+
+    @classmethod
+    def from_args(cls, args, key="", module=None, **attributes):
+        """--trajectory が指定されていなければ None
+
+        module を渡すと、そのスクリプトの状態（balls などの属性）を共有する
+        Simulationを結びつけ、record() で記録できるようにする。
+        """
+        if not getattr(args, "trajectory", None):
+            return None
+        writer = cls(args.trajectory, key)
+        if module is not None:
+            # implementations はスクリプトの起動時間に効くため、記録するときだけ読み込む
+            from implementations import attach_simulation
+            writer.source = attach_simulation(key, module, **attributes)
+        return writer
+
+    def record(self, frame, time, **attributes):
+        """結びつけたスクリプトの状態を記録（角度など毎フレーム変わる値は引数で渡す）"""
+        for name, value in attributes.items():
+            setattr(self.source, name, value)
+        self.append(frame, time, self.source.state())
+
+    def append(self, frame, time, state):
+        """SimStateを1フレーム分のレコードとして追記"""
+        count = len(state)
+        ids = np.ascontiguousarray(state.ids, dtype="<i4")
+        positions = np.ascontiguousarray(state.positions, dtype="<f4")
+        velocities = np.ascontiguousarray(state.velocities, dtype="<f4")
+        self._record_balls(state)
+
+        start = self.data_end
+        end = start + RECORD.size + count * (4 + 8 + 8)
+        self.data.reserve(end)
+        mm = self.data.map
+        RECORD.pack_into(mm, start, frame, time, state.angle, count)
+        offset = start + RECORD.size
+        for array in (ids, positions, velocities):
+            mm[offset:offset + array.nbytes] = array.tobytes()
+            offset += array.nbytes
+
+        self.index.reserve((self.frames + 1) * OFFSET.size)
+        OFFSET.pack_into(self.index.map, self.frames * OFFSET.size, start)
+
+        # フレーム数の更新が確定点（読み手はこれを見てから読む）
+        self.data_end = end
+        self.frames += 1
+        OFFSET.pack_into(mm, DATA_END_OFFSET, self.data_end)
+        OFFSET.pack_into(mm, FRAMES_OFFSET, self.frames)
+
+    def _record_balls(self, state):
+        new = [i for i, ball_id in enumerate(state.ids.tolist()) if ball_id not in self.known_ids]
+        if not new:
+            return
+        for i in new:
+            ball_id = int(state.ids[i])
+            self.known_ids.add(ball_id)
+            entry = {"id": ball_id, "color": [int(c) for c in state.colors[i]]}
+            if state.radii is not None:
+                entry["radius"] = float(state.radii[i])
+            if state.masses is not None:
+                entry["mass"] = float(state.masses[i])
+            self.balls.write(json.dumps(entry) + "\n")
+        self.balls.flush()
+
+    def close(self):
+        """完了フラグを立て、ファイルを書き込んだ長さに切り詰めて閉じる"""
+        struct.pack_into("<H", self.data.map, 10, FLAG_COMPLETE)
+        self.data.close(self.data_end)
+        self.index.close(self.frames * OFFSET.size)
+        self.balls.close()
+
+
+@dataclass
+class TrajectoryFrame:
+    """軌跡ログの1フレーム"""
+    frame: int
+    time: float
+    angle: float
+    ids: np.ndarray         # (N,) int32
+    positions: np.ndarray   # (N, 2) float32
+    velocities: np.ndarray  # (N, 2) float32
+    radii: np.ndarray = None   # (N,) float64（ログに半径がなければ None）
+    masses: np.ndarray = None  # (N,) float64（ログに質量がなければ None）
+
+
+class TrajectoryReader:
+    """軌跡ログを読む（書き込み中のファイルも読める）"""
+
+    def __init__(self, path):
+        self.path = path
+        self.data_file = open(path, "rb")
+        self.index_file = open(path + ".idx", "rb")
+        self.data = self.index = None
+        self.colors = {}
+        self.radii = {}   # 半径・質量はボールごとに持つ実装のログだけ
+        self.masses = {}
+        self.balls_position = 0
+        self.frames = 0
+        self.complete = False
+
+        magic, version, _, key, _, _ = HEADER.unpack(self.data_file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"軌跡ログではありません: {path}")
+        if version != VERSION:
+            raise ValueError(f"未対応のバージョンです: {version}")
+        self.key = key.rstrip(b"\x00").decode("ascii")
+        self.refresh()
+
+    def _map(self, file, current):
+        size = os.fstat(file.fileno()).st_size
+        if current is not None and len(current) == size:
+            return current
+        if current is not None:
+            current.close()
+        return mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ) if size else None
+
+    def refresh(self):
+        """書き込みが進んだ分を読めるようにし、フレーム数を返す"""
+        # 先にフレーム数を読み、その分のレコードとオフセットだけを使う
+        flags, = struct.unpack("<H", os.pread(self.data_file.fileno(), 2, 10))
+        frames, = OFFSET.unpack(os.pread(self.data_file.fileno(), OFFSET.size, FRAMES_OFFSET))
+        self.data = self._map(self.data_file, self.data)
+        self.index = self._map(self.index_file, self.index)
+        self.frames = frames
+        self.complete = bool(flags & FLAG_COMPLETE)
+        self._read_balls()
+        return frames
+
+    def _read_balls(self):
+        try:
+            with open(self.path + ".balls", "rb") as f:
+                f.seek(self.balls_position)
+                chunk = f.read()
+        except FileNotFoundError:
+            return
+        # 書きかけの最後の行は次回に回す
+        complete = chunk[:chunk.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            entry = json.loads(line)
+            self.colors[entry["id"]] = tuple(entry["color"])
+            if "radius" in entry:
+                self.radii[entry["id"]] = entry["radius"]
+            if "mass" in entry:
+                self.masses[entry["id"]] = entry["mass"]
+        self.balls_position += len(complete)
+
+    def __len__(self):
+        return self.frames
+
+    def offset(self, i):
+        return OFFSET.unpack_from(self.index, i * OFFSET.size)[0]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.frames
+        if not 0 <= i < self.frames:
+            raise IndexError(f"フレーム {i} はありません（{self.frames}フレーム）")
+        start = self.offset(i)
+        frame, time, angle, count = RECORD.unpack_from(self.data, start)
+        offset = start + RECORD.size
+        arrays = []
+        for dtype, width, size in (("<i4", 1, 4), ("<f4", 2, 8), ("<f4", 2, 8)):
+            # スライスでコピーしておけば、読み手が配列を持っていても再マップできる
+            raw = self.data[offset:offset + count * size]
+            arrays.append(np.frombuffer(raw, dtype=dtype).reshape((count, width) if width > 1 else count))
+            offset += count * size
+        ids = arrays[0]
+        return TrajectoryFrame(frame, time, angle, *arrays,
+                               self._per_ball(self.radii, ids), self._per_ball(self.masses, ids))
+
+    @staticmethod
+    def _per_ball(values, ids):
+        """ボールごとの値をIDの順に並べた配列（ログになければ None）"""
+        if not values:
+            return None
+        return np.array([values.get(int(ball_id), np.nan) for ball_id in ids], dtype=np.float64)
+
+    def state(self, i):
+        """i番目のフレームを色つきのSimStateとして返す"""
+        from implementations import SimState
+
+        record = self[i]
+        colors = [self.colors.get(int(ball_id), (255, 255, 255)) for ball_id in record.ids]
+        return SimState(record.angle, record.ids.astype(np.int64),
+                        record.positions.astype(np.float64), record.velocities.astype(np.float64),
+                        np.array(colors, dtype=np.uint8).reshape(-1, 3), record.radii, record.masses)
+
+    def close(self):
+        for mm in (self.data, self.index):
+            if mm is not None:
+                mm.close()
+        self.data_file.close()
+        self.index_file.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="軌跡ログの概要を表示")
+    parser.add_argument("path", help="軌跡ログのパス")
+    parser.add_argument("--frame", type=int, help="表示するフレーム（負の値は末尾から）")
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args([])
+    reader = TrajectoryReader(args.path)
+    try:
+        status = "完了" if reader.complete else "書き込み中"
+        print(f"{args.path}: 実装 {reader.key or '-'}, {len(reader)}フレーム, "
+              f"ボール {len(reader.colors)}個（{status}）")
+        if len(reader):
+            first, last = reader[0], reader[-1]
+            print(f"  時刻 {first.time:.3f}s 〜 {last.time:.3f}s, 最終フレームのボール数 {len(last.ids)}")
+        if args.frame is not None:
+            record = reader[args.frame]
+            print(f"フレーム {record.frame}: 時刻 {record.time:.3f}s, 角度 {record.angle:.4f}rad")
+            for ball_id, position, velocity in zip(record.ids, record.positions, record.velocities):
+                print(f"  {ball_id:>6}  位置 ({position[0]:8.2f}, {position[1]:8.2f})"
+                      f"  速度 ({velocity[0]:8.2f}, {velocity[1]:8.2f})")
+    finally:
+        reader.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
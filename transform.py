@@ -0,0 +1,59 @@
+import math
+
+import numpy as np
+
+# ---------------------------
+# ローカル座標 → スクリーン座標の変換（2x3 のアフィン行列）
+# ---------------------------
+# 4つの実装はどれも「正方形の中心まわりに回転して画面の中心へ平行移動する」
+# 計算を、1点ずつ cos / sin を求めて行っていた。ここではフレームごとに
+# 2x3 の行列
+#
+#   | a  b  tx |      x' = a·x + b·y + tx
+#   | c  d  ty |      y' = c·x + d·y + ty
+#
+# を1度だけ作り、位置の配列をまとめて変換する。衝突判定で使う逆向きの
+# 回転（スクリーン → ローカル）は inverse() で得る。
+
+
+class Affine:
+    """2x3 のアフィン変換"""
+
+    def __init__(self, matrix):
+        self.matrix = np.asarray(matrix, dtype=np.float64).reshape(2, 3)
+        # 1点ずつ変換するとき用に Python の float で持っておく
+        self._coefficients = tuple(self.matrix.ravel().tolist())
+
+    @classmethod
+    def rotation(cls, angle, center=(0.0, 0.0), origin=(0.0, 0.0)):
+        """origin を中心に angle ラジアン回転し、origin を center へ移す変換"""
+        cos_a, sin_a = math.cos(angle), math.sin(angle)
+        ox, oy = origin
+        return cls([[cos_a, -sin_a, center[0] - (cos_a * ox - sin_a * oy)],
+                    [sin_a, cos_a, center[1] - (sin_a * ox + cos_a * oy)]])
+
+    def inverse(self):
+        """逆変換（スクリーン座標 → ローカル座標）"""
+        a, b, tx, c, d, ty = self._coefficients
+        det = a * d - b * c
+        ia, ib, ic, id_ = d / det, -b / det, -c / det, a / det
+        return Affine([[ia, ib, -(ia * tx + ib * ty)],
+                       [ic, id_, -(ic * tx + id_ * ty)]])
+
+    def apply(self, points):
+        """(N, 2) の位置をまとめて変換"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        return points @ self.matrix[:, :2].T + self.matrix[:, 2]
+
+    def to_screen(self, points):
+        """(N, 2) の位置をまとめて変換し、int() と同じく0方向に切り捨てた整数座標にする"""
+        return self.apply(points).astype(np.int64)
+
+    def points(self, points):
+        """変換した位置を (x, y) のタプルのリストで返す（多角形の頂点など）"""
+        return [tuple(p) for p in self.apply(points).tolist()]
+
+    def point(self, x, y):
+        """1点だけ変換（配列を作らない）"""
+        a, b, tx, c, d, ty = self._coefficients
+        return a * x + b * y + tx, c * x + d * y + ty